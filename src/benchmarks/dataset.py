@@ -0,0 +1,247 @@
+"""
+Генератор синтетических данных для бенчмарков и нагрузочных тестов.
+
+В отличие от tests/integration/data_gen.py, который создает сущности по одной через ORM,
+генерирует сразу весь набор с правдоподобными распределениями и грузит его в Postgres через COPY (asyncpg):
+- устройства распределены по категориям из настроек неравномерно - одних касс много, других мало;
+- небольшая часть пользователей берет большую часть устройств;
+- у каждого устройства история завершенных записей: взяли, вернули, иногда перед этим стояли в очереди;
+- часть устройств сейчас занята, часть из них просрочена, за частью стоит очередь.
+Один и тот же seed дает один и тот же набор, миллион записей генерируется и загружается за секунды.
+
+Как запустить (таблицы должны быть созданы, например ботом или бенчмарком с --keep):
+    python -m benchmarks.dataset --resources 50000 --visitors 5000 --history 20 --seed 1
+
+Classes
+--------
+DatasetSpec
+    Размеры и доли для генерации
+Dataset
+    Строки для COPY по таблицам
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import inspect, text
+
+from database.engine import get_engine_async
+from database.orm_repository import resource_state_update
+from domain.models import Base, CATEGORIES
+
+DEVICE_NAMES = ["Касса Атол", "Касса Эвотор", "Сканер Honeywell", "Принтер этикеток", "Весы Масса-К", "Терминал",
+                "Планшет Samsung", "Смартфон Xiaomi", "ФН-1.1", "Касса Меркурий", "Сканер Zebra"]
+FIRST_NAMES = ["Иван", "Петр", "Анна", "Мария", "Олег", "Елена", "Сергей", "Ольга", "Дмитрий", "Наталья"]
+LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков",
+              "Федоров"]
+ADDRESSES = ["Екатеринбург, офис на Малопрудной", "Москва, офис на Электрозаводской", "Удаленно", "Склад",
+             "Тестовый стенд"]
+
+VISITOR_COLUMNS = ["id", "email", "is_admin", "chat_id", "user_id", "full_name", "username", "comment"]
+RESOURCE_COLUMNS = ["id", "name", "category_name", "vendor_code", "reg_date", "firmware", "comment"]
+RECORD_COLUMNS = ["id", "resource_id", "user_email", "address", "enqueue_date", "take_date", "return_date",
+                  "finished", "created_at", "updated_at"]
+
+Row = Tuple[Any, ...]
+
+
+@dataclass
+class DatasetSpec:
+    resources: int = 1000
+    visitors: int = 300
+    history: float = 5
+    # Сколько в среднем завершенных записей у устройства
+    taken_share: float = 0.3
+    overdue_share: float = 0.1
+    queue_share: float = 0.2
+    # Доли: занятых устройств, просроченных среди занятых, занятых с очередью
+    seed: int = 0
+
+
+@dataclass
+class Dataset:
+    visitors: List[Row] = field(default_factory=list)
+    resources: List[Row] = field(default_factory=list)
+    records: List[Row] = field(default_factory=list)
+    free_resource_ids: List[int] = field(default_factory=list)
+
+    def add_visitor(self, email: str, chat_id: Optional[int] = None, is_admin: bool = False,
+                    full_name: Optional[str] = None, username: Optional[str] = None) -> None:
+        """Добавляет пользователя с заданным chat_id - например, чтобы бенчмарк мог писать от его имени"""
+        self.visitors.append((len(self.visitors) + 1, email, is_admin, chat_id, chat_id, full_name, username, None))
+
+
+def skewed_weights(count: int, rnd: random.Random, alpha: float = 1.2) -> List[float]:
+    """Накопительные веса распределения Парето: немногие элементы выбираются намного чаще остальных"""
+    weights = [rnd.paretovariate(alpha) for _ in range(count)]
+    return list(accumulate(weights))
+
+
+def generate(spec: DatasetSpec) -> Dataset:
+    rnd = random.Random(spec.seed)
+    now = datetime.now().replace(microsecond=0)
+    dataset = Dataset()
+    for i in range(1, spec.visitors + 1):
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        dataset.visitors.append(
+            (i, f"user{i}@skbkontur.ru", False, None, None, f"{first} {last}", f"{last.lower()}_{i}", None))
+    emails = [i[1] for i in dataset.visitors]
+    visitor_weights = skewed_weights(len(emails), rnd)
+    category_weights = skewed_weights(len(CATEGORIES), rnd)
+    categories = rnd.choices(CATEGORIES, cum_weights=category_weights, k=spec.resources)
+    record_id = 0
+
+    def record(resource_id: int, email: str, enqueue: Optional[datetime], take: Optional[datetime],
+               return_date: Optional[datetime], finished: bool) -> None:
+        nonlocal record_id
+        record_id += 1
+        created_at = enqueue or take
+        updated_at = return_date if finished else created_at
+        dataset.records.append((record_id, resource_id, email, rnd.choice(ADDRESSES) if take else None,
+                                enqueue, take, return_date, finished, created_at, updated_at))
+
+    for resource_id in range(1, spec.resources + 1):
+        reg_date = now - timedelta(days=rnd.randint(30, 2000))
+        dataset.resources.append((
+            resource_id,
+            f"{rnd.choice(DEVICE_NAMES)} {resource_id}",
+            categories[resource_id - 1],
+            f"SN{spec.seed:03d}{resource_id:09d}",
+            reg_date,
+            f"{rnd.randint(1, 5)}.{rnd.randint(0, 20)}" if rnd.random() < 0.5 else None,
+            None
+        ))
+        # История: идем от сегодняшнего дня назад, цикл за циклом
+        cursor = now - timedelta(days=rnd.randint(1, 30))
+        cycles = int(rnd.expovariate(1 / spec.history)) if spec.history > 0 else 0
+        for email in rnd.choices(emails, cum_weights=visitor_weights, k=cycles):
+            return_date = cursor - timedelta(hours=rnd.randint(1, 240))
+            take = return_date - timedelta(days=rnd.randint(1, 60), hours=rnd.randint(0, 23))
+            enqueue = take - timedelta(days=rnd.randint(1, 14)) if rnd.random() < 0.2 else None
+            record(resource_id, email, enqueue, take, return_date, True)
+            cursor = enqueue or take
+            if cursor < reg_date:
+                break
+        if rnd.random() >= spec.taken_share:
+            dataset.free_resource_ids.append(resource_id)
+            continue
+        holder = rnd.choices(emails, cum_weights=visitor_weights)[0]
+        take = now - timedelta(days=rnd.randint(1, 60))
+        if rnd.random() < spec.overdue_share:
+            return_date = now - timedelta(days=rnd.randint(1, 30))
+        else:
+            return_date = now + timedelta(days=rnd.randint(1, 90))
+        record(resource_id, holder, None, take, return_date, False)
+        if rnd.random() < spec.queue_share:
+            queue = {i for i in rnd.choices(emails, cum_weights=visitor_weights, k=rnd.randint(1, 4))} - {holder}
+            enqueue = take
+            for email in sorted(queue):
+                enqueue += timedelta(hours=rnd.randint(1, 72))
+                record(resource_id, email, enqueue, None, None, False)
+    return dataset
+
+
+async def _copy(connection: Any, table: str, columns: List[str], rows: Sequence[Row]) -> None:
+    await connection.copy_records_to_table(table, records=rows, columns=columns)
+    # Идентификаторы заданы явно - двигаем последовательности, иначе следующий INSERT упадет на дубликате
+    await connection.execute(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST((SELECT max(id) FROM {table}), 1))")
+
+
+async def load(dataset: Dataset) -> None:
+    """Грузит набор через COPY одной транзакцией и считает состояние устройств. Таблицы и категории уже должны быть созданы"""
+    async with get_engine_async().connect() as connection:
+        raw = await connection.get_raw_connection()
+        driver = raw.driver_connection
+        async with driver.transaction():
+            await _copy(driver, "visitor", VISITOR_COLUMNS, dataset.visitors)
+            await _copy(driver, "resource", RESOURCE_COLUMNS, dataset.resources)
+            await _copy(driver, "record", RECORD_COLUMNS, dataset.records)
+        # COPY идет мимо OrmUnitOfWork, поэтому состояние устройств считаем по записям сами
+        await connection.execute(resource_state_update())
+        await connection.commit()
+        await driver.execute("ANALYZE visitor, resource, record")
+
+
+async def prepare_database(dedicated_db: bool) -> List[str]:
+    """
+    Проверяет БД перед прогоном и возвращает таблицы, которых в ней нет - их бенчмарк создаст и потом удалит.
+    Если в таблицах уже есть строки, бенчмарк не запускается: набор пишет фиксированные id, а после прогона
+    таблицы чистятся. С dedicated_db - БД отдана под бенчмарки - существующие строки удаляются
+    """
+    async with get_engine_async().connect() as connection:
+        existing = set(await connection.run_sync(lambda i: inspect(i).get_table_names()))
+        tables = [i.name for i in Base.metadata.sorted_tables if i.name in existing]
+        filled = [i for i in tables if await connection.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {i})"))]
+        if filled and not dedicated_db:
+            raise SystemExit(f"В таблицах {', '.join(filled)} уже есть данные. Запустите бенчмарк на отдельной БД "
+                             f"или укажите --dedicated-db, если ее можно очистить")
+        if filled:
+            await connection.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+            await connection.commit()
+            logging.warning(f"Очищены таблицы {', '.join(filled)}")
+    return [i.name for i in Base.metadata.sorted_tables if i.name not in existing]
+
+
+async def cleanup_database(created: List[str]) -> None:
+    """Удаляет таблицы, созданные бенчмарком, а в остальных - строки, которые он записал"""
+    async with get_engine_async().connect() as connection:
+        tables = [i for i in Base.metadata.sorted_tables if i.name in created]
+        await connection.run_sync(lambda i: Base.metadata.drop_all(i, tables=tables))
+        kept = [i.name for i in Base.metadata.sorted_tables if i.name not in created]
+        if kept:
+            await connection.execute(text(f"TRUNCATE {', '.join(kept)} RESTART IDENTITY CASCADE"))
+        await connection.commit()
+
+
+def add_database_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--dedicated-db", action="store_true",
+                        help="БД отдана под бенчмарки: очистить таблицы, если в них уже есть данные")
+
+
+def spec_from_args(args: argparse.Namespace) -> DatasetSpec:
+    return DatasetSpec(args.resources, args.visitors, args.history, args.taken_share, args.overdue_share,
+                       args.queue_share, args.seed)
+
+
+async def run(args: argparse.Namespace) -> None:
+    spec = spec_from_args(args)
+    started_at = time.perf_counter()
+    dataset = generate(spec)
+    generated_at = time.perf_counter()
+    await load(dataset)
+    logging.info(
+        f"{len(dataset.visitors)} пользователей, {len(dataset.resources)} устройств, {len(dataset.records)} записей: "
+        f"сгенерированы за {generated_at - started_at:.1f} с, загружены за {time.perf_counter() - generated_at:.1f} с")
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser) -> None:
+    """Аргументы размеров набора - общие для генератора и бенчмарков"""
+    parser.add_argument("--resources", type=int, default=DatasetSpec.resources, help="Сколько устройств создать")
+    parser.add_argument("--visitors", type=int, default=DatasetSpec.visitors, help="Сколько пользователей создать")
+    parser.add_argument("--history", type=float, default=DatasetSpec.history,
+                        help="Сколько в среднем завершенных записей у устройства")
+    parser.add_argument("--taken-share", type=float, default=DatasetSpec.taken_share,
+                        help="Какая доля устройств сейчас занята")
+    parser.add_argument("--overdue-share", type=float, default=DatasetSpec.overdue_share,
+                        help="Какая доля занятых просрочена")
+    parser.add_argument("--queue-share", type=float, default=DatasetSpec.queue_share,
+                        help="За какой долей занятых стоит очередь")
+    parser.add_argument("--seed", type=int, default=DatasetSpec.seed)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    )
+    dataset_parser = argparse.ArgumentParser(description="Генерирует синтетические данные и грузит их через COPY")
+    add_spec_arguments(dataset_parser)
+    asyncio.run(run(dataset_parser.parse_args()))
@@ -0,0 +1,266 @@
+"""
+Локальный фейковый Bot API для нагрузочного тестирования.
+
+Отвечает на методы Bot API правдоподобными ответами и считает вызовы.
+Апдейты умеет как отдавать боту через getUpdates (режим поллинга), так и слать на вебхук бота.
+Так пропускную способность бота можно мерить офлайн, без телеграма.
+
+Как запустить:
+1. Бота запустить с TELEGRAM_API_URL=http://localhost:8081 (для вебхука еще USE_POLLING=false,
+   ZOO_WEBHOOK_PATH=http://localhost:8080 и ZOO_WEBHOOK_SECRET)
+2. Запустить сервер и прогнать апдейты:
+   python -m benchmarks.fake_telegram --updates 5000 --webhook http://localhost:8080/webhook --secret <секрет>
+   Без --webhook апдейты отдаются боту через getUpdates.
+
+Пользователи с chat_id из сгенерированных апдейтов должны быть в БД, иначе бот пойдет авторизовывать их в Стафф.
+
+Classes
+--------
+FakeTelegramServer
+    aiohttp-сервер, который притворяется Bot API
+FakeSession
+    Сессия бота, которая отвечает так же, как FakeTelegramServer, но без HTTP - для прогонов внутри процесса
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiohttp import ClientSession, web
+
+DEFAULT_TEXTS = ["/all", "/mine", "/wishlist", "/categories", "/help", "касса", "1"]
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake zoo bot", "username": "fake_zoo_bot"}
+MESSAGE_METHODS = {"sendmessage", "senddocument", "sendsticker", "editmessagetext", "editmessagereplymarkup"}
+
+
+class FakeTelegramServer:
+    """Притворяется Bot API: считает вызовы методов и раздает апдейты из очереди"""
+
+    def __init__(self, host: str = "localhost", port: int = 8081):
+        self.host = host
+        self.port = port
+        self.calls: Counter[str] = Counter()
+        self.last_call_at = time.monotonic()
+        self.updates: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self._handle)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=self.host, port=self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logging.info(f"Фейковый Bot API запущен: {self.base_url}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    def push_updates(self, updates: List[Dict[str, Any]]) -> None:
+        """Кладет апдейты в очередь, которую бот заберет через getUpdates"""
+        for update in updates:
+            self.updates.put_nowait(update)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        payload = dict(await request.post())
+        self.calls[method] += 1
+        self.last_call_at = time.monotonic()
+        return web.json_response({"ok": True, "result": await self.result_for(method, payload)})
+
+    async def result_for(self, method: str, payload: Dict[str, Any]) -> Any:
+        if method == "getme":
+            return BOT_USER
+        if method == "getupdates":
+            return await self._get_updates(int(payload.get("limit", 100)), float(payload.get("timeout", 0)))
+        if method in MESSAGE_METHODS:
+            return self._message(payload)
+        return True
+
+    async def _get_updates(self, limit: int, timeout: float) -> List[Dict[str, Any]]:
+        if self.updates.empty():
+            try:
+                first = await asyncio.wait_for(self.updates.get(), timeout=min(timeout, 1) or 0.01)
+            except asyncio.TimeoutError:
+                return []
+            result = [first]
+        else:
+            result = []
+        while len(result) < limit and not self.updates.empty():
+            result.append(self.updates.get_nowait())
+        return result
+
+    def _message(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        return {
+            "message_id": int(payload.get("message_id", self._message_id)),
+            "date": int(time.time()),
+            "chat": {"id": int(payload.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": str(payload.get("text", "")),
+        }
+
+
+class FakeSession(BaseSession):
+    """
+    Отвечает на запросы бота без сети: параметры метода сериализуются, а ответ разбирается так же,
+    как в AiohttpSession, поэтому бот тратит на Bot API столько же процессора, сколько в проде, но не ждет сеть.
+    Запоминает последнюю инлайн-клавиатуру в каждом чате - по ней сценарии листают страницы
+    """
+
+    def __init__(self, api: Optional[FakeTelegramServer] = None):
+        super().__init__()
+        self.fake_api = api or FakeTelegramServer()
+        self.inline_keyboards: Dict[int, List[List[Dict[str, Any]]]] = dict()
+
+    async def make_request(
+            self,
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+            timeout: Optional[int] = None
+    ) -> TelegramType:
+        payload: Dict[str, Any] = dict()
+        for key, value in method.model_dump(warnings=False).items():
+            value = self.prepare_value(value, bot=bot, files=dict())
+            if value:
+                payload[key] = value
+        name = method.__api_method__.lower()
+        self.fake_api.calls[name] += 1
+        self.fake_api.last_call_at = time.monotonic()
+        self._remember_keyboard(payload)
+        content = json.dumps({"ok": True, "result": await self.fake_api.result_for(name, payload)})
+        return self.check_response(bot, method, 200, content).result  # type: ignore
+
+    def _remember_keyboard(self, payload: Dict[str, Any]) -> None:
+        if "chat_id" not in payload or "reply_markup" not in payload:
+            return
+        markup = json.loads(payload["reply_markup"])
+        if "inline_keyboard" in markup:
+            self.inline_keyboards[int(payload["chat_id"])] = markup["inline_keyboard"]
+
+    async def stream_content(
+            self,
+            url: str,
+            headers: Optional[Dict[str, Any]] = None,
+            timeout: int = 30,
+            chunk_size: int = 65536,
+            raise_for_status: bool = True
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def generate_updates(
+        count: int,
+        chat_ids: List[int],
+        texts: Optional[List[str]] = None,
+        seed: int = 0
+) -> List[Dict[str, Any]]:
+    """Генерирует текстовые апдейты от пользователей с указанными chat_id"""
+    rnd = random.Random(seed)
+    texts = texts or DEFAULT_TEXTS
+    now = int(time.time())
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = rnd.choice(chat_ids)
+        user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}", "username": f"user{chat_id}"}
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": now,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": user,
+                "text": rnd.choice(texts),
+            }
+        })
+    return updates
+
+
+async def replay_to_webhook(
+        updates: List[Dict[str, Any]],
+        webhook_url: str,
+        secret: Optional[str],
+        concurrency: int = 50
+) -> float:
+    """Отправляет апдейты на вебхук бота и возвращает время, за которое бот их все принял"""
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    started = time.monotonic()
+    async with ClientSession() as session:
+        async def send(update: Dict[str, Any]) -> None:
+            async with semaphore:
+                async with session.post(webhook_url, json=update, headers=headers) as response:
+                    if response.status != 200:
+                        logging.warning(f"Вебхук ответил {response.status} на апдейт {update['update_id']}")
+
+        await asyncio.gather(*[send(i) for i in updates])
+    return time.monotonic() - started
+
+
+async def wait_until_quiet(server: FakeTelegramServer, quiet_seconds: float = 2.0) -> None:
+    """Ждет, пока бот не перестанет дергать Bot API - значит, все апдейты обработаны"""
+    while time.monotonic() - server.last_call_at < quiet_seconds:
+        await asyncio.sleep(0.1)
+
+
+async def run(args: argparse.Namespace) -> None:
+    server = FakeTelegramServer(args.host, args.port)
+    await server.start()
+    updates = generate_updates(args.updates, list(range(args.first_chat_id, args.first_chat_id + args.chats)),
+                               seed=args.seed)
+    started = time.monotonic()
+    if args.webhook:
+        ack_time = await replay_to_webhook(updates, args.webhook, args.secret, args.concurrency)
+        logging.info(f"Бот принял {len(updates)} апдейтов за {ack_time:.2f} с")
+    else:
+        server.push_updates(updates)
+        while not server.updates.empty():
+            await asyncio.sleep(0.1)
+    await wait_until_quiet(server, args.quiet)
+    total = server.last_call_at - started
+    logging.info(
+        f"Обработано {len(updates)} апдейтов за {total:.2f} с ({len(updates) / total:.1f} апдейтов/с). "
+        f"Вызовы Bot API: {dict(server.calls)}")
+    await server.stop()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Фейковый Bot API для нагрузочного тестирования")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--updates", type=int, default=1000, help="Сколько апдейтов отправить")
+    parser.add_argument("--chats", type=int, default=100, help="Из скольких чатов")
+    parser.add_argument("--first-chat-id", type=int, default=1)
+    parser.add_argument("--webhook", help="URL вебхука бота. Если не указан - апдейты отдаются через getUpdates")
+    parser.add_argument("--secret", help="Секрет вебхука")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--quiet", type=float, default=2.0, help="Сколько секунд тишины считать концом обработки")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    )
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,310 @@
+"""
+Микробенчмарки горячих мест сервисного слоя и представления.
+
+В дополнение к сквозному benchmarks.throughput меряет отдельные методы на наборах данных разного размера
+(benchmarks.dataset): поиск и списки устройств, действия с записями, устройства и очередь пользователя,
+проверку загружаемой таблицы, пагинатор, format_note и создание ResourceInfoDTO.
+Результаты сравниваются с сохраненным базовым прогоном: если медиана стала хуже больше чем на --tolerance,
+прогон завершается с кодом 1 - замедление видно локально, до деплоя.
+
+Как запустить (для кейсов с БД нужен отдельный Postgres, таблицы создаются и удаляются;
+в БД с данными кейсы не запускаются, если не указать --dedicated-db):
+    python -m benchmarks.micro --sizes 100,1000,10000 --save-baseline   # на коде до изменений
+    python -m benchmarks.micro --sizes 100,1000,10000                   # после - сравнить
+    python -m benchmarks.micro --no-db --only paginator                 # только кейсы без БД
+Базовый прогон зависит от машины, поэтому хранится локально и не коммитится.
+
+Classes
+--------
+Case
+    Один микробенчмарк: подготовка и измеряемая операция
+Fixture
+    Данные, на которых гоняются кейсы одного размера
+Timing
+    Результат измерения одного кейса
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List
+
+import pandas as pd
+
+from benchmarks.dataset import Dataset, DatasetSpec, RECORD_COLUMNS, add_database_argument, cleanup_database, \
+    generate, load, prepare_database
+from domain.converters import convert_resource_to_dto
+from domain.models import ActionType, Resource, Visitor
+from domain.resource_info import ResourceInfoDTO
+from helpers.presentation import format_note
+from helpers.tghelper import Paginator
+from resources.strings import ResourceColumn
+from service.database_service import DatabaseService
+from service.orm_uow import OrmUnitOfWork
+from service.services import RecordService, ResourceService, VisitorService
+from service.table_helper import check_table
+
+DEFAULT_BASELINE = "micro_baseline.json"
+RECORD = {name: i for i, name in enumerate(RECORD_COLUMNS)}
+
+Operation = Callable[[], Any]
+
+
+@dataclass
+class Fixture:
+    size: int
+    dataset: Dataset
+    uow: OrmUnitOfWork = field(default_factory=OrmUnitOfWork)
+
+    @property
+    def resource_service(self) -> ResourceService:
+        return ResourceService(self.uow)
+
+    @property
+    def record_service(self) -> RecordService:
+        return RecordService(self.uow)
+
+    @property
+    def visitor_service(self) -> VisitorService:
+        return VisitorService(self.uow)
+
+    def active_records(self) -> List[tuple]:
+        return [i for i in self.dataset.records if not i[RECORD["finished"]]]
+
+    def busiest_visitor(self, queue: bool = False) -> str:
+        """Почта пользователя, у которого больше всего занятых устройств (или мест в очередях)"""
+        column = "enqueue_date" if queue else "take_date"
+        counter = Counter(i[RECORD["user_email"]] for i in self.active_records() if i[RECORD[column]] is not None)
+        return counter.most_common(1)[0][0]
+
+    def taken_resource(self) -> int:
+        return next(i[RECORD["resource_id"]] for i in self.active_records() if i[RECORD["take_date"]] is not None)
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[Fixture], Awaitable[Operation]]
+    db: bool
+
+
+@dataclass
+class Timing:
+    rounds: int
+    min_ms: float
+    median_ms: float
+
+
+CASES: List[Case] = []
+
+
+def case(name: str, db: bool = False) -> Callable[[Callable[[Fixture], Awaitable[Operation]]], Any]:
+    """Регистрирует кейс. Декорируемая функция готовит данные и возвращает измеряемую операцию"""
+
+    def register(setup: Callable[[Fixture], Awaitable[Operation]]) -> Callable[[Fixture], Awaitable[Operation]]:
+        CASES.append(Case(name, setup, db))
+        return setup
+
+    return register
+
+
+@case("resource_service.search", db=True)
+async def search_case(fixture: Fixture) -> Operation:
+    return lambda: fixture.resource_service.search("касса", 200, fixture.size + 1)
+
+
+@case("resource_service.get_all", db=True)
+async def get_all_case(fixture: Fixture) -> Operation:
+    return lambda: fixture.resource_service.get_all()
+
+
+@case("resource_service.list_by_category_name", db=True)
+async def list_by_category_case(fixture: Fixture) -> Operation:
+    category = Counter(i[2] for i in fixture.dataset.resources).most_common(1)[0][0]
+    return lambda: fixture.resource_service.list_by_category_name(category)
+
+
+@case("record_service.get_available_action", db=True)
+async def get_available_action_case(fixture: Fixture) -> Operation:
+    resource_id, email = fixture.taken_resource(), fixture.busiest_visitor()
+    return lambda: fixture.record_service.get_available_action(resource_id, email)
+
+
+@case("record_service.take_resource+return_resource", db=True)
+async def take_and_return_case(fixture: Fixture) -> Operation:
+    resource_id, email = fixture.dataset.free_resource_ids[0], fixture.busiest_visitor()
+
+    async def take_and_return() -> None:
+        service = fixture.record_service
+        (await service.take_resource(resource_id, email, "склад", datetime.now() + timedelta(days=7))).unwrap()
+        (await service.return_resource(resource_id)).unwrap()
+
+    return take_and_return
+
+
+@case("record_service.get_expiring", db=True)
+async def get_expiring_case(fixture: Fixture) -> Operation:
+    return lambda: fixture.record_service.get_expiring(3)
+
+
+@case("visitor_service.get_taken_resources", db=True)
+async def get_taken_resources_case(fixture: Fixture) -> Operation:
+    visitor = (await fixture.visitor_service.get(fixture.busiest_visitor())).unwrap()
+    return lambda: fixture.visitor_service.get_taken_resources(visitor)
+
+
+@case("visitor_service.get_queue", db=True)
+async def get_queue_case(fixture: Fixture) -> Operation:
+    visitor = (await fixture.visitor_service.get(fixture.busiest_visitor(queue=True))).unwrap()
+    return lambda: fixture.visitor_service.get_queue(visitor)
+
+
+@case("table_helper.check_table")
+async def check_table_case(fixture: Fixture) -> Operation:
+    # Таблицы загружают руками, больше тысячи строк в них не бывает
+    rows = [[i[0], i[1], i[2], i[3], i[4].strftime("%d.%m.%Y"), i[5], None, None, None, None]
+            for i in fixture.dataset.resources[:1000]]
+    df = pd.DataFrame(rows, columns=ResourceColumn.cols())
+    return lambda: check_table(df.copy(), [], [])
+
+
+@case("tghelper.Paginator")
+async def paginator_case(fixture: Fixture) -> Operation:
+    objects = list(range(fixture.size))
+    middle_page = max(math.ceil(fixture.size / 5) // 2, 1)
+
+    def paginate() -> None:
+        paginator = Paginator(middle_page, objects)
+        paginator.get_objects_on_page()
+        paginator.result_message()
+        paginator.create_keyboard("search_resource", "token")
+
+    return paginate
+
+
+@case("presentation.format_note")
+async def format_note_case(fixture: Fixture) -> Operation:
+    dtos = [ResourceInfoDTO(id=i[0], name=i[1], category_name=i[2], vendor_code=i[3], reg_date=i[4])
+            for i in fixture.dataset.resources[:5]]
+    visitor = Visitor(email="admin@skbkontur.ru", is_admin=True)
+    return lambda: [format_note(i, visitor, ActionType.QUEUE) for i in dtos]
+
+
+@case("ResourceInfoDTO construction")
+async def dto_case(fixture: Fixture) -> Operation:
+    resources = [Resource(id=i[0], name=i[1], category_name=i[2], vendor_code=i[3], reg_date=i[4], firmware=i[5])
+                 for i in fixture.dataset.resources]
+    return lambda: [convert_resource_to_dto(i, None) for i in resources]  # type: ignore
+
+
+async def measure(operation: Operation, min_rounds: int = 5, max_rounds: int = 200, budget: float = 1.0) -> Timing:
+    """Прогревает операцию, а потом повторяет, пока не наберется min_rounds и не кончится budget секунд"""
+
+    async def call() -> None:
+        result = operation()
+        if inspect.isawaitable(result):
+            await result
+
+    await call()
+    times: List[float] = []
+    started_at = time.perf_counter()
+    while len(times) < max_rounds and (len(times) < min_rounds or time.perf_counter() - started_at < budget):
+        round_started_at = time.perf_counter()
+        await call()
+        times.append(time.perf_counter() - round_started_at)
+    return Timing(len(times), round(min(times) * 1000, 4), round(statistics.median(times) * 1000, 4))
+
+
+def find_regressions(
+        results: Dict[str, Dict[str, Any]],
+        baseline: Dict[str, Dict[str, Any]],
+        tolerance: float,
+        min_delta_ms: float = 0.05
+) -> List[str]:
+    """Кейсы, медиана которых хуже базовой больше чем на tolerance (и больше чем на min_delta_ms - это шум)"""
+    regressions = []
+    for name, timing in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        now_ms, before_ms = timing["median_ms"], before["median_ms"]
+        if now_ms > before_ms * (1 + tolerance) and now_ms - before_ms > min_delta_ms:
+            regressions.append(f"{name}: {before_ms} -> {now_ms} мс ({(now_ms - before_ms) / before_ms * 100:+.0f}%)")
+    return regressions
+
+
+async def run_size(size: int, cases: List[Case], budget: float, dedicated_db: bool) -> Dict[str, Dict[str, Any]]:
+    dataset = generate(DatasetSpec(resources=size, visitors=max(size // 5, 20), history=3, seed=size))
+    fixture = Fixture(size, dataset)
+    with_db = any(i.db for i in cases)
+    created: List[str] = []
+    if with_db:
+        created = await prepare_database(dedicated_db)
+    results = dict()
+    try:
+        if with_db:
+            await DatabaseService(fixture.uow).init()
+            await load(dataset)
+        for item in cases:
+            timing = await measure(await item.setup(fixture), budget=budget)
+            results[f"{item.name}[{size}]"] = asdict(timing)
+            print(f"{item.name}[{size}]: медиана {timing.median_ms} мс, минимум {timing.min_ms} мс, "
+                  f"{timing.rounds} повторов")
+    finally:
+        if with_db:
+            await cleanup_database(created)
+    return results
+
+
+async def run(args: argparse.Namespace) -> int:
+    cases = [i for i in CASES if (not args.no_db or not i.db) and (not args.only or args.only in i.name)]
+    results: Dict[str, Dict[str, Any]] = dict()
+    for size in [int(i) for i in args.sizes.split(",")]:
+        results.update(await run_size(size, cases, args.budget, args.dedicated_db))
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Базовый прогон сохранен в {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"Нет базового прогона {args.baseline}, сравнивать не с чем. Сохраните его: --save-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = find_regressions(results, json.load(f), args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"Замедление больше {args.tolerance * 100:.0f}%:\n" + "\n".join(regressions))
+        return 1
+    print("Замедлений относительно базового прогона нет")
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Микробенчмарки сервисного слоя")
+    parser.add_argument("--sizes", default="100,1000", help="Размеры наборов (количество устройств) через запятую")
+    parser.add_argument("--only", help="Гонять только кейсы, в названии которых есть эта строка")
+    parser.add_argument("--no-db", action="store_true", help="Только кейсы без БД")
+    add_database_argument(parser)
+    parser.add_argument("--budget", type=float, default=1.0, help="Сколько секунд гонять каждый кейс")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Файл базового прогона")
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результаты как базовый прогон")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое замедление, 0.2 - на 20%%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Замедление меньше этого - шум")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    )
+    sys.exit(asyncio.run(run(parse_args())))
@@ -0,0 +1,362 @@
+"""
+Сквозной бенчмарк пропускной способности бота.
+
+Собирает настоящий диспетчер (main.build_dispatcher - все роутеры и мидлвари, как в start_bot),
+подключает бота к FakeSession вместо Bot API и прогоняет через dp.feed_update сценарии пользователей:
+поиск текстом, /all с листанием страниц, запись устройства через /take и возврат, /mine, админский /users.
+Сценарии одного чата идут по порядку, разные чаты - параллельно, по --concurrency чатов одновременно.
+
+Меряет пропускную способность, p50/p95/p99 и количество SQL-запросов по каждому шагу сценариев,
+пиковое потребление памяти процессом. Результаты сохраняются в JSON, с прошлым прогоном можно сравнить через --baseline.
+
+Как запустить (нужен отдельный Postgres - бенчмарк создает в нем таблицы, заполняет и в конце удаляет;
+в БД с данными не запускается, если не указать --dedicated-db):
+    PG_CONNECTION_STR=postgresql+asyncpg://... python -m benchmarks.throughput --scenarios 2000 --output after.json \
+        --baseline before.json
+
+Classes
+--------
+Step
+    Один апдейт сценария: текст сообщения или нажатие инлайн-кнопки
+Scenario
+    Последовательность шагов одного пользователя
+CommandStats
+    Время и количество SQL-запросов по одному шагу сценариев
+Benchmark
+    Заполняет БД, гоняет сценарии и собирает статистику
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram_calendar import SimpleCalendarCallback
+from aiogram_calendar.schemas import SimpleCalAct
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.dataset import LAST_NAMES, add_database_argument, add_spec_arguments, cleanup_database, \
+    prepare_database, spec_from_args, generate as generate_dataset, load as load_dataset
+from benchmarks.fake_telegram import FakeSession, FakeTelegramServer, BOT_USER
+from configs.config import Settings, RedisConfig
+from helpers.fsmhelper import Buttons
+from helpers.metrics import TelegramRequestMetrics
+from helpers.tghelper import SEPARATOR_FOR_CALLBACK_DATA
+from main import build_dispatcher
+from service.database_service import DatabaseService
+from service.orm_uow import OrmUnitOfWork
+
+USER_CHAT_BASE = 10_000_000
+ADMIN_CHAT_BASE = 20_000_000
+SEARCH_WORDS = ["касса", "атол", "эвотор", "сканер", "принтер", "весы", "терминал", "17", "SN000"]
+DEFAULT_MIX = "search=35,all=20,take=15,mine=20,users=10"
+
+KeyboardPicker = Callable[[List[List[Dict[str, Any]]]], Optional[str]]
+
+
+@dataclass
+class Step:
+    label: str
+    text: Optional[str] = None
+    callback: Optional[KeyboardPicker] = None
+
+
+@dataclass
+class Scenario:
+    name: str
+    steps: List[Step]
+    admin: bool = False
+
+
+@dataclass
+class CommandStats:
+    latencies: List[float] = field(default_factory=list)
+    sql_statements: List[int] = field(default_factory=list)
+    errors: int = 0
+    skipped: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "count": len(latencies),
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean_sql": round(sum(self.sql_statements) / len(self.sql_statements), 2) if self.sql_statements else 0,
+            "max_sql": max(self.sql_statements, default=0),
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга, values должны быть отсортированы"""
+    if not values:
+        return 0.0
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+def page_button(page: int) -> KeyboardPicker:
+    """Выбирает в клавиатуре пагинатора кнопку страницы page"""
+
+    def pick(keyboard: List[List[Dict[str, Any]]]) -> Optional[str]:
+        for row in keyboard:
+            for button in row:
+                data = str(button.get("callback_data", "")).split(SEPARATOR_FOR_CALLBACK_DATA)
+                if len(data) > 1 and data[1] == str(page):
+                    return button["callback_data"]
+        return None
+
+    return pick
+
+
+def calendar_day(day: datetime) -> KeyboardPicker:
+    """Нажатие на день в календаре - клавиатура не нужна, колбэк календаря собирается сам"""
+    data = SimpleCalendarCallback(act=SimpleCalAct.day, year=day.year, month=day.month, day=day.day).pack()
+    return lambda keyboard: data
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {name.strip(): int(weight) for name, weight in (i.split("=") for i in mix.split(","))}
+    unknown = set(weights) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Неизвестные сценарии: {', '.join(unknown)}. Есть: {', '.join(SCENARIOS)}")
+    return weights
+
+
+def search_scenario(rnd: random.Random, free_ids: List[int]) -> Scenario:
+    return Scenario("search", [Step("search", text=rnd.choice(SEARCH_WORDS))])
+
+
+def all_scenario(rnd: random.Random, free_ids: List[int]) -> Scenario:
+    return Scenario("all", [Step("/all", text="/all"), Step("/all page", callback=page_button(rnd.randint(2, 5)))])
+
+
+def take_scenario(rnd: random.Random, free_ids: List[int]) -> Scenario:
+    resource_id = rnd.choice(free_ids)
+    return Scenario("take", [
+        Step("/take", text=f"/take{resource_id}"),
+        Step("take address", text="кабинет 101"),
+        Step("take date", callback=calendar_day(datetime.now() + timedelta(days=10))),
+        Step("take confirm", text=Buttons.CONFIRM),
+        Step("/return", text=f"/return{resource_id}"),
+        Step("return confirm", text=Buttons.CONFIRM),
+    ])
+
+
+def mine_scenario(rnd: random.Random, free_ids: List[int]) -> Scenario:
+    return Scenario("mine", [Step("/mine", text="/mine")])
+
+
+def users_scenario(rnd: random.Random, free_ids: List[int]) -> Scenario:
+    return Scenario("users", [
+        Step("/users", text="/users"),
+        Step("users search", text=rnd.choice(LAST_NAMES).lower()),
+        Step("users page", callback=page_button(2)),
+        Step("/cancel", text="/cancel"),
+    ], admin=True)
+
+
+SCENARIOS: Dict[str, Callable[[random.Random, List[int]], Scenario]] = {
+    "search": search_scenario,
+    "all": all_scenario,
+    "take": take_scenario,
+    "mine": mine_scenario,
+    "users": users_scenario,
+}
+
+_sql_statements: ContextVar[Optional[List[int]]] = ContextVar("benchmark_sql_statements", default=None)
+
+
+def _count_statement(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    counter = _sql_statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.stats: Dict[str, CommandStats] = dict()
+        self.session = FakeSession()
+        self.bot = Bot(token="42:benchmark", session=self.session)
+        # Как в tghelper.create_bot
+        self.bot.session.middleware(TelegramRequestMetrics())
+        self.free_ids: List[int] = []
+        self._update_id = 0
+
+    async def seed(self) -> None:
+        """Создает таблицы и заполняет их синтетическими данными. У каждого воркера свой пользователь и свой админ"""
+        await DatabaseService(OrmUnitOfWork()).init()
+        dataset = generate_dataset(spec_from_args(self.args))
+        for i in range(self.args.concurrency):
+            dataset.add_visitor(f"bench-user{i}@skbkontur.ru", USER_CHAT_BASE + i, False, f"Bench User {i}",
+                                f"bench_user{i}")
+            dataset.add_visitor(f"bench-admin{i}@skbkontur.ru", ADMIN_CHAT_BASE + i, True, f"Bench Admin {i}",
+                                f"bench_admin{i}")
+        await load_dataset(dataset)
+        self.free_ids = dataset.free_resource_ids
+        logging.info(f"БД заполнена: {len(dataset.visitors)} пользователей, {len(dataset.resources)} устройств, "
+                     f"{len(dataset.records)} записей")
+
+    def generate(self) -> List[Scenario]:
+        weights = parse_mix(self.args.mix)
+        names = self.rnd.choices(list(weights), weights=list(weights.values()), k=self.args.scenarios)
+        return [SCENARIOS[name](self.rnd, self.free_ids) for name in names]
+
+    def build_update(self, chat_id: int, step: Step) -> Optional[Dict[str, Any]]:
+        self._update_id += 1
+        user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}", "username": f"user{chat_id}"}
+        chat = {"id": chat_id, "type": "private"}
+        now = int(time.time())
+        if step.text is not None:
+            return {"update_id": self._update_id, "message": {
+                "message_id": self._update_id, "date": now, "chat": chat, "from": user, "text": step.text}}
+        data = step.callback(self.session.inline_keyboards.get(chat_id, [])) if step.callback else None
+        if data is None:
+            return None
+        return {"update_id": self._update_id, "callback_query": {
+            "id": str(self._update_id), "from": user, "chat_instance": str(chat_id), "data": data,
+            "message": {"message_id": self._update_id, "date": now, "chat": chat, "from": BOT_USER, "text": "..."}}}
+
+    async def worker(self, dp: Dispatcher, index: int, queue: "asyncio.Queue[Scenario]") -> None:
+        while not queue.empty():
+            scenario = queue.get_nowait()
+            chat_id = (ADMIN_CHAT_BASE if scenario.admin else USER_CHAT_BASE) + index
+            for step in scenario.steps:
+                stats = self.stats.setdefault(step.label, CommandStats())
+                update = self.build_update(chat_id, step)
+                if update is None:
+                    stats.skipped += 1
+                    break
+                counter = [0]
+                token = _sql_statements.set(counter)
+                started_at = time.perf_counter()
+                try:
+                    await dp.feed_update(self.bot, Update.model_validate(update, context={"bot": self.bot}))
+                except Exception:
+                    stats.errors += 1
+                    logging.exception(f"Ошибка на шаге {step.label}")
+                finally:
+                    stats.latencies.append(time.perf_counter() - started_at)
+                    stats.sql_statements.append(counter[0])
+                    _sql_statements.reset(token)
+
+    async def run(self) -> Dict[str, Any]:
+        settings = Settings()
+        redis_connection_str = RedisConfig().get_connection_str() if settings.use_redis else ""
+        dp = build_dispatcher(settings, redis_connection_str)
+        await dp.emit_startup(bot=self.bot)
+        queue: asyncio.Queue[Scenario] = asyncio.Queue()
+        for scenario in self.generate():
+            queue.put_nowait(scenario)
+        event.listen(Engine, "after_cursor_execute", _count_statement)
+        started_at = time.perf_counter()
+        try:
+            await asyncio.gather(*[self.worker(dp, i, queue) for i in range(self.args.concurrency)])
+        finally:
+            elapsed = time.perf_counter() - started_at
+            event.remove(Engine, "after_cursor_execute", _count_statement)
+            await dp.emit_shutdown(bot=self.bot)
+            await dp.storage.close()
+        updates = sum(len(i.latencies) for i in self.stats.values())
+        return {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "args": vars(self.args),
+            "updates": updates,
+            "seconds": round(elapsed, 3),
+            "throughput": round(updates / elapsed, 2) if elapsed else 0,
+            "errors": sum(i.errors for i in self.stats.values()),
+            # ru_maxrss в линуксе - в килобайтах
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "bot_api_calls": dict(self.session.fake_api.calls),
+            "commands": {label: stats.summary() for label, stats in sorted(self.stats.items())},
+        }
+
+
+def format_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """Таблица по шагам, а если есть прошлый прогон - изменение p50 и p95 относительно него в процентах"""
+
+    def delta(now: float, before: Optional[float]) -> str:
+        if not before:
+            return ""
+        return f" ({(now - before) / before * 100:+.0f}%)"
+
+    base_commands = (baseline or {}).get("commands", {})
+    lines = [
+        f"{result['updates']} апдейтов за {result['seconds']} с: {result['throughput']} апдейтов/с"
+        f"{delta(result['throughput'], (baseline or {}).get('throughput'))}, ошибок {result['errors']}, "
+        f"пик памяти {result['peak_rss_mb']} МиБ",
+        f"{'шаг':<16}{'кол-во':>8}{'p50, мс':>18}{'p95, мс':>18}{'p99, мс':>10}{'SQL':>8}",
+    ]
+    for label, stats in result["commands"].items():
+        before = base_commands.get(label, {})
+        lines.append(
+            f"{label:<16}{stats['count']:>8}"
+            f"{str(stats['p50_ms']) + delta(stats['p50_ms'], before.get('p50_ms')):>18}"
+            f"{str(stats['p95_ms']) + delta(stats['p95_ms'], before.get('p95_ms')):>18}"
+            f"{stats['p99_ms']:>10}{stats['mean_sql']:>8}"
+        )
+    return "\n".join(lines)
+
+
+async def run(args: argparse.Namespace) -> None:
+    # Уведомления другим пользователям бот шлет отдельным экземпляром бота - направляем и его на фейковый Bot API
+    server = FakeTelegramServer(port=0)
+    await server.start()
+    os.environ["TELEGRAM_API_URL"] = server.base_url
+    benchmark = Benchmark(args)
+    try:
+        created = await prepare_database(args.dedicated_db)
+        try:
+            await benchmark.seed()
+            result = await benchmark.run()
+        finally:
+            if not args.keep:
+                await cleanup_database(created)
+    finally:
+        await server.stop()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(result, baseline))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк бота на настоящем диспетчере")
+    parser.add_argument("--scenarios", type=int, default=1000, help="Сколько сценариев прогнать")
+    parser.add_argument("--concurrency", type=int, default=20, help="Сколько чатов работают одновременно")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Веса сценариев, по умолчанию {DEFAULT_MIX}")
+    add_spec_arguments(parser)
+    parser.add_argument("--output", help="Куда сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    add_database_argument(parser)
+    parser.add_argument("--keep", action="store_true", help="Не удалять таблицы и данные после прогона")
+    parser.add_argument("--log-level", default="WARNING", help="INFO - чтобы логирование стоило столько же, сколько в проде")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    benchmark_args = parse_args()
+    logging.basicConfig(
+        level=benchmark_args.log_level,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    )
+    asyncio.run(run(benchmark_args))
@@ -41,7 +41,42 @@ class Settings(BaseSettings):
     # При запуске бота локально указать то, что возвращает print(locale.getlocale())
     staff_client_id: str
     staff_client_secret: str
+    staff_timeout: float = 5.0
+    # Сколько секунд ждать ответа Стаффа, прежде чем повторить запрос
+    staff_cache_ttl: int = 86400
+    staff_negative_cache_ttl: int = 300
+    staff_login_cooldown: int = 10
+    # Сколько секунд помнить найденные и ненайденные в Стаффе ники и как часто один чат может пытаться залогиниться
     secrets_address: Optional[str] = None
+    updates_backlog: int = 1000
+    # Сколько апдейтов может ждать обработки, прежде чем новые начнут отбрасываться
+    use_polling: bool = True
+    telegram_api_url: Optional[str] = None
+    # Адрес Bot API, если он не телеграмовский - например, локальный фейковый сервер для нагрузочных тестов
+    use_update_stream: bool = False
+    update_stream_partitions: int = 8
+    # Если use_update_stream, бот только складывает апдейты в Redis Streams, а обрабатывают их воркеры
+    search_session_ttl: int = 3600
+    # Сколько секунд можно листать страницы результатов поиска
+    metrics_host: str = "0.0.0.0"
+    metrics_port: Optional[int] = None
+    # Если задан metrics_port, метрики в формате Prometheus отдаются на /metrics
+    nplusone_threshold: Optional[int] = None
+    # Для разработки: предупреждать, если за апдейт запрос одной формы выполнился больше стольких раз
+    transaction_guard: Optional[str] = None
+    # Для разработки: log или raise - что делать, если HTTP-запрос уходит, пока у задачи открыта транзакция
+    slow_query_ms: Optional[int] = None
+    slow_query_log_size: int = 200
+    slow_query_explain_rate: float = 0.0
+    # Если задан slow_query_ms, запросы дольше него копятся в буфере (скачивается из /info), у доли из них снимается план
+    archive_after_days: int = 100
+    archive_chunk_size: int = 1000
+    # Завершенные записи старше archive_after_days дней воркер переносит в архив пачками по archive_chunk_size
+    record_partitions_ahead: int = 2
+    # На сколько месяцев вперед воркер создает секции record, если таблица секционирована
+    use_catalog_snapshot: bool = False
+    catalog_refresh_interval: int = 300
+    # Если use_catalog_snapshot, каталог устройств читается из снимка в памяти, а раз в интервал перечитывается целиком
 
     def get_categories(self) -> List[str]:
         return self.categories.split(", ")
@@ -68,6 +103,33 @@ class Settings(BaseSettings):
         return emails
 
 
+class WebhookSettings(BaseSettings):
+    """Настройки для вебкуха (для режима поллинга не нужны)"""
+    model_config = SettingsConfigDict(
+        secrets_dir=SECRETS_ADDRESS,
+        env_file='.env',
+        env_file_encoding='utf-8',
+        extra="allow"
+    )
+
+    zoo_host: str = "0.0.0.0"
+    zoo_port: int = 8080
+    zoo_webhook_path: str
+    # Внешний адрес, по которому телеграм (или балансер перед репликами) достучится до бота
+    zoo_webhook_route: str = "/webhook"
+    zoo_webhook_secret: str
+
+    def get_webhook_url(self) -> str:
+        return f"{self.zoo_webhook_path.rstrip('/')}{self.zoo_webhook_route}"
+
+    @field_validator("zoo_webhook_secret")
+    @classmethod
+    def check_webhook_secret(cls, secret: str) -> str:
+        if not re.search(r"^[A-Za-z0-9_-]{1,256}$", secret):
+            raise ValueError("Секрет вебхука должен состоять из 1-256 символов: A-Z, a-z, 0-9, _ и -")
+        return secret
+
+
 class RedisConfig(BaseSettings):
     model_config = SettingsConfigDict(
         secrets_dir=SECRETS_ADDRESS,
@@ -101,3 +163,9 @@ class PostgresSettings(BaseSettings):
     )
 
     pg_connection_str: str
+    pg_pool_size: int = 5
+    pg_max_overflow: int = 10
+
+    def get_max_connections(self) -> int:
+        """Максимальное количество одновременных соединений из пула"""
+        return self.pg_pool_size + self.pg_max_overflow
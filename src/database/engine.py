@@ -1,19 +1,49 @@
+import asyncio
+from weakref import WeakKeyDictionary
+
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 
 from configs.config import PostgresSettings
 
+# Движок (и его пул соединений) один на event loop: соединения asyncpg нельзя переиспользовать в другом цикле
+_engines: "WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncEngine]" = WeakKeyDictionary()
+# could not serialize access и deadlock detected: транзакцию откатили из-за параллельной, ее можно повторить
+SERIALIZATION_FAILURES = ("40001", "40P01")
 
-def get_engine_async() -> AsyncEngine:
+
+def create_engine_async() -> AsyncEngine:
+    settings = PostgresSettings()
     return create_async_engine(
-        PostgresSettings().pg_connection_str,
+        settings.pg_connection_str,
         isolation_level="REPEATABLE READ",
-        pool_pre_ping=True
+        pool_pre_ping=True,
+        pool_size=settings.pg_pool_size,
+        max_overflow=settings.pg_max_overflow
         # echo=True
     )
 
 
+def get_engine_async() -> AsyncEngine:
+    """Возвращает общий движок для текущего event loop, а вне цикла - новый"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return create_engine_async()
+    engine = _engines.get(loop)
+    if engine is None:
+        engine = create_engine_async()
+        _engines[loop] = engine
+    return engine
+
+
 def get_session_factory() -> async_sessionmaker[AsyncSession]:
     return async_sessionmaker(
         bind=get_engine_async(),
         expire_on_commit=False
     )
+
+
+def is_serialization_failure(error: BaseException) -> bool:
+    """На REPEATABLE READ транзакция падает, если строку, которую она меняет, успела изменить параллельная"""
+    return isinstance(error, DBAPIError) and getattr(error.orig, "pgcode", None) in SERIALIZATION_FAILURES
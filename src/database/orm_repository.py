@@ -1,14 +1,34 @@
 from abc import ABC
 from datetime import datetime as dt, timedelta as td, time as time
-from typing import Optional, List, Tuple
+from typing import Any, Optional, List, Tuple, Iterable, cast
 
-from sqlalchemy import select, delete, or_, text
+from sqlalchemy import select, delete, or_, text, func, Select, and_, exists, tuple_, update, Update, Exists, Table, \
+    CursorResult, literal
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
 
 from database.repository import ResourceRepository, VisitorRepository, RecordRepository, CategoryRepository, \
-    DatabaseRepository
+    DatabaseRepository, StaffRepository, ResourceInfoRepository
+from database.record_partitions import FINISHED_PARTITION, DEFAULT_PARTITION, partition_name, add_months
 from database.repository_helpers import _prepare_filters_for_strings
-from domain.models import Resource, Visitor, Record, Category, Base
+from domain.dashboard_dto import DashboardDTO, QueuedResourceDTO
+from domain.history_dto import HistoryFilter, HistoryRecordDTO, ArchiveStatsDTO
+from domain.models import Resource, Visitor, Record, Category, Base, StaffStatus, StaffSync, ArchivedRecord, \
+    RESOURCE_STATE_FIELDS
+from domain.resource_info import ResourceInfoDTO, VersionedResourceDTO
+
+# __table__ у моделей объявлен как FromClause, а update() и delete() ждут таблицу
+RESOURCE_TABLE = cast(Table, Resource.__table__)
+RESOURCE = Resource.__table__.c
+RECORD_TABLE = cast(Table, Record.__table__)
+VISITOR_TABLE = cast(Table, Visitor.__table__)
+RECORD = Record.__table__.c
+VISITOR = Visitor.__table__.c
+ARCHIVE = ArchivedRecord.__table__.c
+STATE_COLUMNS = list(RESOURCE_STATE_FIELDS)
+ARCHIVED_COLUMNS = ["id", "resource_id", "user_email", "address", "enqueue_date", "take_date", "return_date",
+                    "created_at", "updated_at"]
 
 
 class OrmResourceRepository(ResourceRepository, ABC):
@@ -18,17 +38,6 @@ class OrmResourceRepository(ResourceRepository, ABC):
     async def get(self, resource_id: int) -> Optional[Resource]:
         return await self.session.get(Resource, resource_id)
 
-    async def get_by_vendor_code(self, vendor_code: str) -> Optional[Resource]:
-        objects = await self.session.execute(select(Resource).filter(Resource.vendor_code == vendor_code))
-        resources = objects.scalars().unique().all()
-        return resources[0] if len(resources) != 0 else None
-
-    async def list_by_category_name(self, category_name: str) -> List[Resource]:
-        stmt = select(Resource).filter(Resource.category_name == category_name)
-        await self.session.execute(stmt)
-        result = await self.session.scalars(stmt)
-        return list(result.all())
-
     async def get_queue(self, resource_id: int) -> List[Record]:
         """Возвращает очередь на определенный ресурс"""
         resource = await self.session.get(Resource, resource_id)
@@ -42,24 +51,6 @@ class OrmResourceRepository(ResourceRepository, ABC):
             return None
         return resource.take_record
 
-    async def search_resource(self, search_key: str, limit: int, max_id: int) -> "List[Resource]":
-        """
-        Ищет ресурсы по запросу search_key: если это число меньше max_id - по id,
-        иначе - по другим полям
-        """
-        if search_key.isnumeric() and int(search_key) < max_id:
-            filters = [Resource.id.in_([int(search_key)])]
-        else:
-            filters = _prepare_filters_for_strings(
-                model=Resource,
-                fields=["name", "category_name", "vendor_code"],
-                search_key=search_key
-            )
-        stmt = select(Resource).filter(or_(*filters)).limit(limit)
-        result = await self.session.scalars(stmt)
-        resources = result.all()
-        return list(resources)
-
     def add(self, resource: Resource) -> None:
         self.session.add(resource)
 
@@ -77,13 +68,231 @@ class OrmResourceRepository(ResourceRepository, ABC):
     async def delete_all(self, only_free_resources: bool) -> List[Resource]:
         stmt = select(Resource)
         if only_free_resources:
-            stmt = stmt.filter(Resource.take_record == None)
+            # Удаление решаем по самим записям, а не по колонкам состояния - они лишь их копия
+            stmt = stmt.filter(~_active_take_exists(RESOURCE.id))
         result = await self.session.scalars(stmt)
         resources = result.all()
         for resource in resources:
             await self.session.delete(resource)
         return resources
 
+    async def is_taken(self, resource_id: int) -> bool:
+        """Есть ли у устройства активная запись взятия - по записям, а не по колонкам состояния"""
+        return bool(await self.session.scalar(select(_active_take_exists(resource_id))))
+
+    async def list_category_names(self) -> List[str]:
+        """Категории, в которых есть устройства"""
+        result = await self.session.scalars(select(RESOURCE.category_name).distinct())
+        return list(result)
+
+    async def refresh_state(self, resource_ids: Optional[Iterable[int]] = None) -> int:
+        """Пересчитывает состояние устройств по активным записям. Без resource_ids - всех устройств"""
+        result = cast(CursorResult, await self.session.execute(resource_state_update(resource_ids)))
+        return result.rowcount
+
+    async def find_inconsistent_state(self) -> List[int]:
+        """Устройства, у которых сохраненное состояние расходится с активными записями"""
+        state = _resource_state().subquery("state")
+        stmt = select(RESOURCE.id).join(state, state.c.resource_id == RESOURCE.id).filter(
+            or_(*[RESOURCE[name].is_distinct_from(state.c[name]) for name in STATE_COLUMNS])
+        ).order_by(RESOURCE.id)
+        result = await self.session.scalars(stmt)
+        return list(result)
+
+    async def update_field(self, resource_id: int, field_name: str, value: Any,
+                           expected_updated_at: Optional[dt] = None) -> Optional[VersionedResourceDTO]:
+        """
+        Меняет одно поле одним UPDATE ... RETURNING, не загружая устройство и его записи.
+        С expected_updated_at обновит устройство, только если его с тех пор не меняли, иначе вернет None
+        """
+        stmt = update(RESOURCE_TABLE).filter(RESOURCE.id == resource_id).values({field_name: value})
+        if expected_updated_at is not None:
+            stmt = stmt.filter(RESOURCE.updated_at == expected_updated_at)
+        row = (await self.session.execute(stmt.returning(*_resource_info_columns(), RESOURCE.updated_at))).first()
+        return _versioned(row) if row is not None else None
+
+
+def _active_take_exists(resource_id: Any) -> Exists:
+    """EXISTS активной записи взятия устройства: resource_id - число или колонка для коррелированного подзапроса"""
+    return exists().where(
+        RECORD.resource_id == resource_id,
+        RECORD.take_date.is_not(None),
+        RECORD.finished == False
+    )
+
+
+def _resource_state() -> Select:
+    """Состояние устройств, посчитанное по активным записям: у кого устройство, до какого числа и длина очереди"""
+    res = Resource.__table__.alias("res")
+    take = Record.__table__.alias("take")
+    queue = Record.__table__.alias("queue")
+    queue_length = select(func.count()).select_from(queue).filter(
+        queue.c.resource_id == res.c.id,
+        queue.c.enqueue_date.is_not(None),
+        queue.c.finished == False
+    ).scalar_subquery()
+    return select(
+        res.c.id.label("resource_id"),
+        take.c.user_email.label("holder_email"),
+        take.c.address.label("holder_address"),
+        take.c.take_date,
+        take.c.return_date.label("due_date"),
+        queue_length.label("queue_length")
+    ).select_from(res.outerjoin(take, and_(
+        take.c.resource_id == res.c.id,
+        take.c.take_date.is_not(None),
+        take.c.finished == False
+    )))
+
+
+def resource_state_update(resource_ids: Optional[Iterable[int]] = None) -> Update:
+    """UPDATE resource ... FROM (состояние по записям) - для указанных устройств или для всех"""
+    state_select = _resource_state()
+    if resource_ids is not None:
+        state_select = state_select.filter(state_select.selected_columns.resource_id.in_(list(resource_ids)))
+    state = state_select.subquery("state")
+    return update(RESOURCE_TABLE).where(RESOURCE.id == state.c.resource_id).values(
+        **{name: state.c[name] for name in STATE_COLUMNS},
+        # Смена держателя - не правка карточки, updated_at оставляем как есть
+        updated_at=RESOURCE.updated_at
+    )
+
+
+def _resource_info_columns() -> list:
+    """Устройство и его текущий держатель из колонок состояния - в порядке полей ResourceInfoDTO"""
+    return [
+        RESOURCE.id, RESOURCE.name, RESOURCE.category_name, RESOURCE.vendor_code, RESOURCE.reg_date,
+        RESOURCE.firmware, RESOURCE.comment,
+        RESOURCE.holder_email.label("user_email"), RESOURCE.holder_address.label("address"), RESOURCE.take_date,
+        RESOURCE.due_date.label("return_date")
+    ]
+
+
+def _resource_info_select() -> Select:
+    """Колонки _resource_info_columns, без join с record"""
+    return select(*_resource_info_columns())
+
+
+def _versioned(row: Any) -> VersionedResourceDTO:
+    """DTO из строки с колонками _resource_info_columns и updated_at последней"""
+    return VersionedResourceDTO(resource=ResourceInfoDTO.from_row(row[:-1]), updated_at=row[-1])
+
+
+class OrmResourceInfoRepository(ResourceInfoRepository, ABC):
+    """
+    Списки устройств для показа. Запросы Core: строки сразу превращаются в DTO,
+    без ORM-объектов, identity map и догрузки связей
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def _fetch(self, stmt: Select) -> List[ResourceInfoDTO]:
+        result = await self.session.execute(stmt)
+        return [ResourceInfoDTO.from_row(i) for i in result]
+
+    async def _fetch_one(self, stmt: Select) -> Optional[ResourceInfoDTO]:
+        dtos = await self._fetch(stmt)
+        return dtos[0] if len(dtos) != 0 else None
+
+    async def get(self, resource_id: int) -> Optional[ResourceInfoDTO]:
+        return await self._fetch_one(_resource_info_select().filter(RESOURCE.id == resource_id))
+
+    async def get_versioned(self, resource_id: int) -> Optional[VersionedResourceDTO]:
+        """Устройство вместе с updated_at - с него начинается правка через /edit"""
+        stmt = _resource_info_select().add_columns(RESOURCE.updated_at).filter(RESOURCE.id == resource_id)
+        row = (await self.session.execute(stmt)).first()
+        return _versioned(row) if row is not None else None
+
+    async def get_by_vendor_code(self, vendor_code: str) -> Optional[ResourceInfoDTO]:
+        return await self._fetch_one(_resource_info_select().filter(RESOURCE.vendor_code == vendor_code))
+
+    async def list(self) -> List[ResourceInfoDTO]:
+        return await self._fetch(_resource_info_select())
+
+    async def list_by_category_name(self, category_name: str) -> List[ResourceInfoDTO]:
+        return await self._fetch(_resource_info_select().filter(RESOURCE.category_name == category_name))
+
+    async def list_by_ids(self, resource_ids: List[int]) -> List[ResourceInfoDTO]:
+        """Возвращает устройства в том же порядке, что и resource_ids. Несуществующие id пропускает"""
+        dtos = {i.id: i for i in await self._fetch(_resource_info_select().filter(RESOURCE.id.in_(resource_ids)))}
+        return [dtos[i] for i in resource_ids if i in dtos]
+
+    async def search(self, search_key: str, limit: int, max_id: int) -> List[ResourceInfoDTO]:
+        """
+        Ищет устройства по запросу search_key: если это число меньше max_id - по id,
+        иначе - по другим полям
+        """
+        if search_key.isnumeric() and int(search_key) < max_id:
+            filters = [RESOURCE.id.in_([int(search_key)])]
+        else:
+            filters = _prepare_filters_for_strings(
+                model=RESOURCE,
+                fields=["name", "category_name", "vendor_code"],
+                search_key=search_key
+            )
+        return await self._fetch(_resource_info_select().filter(or_(*filters)).limit(limit))
+
+    async def list_taken(self) -> List[ResourceInfoDTO]:
+        stmt = _resource_info_select()
+        return await self._fetch(stmt.filter(stmt.selected_columns.take_date.is_not(None)))
+
+    async def list_taken_by(self, email: str) -> List[ResourceInfoDTO]:
+        stmt = _resource_info_select()
+        columns = stmt.selected_columns
+        return await self._fetch(stmt.filter(columns.user_email == email).order_by(columns.take_date.asc()))
+
+    async def list_queued_by(self, email: str) -> List[ResourceInfoDTO]:
+        """Устройства, в очереди за которыми стоит пользователь, по времени постановки в очередь"""
+        stmt = _resource_info_select().join(Record.__table__, and_(
+            RECORD.resource_id == RESOURCE.id,
+            RECORD.user_email == email,
+            RECORD.enqueue_date.is_not(None),
+            RECORD.finished == False
+        ))
+        return await self._fetch(stmt.order_by(RECORD.enqueue_date.asc()))
+
+    async def get_dashboard(self, email: str) -> DashboardDTO:
+        """
+        Взятые пользователем устройства и очереди, в которых он стоит, одним запросом.
+        Место в очереди считает оконная функция по всей очереди на устройство
+        """
+        my_queues = select(RECORD.resource_id).filter(
+            RECORD.user_email == email,
+            RECORD.enqueue_date.is_not(None),
+            RECORD.finished == False
+        )
+        queue = select(
+            RECORD.resource_id,
+            RECORD.user_email,
+            RECORD.enqueue_date,
+            func.row_number().over(partition_by=RECORD.resource_id, order_by=RECORD.enqueue_date).label("position"),
+            func.count().over(partition_by=RECORD.resource_id).label("length")
+        ).filter(
+            RECORD.resource_id.in_(my_queues),
+            RECORD.enqueue_date.is_not(None),
+            RECORD.finished == False
+        ).subquery("queue")
+        stmt = _resource_info_select()
+        columns = stmt.selected_columns
+        stmt = stmt.add_columns(queue.c.position, queue.c.length, queue.c.enqueue_date).outerjoin(queue, and_(
+            queue.c.resource_id == RESOURCE.id,
+            queue.c.user_email == email
+        )).filter(or_(columns.user_email == email, queue.c.user_email.is_not(None)))
+        taken, queued = [], []
+        for row in await self.session.execute(stmt):
+            dto = ResourceInfoDTO.from_row(row[:-3])
+            position, length, enqueue_date = row[-3:]
+            if dto.user_email == email:
+                taken.append(dto)
+            if position is not None:
+                queued.append((enqueue_date, QueuedResourceDTO(resource=dto, queue_position=position,
+                                                               queue_length=length)))
+        return DashboardDTO(
+            taken=sorted(taken, key=lambda i: i.take_date),
+            queued=[i for _, i in sorted(queued, key=lambda i: i[0])]
+        )
+
 
 class OrmVisitorRepository(VisitorRepository, ABC):
     def __init__(self, session: AsyncSession):
@@ -92,24 +301,49 @@ class OrmVisitorRepository(VisitorRepository, ABC):
     async def get(self, email: str) -> Optional[Visitor]:
         return await self.session.get(Visitor, email)
 
+    async def exists(self, email: str) -> bool:
+        """Проверка без загрузки пользователя и всех его записей"""
+        return bool(await self.session.scalar(select(exists().where(Visitor.__table__.c.email == email))))
+
     async def get_by_id(self, visitor_id: int) -> Optional[Visitor]:
         objects = await self.session.execute(select(Visitor).filter(Visitor.id == visitor_id))
         visitors = objects.scalars().unique().all()
         return visitors[0] if len(visitors) != 0 else None
 
+    async def update(self, visitor_id: int, values: dict[str, Any]) -> Optional[Visitor]:
+        """
+        Одним UPDATE ... RETURNING по индексу visitor_id_idx. Возвращает пользователя без записей -
+        объект не из сессии, связи у него пустые
+        """
+        stmt = update(VISITOR_TABLE).filter(VISITOR.id == visitor_id).values(values).returning(
+            *Visitor.__table__.columns)
+        row = (await self.session.execute(stmt)).first()
+        return Visitor(**row._mapping) if row is not None else None
+
     async def get_by_chat_id(self, chat_id: int) -> "Optional[Visitor]":
         stmt = select(Visitor).filter_by(chat_id=chat_id)
         result = await self.session.scalars(stmt)
         users = result.all()
         return users[0] if len(users) != 0 else None
 
-    async def get_taken_resources(self, visitor: Visitor) -> List[Resource]:
-        visitor = await self.session.merge(visitor)
-        return [i.resource for i in visitor.take_records]
+    async def list_by_ids(self, visitor_ids: List[int]) -> List[Visitor]:
+        """Возвращает пользователей в том же порядке, что и visitor_ids. Несуществующие id пропускает"""
+        result = await self.session.scalars(select(Visitor).filter(Visitor.id.in_(visitor_ids)))
+        visitors = {i.id: i for i in result.all()}
+        return [visitors[i] for i in visitor_ids if i in visitors]
 
-    async def get_queue(self, visitor: Visitor) -> list[Resource]:
-        visitor = await self.session.merge(visitor)
-        return [i.resource for i in visitor.queue_records]
+    async def list_admins(self) -> List[Visitor]:
+        result = await self.session.scalars(select(Visitor).filter(Visitor.is_admin == True).options(noload("*")))
+        return list(result.all())
+
+    async def list_dismissed(self) -> List[Visitor]:
+        """Возвращает пользователей, которые по данным Стаффа уволены"""
+        stmt = select(Visitor) \
+            .join(StaffStatus, StaffStatus.email == Visitor.email) \
+            .filter(StaffStatus.dismissed == True) \
+            .options(noload("*"))
+        result = await self.session.scalars(stmt)
+        return list(result.all())
 
     async def search(self, search_key: str, limit: int) -> "List[Visitor]":
         filters = list()
@@ -158,6 +392,15 @@ class OrmRecordRepository(RecordRepository, ABC):
         records = [i for i in queue_records if i.user_email == email]
         return records[0] if len(records) != 0 else None
 
+    async def is_in_queue(self, resource_id: int, email: str) -> bool:
+        stmt = select(exists().where(
+            RECORD.resource_id == resource_id,
+            RECORD.user_email == email,
+            RECORD.enqueue_date.is_not(None),
+            RECORD.finished == False
+        ))
+        return bool(await self.session.scalar(stmt))
+
     async def get_expiring(self, expire_after_days: int) -> List[Tuple[Record, int]]:
         """Возвращает записи, по которым пора уведомлять пользователей, и количество дней до просрочки"""
         return_date_to_start_notify = dt.combine(dt.now(), time.max) + td(days=expire_after_days)
@@ -171,13 +414,21 @@ class OrmRecordRepository(RecordRepository, ABC):
     def add(self, record: Record) -> None:
         self.session.add(record)
 
-    async def put(self, record_id: int, address: str, return_date: dt) -> Optional[Record]:
-        record = await self.session.get(Record, record_id)
-        if not record:
-            return None
-        record.return_date = return_date
-        record.address = address
-        return record
+    async def put(self, record_id: int, address: str, return_date: dt) -> Optional[ResourceInfoDTO]:
+        """
+        Меняет адрес и дату возврата одним UPDATE record ... FROM resource ... RETURNING -
+        в ответе сразу устройство с новыми значениями записи. Состояние устройства пересчитает OrmUnitOfWork
+        """
+        stmt = update(RECORD_TABLE).filter(
+            RECORD.id == record_id,
+            RECORD.resource_id == RESOURCE.id
+        ).values(address=address, return_date=return_date).returning(
+            RESOURCE.id, RESOURCE.name, RESOURCE.category_name, RESOURCE.vendor_code, RESOURCE.reg_date,
+            RESOURCE.firmware, RESOURCE.comment, RECORD.user_email, RECORD.address, RECORD.take_date,
+            RECORD.return_date
+        )
+        row = (await self.session.execute(stmt)).first()
+        return ResourceInfoDTO.from_row(row) if row is not None else None
 
     async def list(self) -> List[Record]:
         result = await self.session.scalars(select(Record))
@@ -186,19 +437,112 @@ class OrmRecordRepository(RecordRepository, ABC):
     async def delete(self, record: Record) -> None:
         await self.session.delete(record)
 
-    async def delete_finished(self, max_age: int = 100) -> None:
-        stmt = delete(Record).filter(
-            Record.finished == True,
-            Record.return_date < dt.now() - td(days=max_age)
+    @staticmethod
+    def _history_filters(history_filter: HistoryFilter) -> List[Any]:
+        filters = [RECORD.finished == True]
+        if history_filter.resource_id is not None:
+            filters.append(RECORD.resource_id == history_filter.resource_id)
+        if history_filter.visitor_id is not None:
+            owner = Visitor.__table__.alias("owner")
+            filters.append(RECORD.user_email == select(owner.c.email).filter(
+                owner.c.id == history_filter.visitor_id).scalar_subquery())
+        if history_filter.date_from is not None:
+            filters.append(RECORD.return_date >= history_filter.date_from)
+        if history_filter.date_to is not None:
+            filters.append(RECORD.return_date < history_filter.date_to)
+        return filters
+
+    async def count_history(self, history_filter: HistoryFilter) -> int:
+        stmt = select(func.count()).select_from(Record.__table__).filter(*self._history_filters(history_filter))
+        return int(await self.session.scalar(stmt))
+
+    async def list_history(
+            self,
+            history_filter: HistoryFilter,
+            limit: int,
+            offset: int = 0,
+            after_id: Optional[int] = None
+    ) -> List[HistoryRecordDTO]:
+        """
+        Завершенные записи от новых к старым, только нужные колонки.
+        after_id - последняя запись предыдущей страницы: тогда следующая страница ищется по индексу
+        с (return_date, id) этой записи, и ее цена не зависит от длины истории
+        """
+        stmt = select(
+            RECORD.id.label("record_id"), RECORD.resource_id, RESOURCE.name.label("resource_name"),
+            RESOURCE.vendor_code, RECORD.user_email, VISITOR.username, RECORD.address, RECORD.take_date,
+            RECORD.return_date
+        ).select_from(
+            Record.__table__
+            .join(Resource.__table__, RESOURCE.id == RECORD.resource_id)
+            .outerjoin(Visitor.__table__, VISITOR.email == RECORD.user_email)
+        ).filter(*self._history_filters(history_filter))
+        if after_id is not None:
+            cursor = Record.__table__.alias("cursor")
+            cursor_date = select(cursor.c.return_date).filter(cursor.c.id == after_id).scalar_subquery()
+            stmt = stmt.filter(tuple_(RECORD.return_date, RECORD.id) < tuple_(cursor_date, literal(after_id)))
+        stmt = stmt.order_by(RECORD.return_date.desc(), RECORD.id.desc()).offset(offset).limit(limit)
+        result = await self.session.execute(stmt)
+        return [HistoryRecordDTO.model_validate(dict(i._mapping)) for i in result]
+
+    async def count_archivable(self, before: dt) -> int:
+        stmt = select(func.count()).select_from(Record.__table__).where(
+            RECORD.finished == True,
+            RECORD.return_date < before
         )
-        await self.session.execute(stmt)
-        await self.session.commit()
+        return await self.session.scalar(stmt) or 0
 
-    async def get_all_taken(self) -> Tuple[List[Record], List[Resource]]:
-        query = await self.session.execute(select(Record).filter(Record.take_date != None, Record.finished == False))
-        records = list(query.scalars().unique().all())
-        resources = [i.resource for i in records]
-        return records, resources
+    async def archive_finished(self, before: dt, limit: int) -> int:
+        """
+        Одним запросом переносит в архив до limit завершенных записей, возвращенных раньше before:
+        DELETE ... RETURNING в CTE и INSERT из него. Заблокированные кем-то записи пропускаются до следующей пачки
+        """
+        chunk = select(RECORD.id).where(
+            RECORD.finished == True,
+            RECORD.return_date < before
+        ).order_by(RECORD.return_date, RECORD.id).limit(limit).with_for_update(skip_locked=True)
+        moved = delete(RECORD_TABLE).where(RECORD.id.in_(chunk)).returning(
+            *[RECORD[name] for name in ARCHIVED_COLUMNS]
+        ).cte("moved")
+        stmt = insert(ArchivedRecord).from_select(ARCHIVED_COLUMNS, select(*moved.c))
+        result = cast(CursorResult, await self.session.execute(stmt))
+        return result.rowcount
+
+    async def get_archive_stats(self) -> ArchiveStatsDTO:
+        finished = select(func.count()).select_from(Record.__table__).where(RECORD.finished == True)
+        stmt = select(
+            finished.scalar_subquery().label("finished"),
+            func.count().label("archived"),
+            func.min(ARCHIVE.return_date).label("oldest_archived"),
+            func.max(ARCHIVE.return_date).label("newest_archived")
+        ).select_from(ArchivedRecord.__table__)
+        row = (await self.session.execute(stmt)).one()
+        return ArchiveStatsDTO.model_validate(dict(row._mapping))
+
+
+class OrmStaffRepository(StaffRepository, ABC):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_watermark(self, name: str) -> Optional[dt]:
+        sync = await self.session.get(StaffSync, name)
+        return sync.synced_until if sync else None
+
+    async def set_watermark(self, name: str, synced_until: dt) -> None:
+        stmt = insert(StaffSync).values(name=name, synced_until=synced_until)
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[StaffSync.name],
+            set_={"synced_until": stmt.excluded.synced_until, "updated_at": func.now()}
+        ))
+
+    async def mark_dismissed(self, emails: List[str]) -> None:
+        if not emails:
+            return
+        stmt = insert(StaffStatus).values([{"email": i, "dismissed": True} for i in emails])
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[StaffStatus.email],
+            set_={"dismissed": True, "updated_at": func.now()}
+        ))
 
 
 class OrmCategoryRepository(CategoryRepository, ABC):
@@ -239,3 +583,42 @@ class OrmDatabaseRepository(DatabaseRepository, ABC):
         result = await self.session.scalars(text("select * from alembic_version"))
         revisions = result.all()
         return [str(i) for i in revisions]
+
+    async def is_record_partitioned(self) -> bool:
+        """Секционирование включает миграция, а create_all создает обычную таблицу - например, в тестах"""
+        stmt = text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+                    "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'record')")
+        return bool(await self.session.scalar(stmt))
+
+    async def list_record_partitions(self) -> List[str]:
+        """Секции record_finished, включая секцию по умолчанию"""
+        stmt = text("SELECT c.relname FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "JOIN pg_class p ON p.oid = i.inhparent "
+                    "WHERE p.relname = :parent ORDER BY c.relname")
+        result = await self.session.scalars(stmt, {"parent": FINISHED_PARTITION})
+        return list(result)
+
+    async def create_record_partition(self, month: dt) -> None:
+        """
+        Создает секцию месяца. Записи этого месяца, которые успели попасть в секцию по умолчанию,
+        переносятся в новую секцию до ATTACH - иначе он не пройдет проверку
+        """
+        name, upper = partition_name(month), add_months(month, 1)
+        await self.session.execute(text(
+            f"CREATE TABLE {name} (LIKE {FINISHED_PARTITION} INCLUDING DEFAULTS, PRIMARY KEY (id))"))
+        await self.session.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE return_date >= :lower AND return_date < :upper RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"), {"lower": month, "upper": upper})
+        await self.session.execute(text(
+            f"ALTER TABLE {FINISHED_PARTITION} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"))
+
+    async def drop_record_partition(self, name: str) -> bool:
+        """Отсоединяет и удаляет секцию, если она пустая. Непустую не трогает - ее сначала надо заархивировать"""
+        if await self.session.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})")):
+            return False
+        await self.session.execute(text(f"ALTER TABLE {FINISHED_PARTITION} DETACH PARTITION {name}"))
+        await self.session.execute(text(f"DROP TABLE {name}"))
+        return True
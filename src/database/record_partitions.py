@@ -0,0 +1,58 @@
+"""
+Секционирование таблицы record (миграция migration10_record_partitions).
+
+record секционирована по finished: активные записи (очереди и занятые устройства) лежат в record_active,
+завершенные - в record_finished, которая в свою очередь разбита по месяцам return_date.
+Запросы к активным записям трогают только маленькую record_active, а старый месяц истории
+после архивации удаляется целиком через DETACH PARTITION.
+Секции на следующие месяцы заранее создает воркер - см. DatabaseService.maintain_record_partitions.
+Записи за месяц, для которого секции еще нет, попадают в record_finished_default и переносятся при ее создании.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+ACTIVE_PARTITION = "record_active"
+FINISHED_PARTITION = "record_finished"
+DEFAULT_PARTITION = "record_finished_default"
+MONTH_PREFIX = f"{FINISHED_PARTITION}_y"
+
+
+def month_start(date: datetime) -> datetime:
+    return datetime(date.year, date.month, 1)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    """Имя секции месяца: record_finished_y2024m09"""
+    return f"{MONTH_PREFIX}{month.year:04d}m{month.month:02d}"
+
+
+def parse_partition_name(name: str) -> Optional[datetime]:
+    """Первое число месяца секции или None, если это не секция месяца"""
+    if not name.startswith(MONTH_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(MONTH_PREFIX):], "%Ym%m")
+    except ValueError:
+        return None
+
+
+def months_to_create(now: datetime, ahead: int) -> List[datetime]:
+    """Текущий месяц и ahead следующих - на них секции должны быть всегда"""
+    current = month_start(now)
+    return [add_months(current, i) for i in range(ahead + 1)]
+
+
+def months_to_drop(partitions: List[str], before: datetime) -> List[str]:
+    """Секции месяцев, которые целиком раньше before - после архивации они должны быть пустыми"""
+    result = []
+    for name in partitions:
+        month = parse_partition_name(name)
+        if month is not None and add_months(month, 1) <= before:
+            result.append(name)
+    return sorted(result)
@@ -1,158 +1,282 @@
 from abc import ABC, abstractmethod
 from datetime import datetime as dt
-from typing import List, Optional, Tuple
+from typing import Any, Iterable, List, Optional, Tuple
 
+from domain.dashboard_dto import DashboardDTO
+from domain.history_dto import HistoryFilter, HistoryRecordDTO, ArchiveStatsDTO
 from domain.models import Resource, Visitor, Record, Category
+from domain.resource_info import ResourceInfoDTO, VersionedResourceDTO
 
 
 class ResourceRepository(ABC):
     @abstractmethod
     async def get(self, resource_id: int) -> Optional[Resource]:
-        raise NotImplemented
-
-    @abstractmethod
-    async def get_by_vendor_code(self, vendor_code: str) -> Optional[Resource]:
-        raise NotImplemented
-
-    @abstractmethod
-    async def list_by_category_name(self, category_name: str) -> List[Resource]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def get_queue(self, resource_id: int) -> List[Record]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def get_take(self, resource_id: int) -> Optional[Record]:
-        raise NotImplemented
-
-    @abstractmethod
-    async def search_resource(self, search_key: str, limit: int, max_id: int) -> "List[Resource]":
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     def add(self, resource: Resource) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def list(self) -> List[Resource]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def delete(self, resource_id: int) -> Optional[Resource]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def delete_all(self, only_free_resources: bool) -> List[Resource]:
-        raise NotImplemented
+        raise NotImplementedError
+
+    @abstractmethod
+    async def is_taken(self, resource_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_category_names(self) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def refresh_state(self, resource_ids: Optional[Iterable[int]] = None) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_inconsistent_state(self) -> List[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_field(self, resource_id: int, field_name: str, value: Any,
+                           expected_updated_at: Optional[dt] = None) -> Optional[VersionedResourceDTO]:
+        raise NotImplementedError
+
+
+class ResourceInfoRepository(ABC):
+    """Чтение устройств сразу в ResourceInfoDTO, без ORM-объектов"""
+
+    @abstractmethod
+    async def get(self, resource_id: int) -> Optional[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_versioned(self, resource_id: int) -> Optional[VersionedResourceDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_vendor_code(self, vendor_code: str) -> Optional[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list(self) -> List[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_by_category_name(self, category_name: str) -> List[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_by_ids(self, resource_ids: List[int]) -> List[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search(self, search_key: str, limit: int, max_id: int) -> List[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_taken(self) -> List[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_taken_by(self, email: str) -> List[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_queued_by(self, email: str) -> List[ResourceInfoDTO]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_dashboard(self, email: str) -> DashboardDTO:
+        raise NotImplementedError
 
 
 class VisitorRepository(ABC):
     @abstractmethod
     async def get(self, email: str) -> Optional[Visitor]:
-        raise NotImplemented
+        raise NotImplementedError
+
+    @abstractmethod
+    async def exists(self, email: str) -> bool:
+        raise NotImplementedError
 
     @abstractmethod
     async def get_by_id(self, visitor_id: int) -> Optional[Visitor]:
-        raise NotImplemented
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, visitor_id: int, values: dict[str, Any]) -> Optional[Visitor]:
+        raise NotImplementedError
 
     @abstractmethod
     async def get_by_chat_id(self, chat_id: int) -> "Optional[Visitor]":
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
-    async def get_taken_resources(self, visitor: Visitor) -> List[Resource]:
-        raise NotImplemented
+    async def list_by_ids(self, visitor_ids: List[int]) -> List[Visitor]:
+        raise NotImplementedError
 
     @abstractmethod
-    async def get_queue(self, visitor: Visitor) -> list[Resource]:
-        raise NotImplemented
+    async def list_admins(self) -> List[Visitor]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_dismissed(self) -> List[Visitor]:
+        raise NotImplementedError
 
     @abstractmethod
     async def search(self, search_key: str, limit: int) -> "List[Visitor]":
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     def add(self, visitor: Visitor) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def list(self) -> List[Visitor]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def delete(self, email: str) -> Optional[Visitor]:
-        raise NotImplemented
+        raise NotImplementedError
+
+
+class StaffRepository(ABC):
+    @abstractmethod
+    async def get_watermark(self, name: str) -> Optional[dt]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_watermark(self, name: str, synced_until: dt) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def mark_dismissed(self, emails: List[str]) -> None:
+        raise NotImplementedError
 
 
 class RecordRepository(ABC):
     @abstractmethod
     async def get(self, record_id: int) -> Optional[Record]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def get_take_record(self, resource_id: int, email: str) -> Optional[Record]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def get_queue_record(self, resource_id: int, email: str) -> Optional[Record]:
-        raise NotImplemented
+        raise NotImplementedError
+
+    @abstractmethod
+    async def is_in_queue(self, resource_id: int, email: str) -> bool:
+        raise NotImplementedError
 
     @abstractmethod
     async def get_expiring(self, expire_after_days: int) -> List[Tuple[Record, int]]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     def add(self, record: Record) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
-    async def put(self, record_id: int, address: str, return_date: dt) -> Optional[Record]:
-        raise NotImplemented
+    async def put(self, record_id: int, address: str, return_date: dt) -> Optional[ResourceInfoDTO]:
+        raise NotImplementedError
 
     @abstractmethod
     async def list(self) -> List[Record]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def delete(self, record: Record) -> None:
-        raise NotImplemented
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_archivable(self, before: dt) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def archive_finished(self, before: dt, limit: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_archive_stats(self) -> ArchiveStatsDTO:
+        raise NotImplementedError
 
     @abstractmethod
-    async def delete_finished(self, max_age: int = 100) -> None:
-        raise NotImplemented
+    async def count_history(self, history_filter: HistoryFilter) -> int:
+        raise NotImplementedError
 
     @abstractmethod
-    async def get_all_taken(self) -> Tuple[List[Record], List[Resource]]:
-        raise NotImplemented
+    async def list_history(
+            self,
+            history_filter: HistoryFilter,
+            limit: int,
+            offset: int = 0,
+            after_id: Optional[int] = None
+    ) -> List[HistoryRecordDTO]:
+        raise NotImplementedError
 
 
 class CategoryRepository(ABC):
     @abstractmethod
     async def get(self, name: str) -> Optional[Category]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     def add(self, category: Category) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def list(self) -> List[Category]:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def delete(self, category_name: str) -> Optional[Category]:
-        raise NotImplemented
+        raise NotImplementedError
 
 
 class DatabaseRepository(ABC):
     @abstractmethod
     async def drop(self) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def start(self) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def get_revisions(self) -> List[str]:
-        raise NotImplemented
+        raise NotImplementedError
+
+    @abstractmethod
+    async def is_record_partitioned(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_record_partitions(self) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_record_partition(self, month: dt) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def drop_record_partition(self, name: str) -> bool:
+        raise NotImplementedError
@@ -1,10 +1,10 @@
-from sqlalchemy.sql.operators import ilike_op
+from typing import Any
 
-from domain.models import Base
+from sqlalchemy.sql.operators import ilike_op
 
 
-def _prepare_filters_for_strings(model: Base, fields: list[str], search_key: str) -> list:
-    """Готовит фильтры для поиска по тексту"""
+def _prepare_filters_for_strings(model: Any, fields: list[str], search_key: str) -> list:
+    """Готовит фильтры для поиска по тексту. model - модель или колонки таблицы (Resource.__table__.c)"""
     search_filter = list()
     for field in fields:
         atr = getattr(model, field)
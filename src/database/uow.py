@@ -1,44 +1,53 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Iterable
 
 from database.repository import ResourceRepository, VisitorRepository, RecordRepository, CategoryRepository, \
-    DatabaseRepository
+    DatabaseRepository, StaffRepository, ResourceInfoRepository
 
 
 class UnitOfWork(ABC):
 
     async def __aenter__(self) -> 'UnitOfWork':
-        raise NotImplemented
+        raise NotImplementedError
 
     async def __aexit__(self, *args) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def commit(self) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def rollback(self) -> None:
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     async def merge(self, object: Any) -> Any:
-        raise NotImplemented
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_changed(self, resource_ids: Iterable[int], records: bool = False) -> None:
+        raise NotImplementedError
 
     @property
     @abstractmethod
     def resources(self) -> ResourceRepository:
-        raise NotImplemented
+        raise NotImplementedError
 
     @resources.setter
     @abstractmethod
     def resources(self, resources: ResourceRepository) -> None:
         pass
 
+    @property
+    @abstractmethod
+    def resource_infos(self) -> ResourceInfoRepository:
+        raise NotImplementedError
+
     @property
     @abstractmethod
     def visitors(self) -> VisitorRepository:
-        raise NotImplemented
+        raise NotImplementedError
 
     @visitors.setter
     @abstractmethod
@@ -48,7 +57,7 @@ class UnitOfWork(ABC):
     @property
     @abstractmethod
     def records(self) -> RecordRepository:
-        raise NotImplemented
+        raise NotImplementedError
 
     @records.setter
     @abstractmethod
@@ -58,17 +67,22 @@ class UnitOfWork(ABC):
     @property
     @abstractmethod
     def categories(self) -> CategoryRepository:
-        raise NotImplemented
+        raise NotImplementedError
 
     @categories.setter
     @abstractmethod
     def categories(self, categories: CategoryRepository) -> None:
         pass
 
+    @property
+    @abstractmethod
+    def staff(self) -> StaffRepository:
+        raise NotImplementedError
+
     @property
     @abstractmethod
     def database(self) -> DatabaseRepository:
-        raise NotImplemented
+        raise NotImplementedError
 
     @database.setter
     @abstractmethod
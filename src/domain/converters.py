@@ -5,7 +5,7 @@ from domain.resource_info import ResourceInfoDTO
 
 
 def convert_resource_to_dto(resource: Resource, take_record: Record) -> ResourceInfoDTO:
-    return ResourceInfoDTO(
+    return ResourceInfoDTO.trusted(
         id=resource.id,
         name=resource.name,
         category_name=resource.category_name,
@@ -0,0 +1,27 @@
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from domain.models import ActionType
+from domain.resource_info import ResourceInfoDTO
+
+
+class QueuedResourceDTO(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
+    resource: ResourceInfoDTO
+    queue_position: int
+    queue_length: int
+
+    @property
+    def available_action(self) -> ActionType:
+        # Очередь на свободное устройство - парадокс, но взять его в таком случае можно
+        return ActionType.TAKE if self.resource.user_email is None else ActionType.LEAVE
+
+
+class DashboardDTO(BaseModel):
+    """Устройства пользователя и его очереди - все, что нужно для /mine и /wishlist"""
+    model_config = ConfigDict(extra='ignore')
+
+    taken: List[ResourceInfoDTO] = Field(default_factory=list)
+    queued: List[QueuedResourceDTO] = Field(default_factory=list)
@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, List
+
+from pydantic import BaseModel, ConfigDict
+
+
+@dataclass
+class HistoryFilter:
+    """Чья история и за какой период. return_date попадает в [date_from, date_to)"""
+    resource_id: Optional[int] = None
+    visitor_id: Optional[int] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+
+
+class HistoryRecordDTO(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
+    record_id: int
+    resource_id: int
+    resource_name: str
+    vendor_code: str
+    user_email: str
+    username: Optional[str] = None
+    address: Optional[str] = None
+    take_date: Optional[datetime] = None
+    return_date: Optional[datetime] = None
+
+
+class HistoryPageDTO(BaseModel):
+    """Страница истории: записи от новых к старым и сколько их всего с учетом фильтра"""
+    model_config = ConfigDict(extra='ignore')
+
+    records: List[HistoryRecordDTO]
+    total: int
+    page: int
+
+
+class ArchiveStatsDTO(BaseModel):
+    """Сколько завершенных записей в рабочей таблице record и сколько уже в архиве"""
+    model_config = ConfigDict(extra='ignore')
+
+    finished: int
+    archived: int
+    oldest_archived: Optional[datetime] = None
+    newest_archived: Optional[datetime] = None
+
+
+class ArchiveReportDTO(BaseModel):
+    """Итог прогона архивации: что переносили, сколько перенесли и сколько осталось"""
+    model_config = ConfigDict(extra='ignore')
+
+    before: datetime
+    moved: int
+    chunks: int
+    left: int
+    seconds: float
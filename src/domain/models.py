@@ -14,12 +14,18 @@ Action
     Модель на основе енама ActionType
 Record
     Модель записи ресурса на пользователя. Больше всего нужна для очередей.
+ArchivedRecord
+    Завершенная запись, перенесенная из record в архив
 Visitor
     Модель пользователя, "посетителя" библиотеки
 Category
     Категория ресурсов. В случае нашего бота список категорий известен заранее
 Resource
     Основная модель, которая описывает единицу нашей библиотеки
+StaffStatus
+    Локальная копия статуса сотрудника из Стаффа - чтобы искать уволенных пользователей запросом в БД
+StaffSync
+    Водяной знак синхронизации со Стаффом: с какого момента запрашивать изменения в следующий раз
 """
 
 from datetime import datetime
@@ -28,7 +34,7 @@ from io import StringIO
 from typing import Optional, Any
 
 import sqlalchemy
-from sqlalchemy import ForeignKey, MetaData, BigInteger
+from sqlalchemy import ForeignKey, MetaData, BigInteger, Index
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.sql import func, expression
@@ -87,8 +93,20 @@ class ActionType(StrEnum):
 
 
 class Record(Base):
-    """Модель записи ресурса на пользователя"""
+    """
+    Модель записи ресурса на пользователя.
+    После миграции migration10 таблица секционирована по finished и месяцу return_date - см. database/record_partitions.py.
+    Модель описывает обычную таблицу, поэтому init() (create_all) создает record без секций.
+    В секционированной record первичный ключ - у каждой секции, уникальность id держит последовательность
+    """
     __tablename__ = "record"
+    __table_args__ = (
+        # История устройства и пользователя листается по (return_date, id) - см. OrmRecordRepository.list_history
+        Index("record_resource_history_idx", "resource_id", "return_date", "id",
+              postgresql_where=sqlalchemy.text("finished")),
+        Index("record_user_history_idx", "user_email", "return_date", "id",
+              postgresql_where=sqlalchemy.text("finished")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     resource_id: Mapped[int] = mapped_column(ForeignKey("resource.id", onupdate="cascade", ondelete="cascade"))
@@ -132,11 +150,41 @@ class Record(Base):
                f"с ресурсом {self.resource}"
 
 
+class ArchivedRecord(Base):
+    """
+    Завершенная запись в архиве - см. RecordService.archive_finished_records.
+    Внешних ключей нет: история нужна для аудита и после удаления устройства или пользователя
+    """
+    __tablename__ = "record_archive"
+    __table_args__ = (
+        Index("record_archive_resource_idx", "resource_id", "return_date"),
+        Index("record_archive_user_idx", "user_email", "return_date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    resource_id: Mapped[int] = mapped_column()
+    user_email: Mapped[str] = mapped_column()
+    address: Mapped[Optional[str]] = mapped_column()
+    enqueue_date: Mapped[Optional[datetime]] = mapped_column()
+    take_date: Mapped[Optional[datetime]] = mapped_column()
+    return_date: Mapped[Optional[datetime]] = mapped_column()
+    created_at: Mapped[Optional[datetime]] = mapped_column()
+    updated_at: Mapped[Optional[datetime]] = mapped_column()
+    archived_at: Mapped[datetime] = mapped_column(server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"ArchivedRecord(id={self.id}, " \
+               f"resource_id={self.resource_id}, " \
+               f"user_email={self.user_email}, " \
+               f"return_date={self.return_date}, " \
+               f"archived_at={self.archived_at})"
+
+
 class Visitor(Base):
     """Модель 'посетителя' библиотеки ресурсов"""
     __tablename__ = "visitor"
 
-    id: Mapped[int] = mapped_column(sqlalchemy.Identity(start=1, increment=1))
+    id: Mapped[int] = mapped_column(sqlalchemy.Identity(start=1, increment=1), index=True)
     email: Mapped[str] = mapped_column(primary_key=True)
     is_admin: Mapped[bool] = mapped_column(default=False)
     chat_id: Mapped[Optional[int]] = mapped_column(BigInteger)
@@ -148,15 +196,16 @@ class Visitor(Base):
     updated_at: Mapped[Optional[datetime]] = mapped_column(server_default=func.now(), onupdate=func.now())
     records = relationship(
         "Record",
-        back_populates="visitor",
         lazy="selectin",
+        primaryjoin="and_(Visitor.email == Record.user_email, Record.finished == False)",
+        back_populates="visitor"
     )
     take_records = relationship(
         "Record",
         lazy="selectin",
         primaryjoin="and_(Visitor.email == Record.user_email, Record.take_date != None, Record.finished == False)",
         order_by="Record.take_date.asc()",
-        overlaps="records, queue_records, finished_records",
+        overlaps="records, queue_records",
         viewonly=True
     )
     queue_records = relationship(
@@ -164,16 +213,7 @@ class Visitor(Base):
         lazy="selectin",
         primaryjoin="and_(Visitor.email == Record.user_email, Record.enqueue_date != None, Record.finished == False)",
         order_by="Record.enqueue_date.asc()",
-        overlaps="records, take_records, finished_records",
-        viewonly=True
-    )
-    finished_records = relationship(
-        "Record",
-        uselist=True,
-        lazy="selectin",
-        primaryjoin="and_(Visitor.email == Record.user_email, Record.finished == True)",
-        order_by="Record.return_date.desc()",
-        overlaps="records, take_records, queue_records",
+        overlaps="records, take_records",
         viewonly=True
     )
 
@@ -219,6 +259,10 @@ class Category(Base):
         return f"Категория {self.name}"
 
 
+# Колонки состояния Resource - их считает по записям сервис, а не правит админ
+RESOURCE_STATE_FIELDS = ("holder_email", "holder_address", "take_date", "due_date", "queue_length")
+
+
 class Resource(Base):
     """Модель ресурса - в нашем случае устройства"""
     __tablename__ = "resource"
@@ -230,6 +274,14 @@ class Resource(Base):
     reg_date: Mapped[Optional[datetime]] = mapped_column()
     firmware: Mapped[Optional[str]] = mapped_column()
     comment: Mapped[Optional[str]] = mapped_column()
+    # Текущее состояние - копия активных записей, чтобы для показа не ходить в record.
+    # Пересчитывается в той же транзакции, что меняет записи (см. OrmUnitOfWork), сверяется воркером
+    holder_email: Mapped[Optional[str]] = mapped_column(
+        ForeignKey("visitor.email", onupdate="cascade", ondelete="set null"))
+    holder_address: Mapped[Optional[str]] = mapped_column()
+    take_date: Mapped[Optional[datetime]] = mapped_column()
+    due_date: Mapped[Optional[datetime]] = mapped_column()
+    queue_length: Mapped[int] = mapped_column(default=0, server_default="0")
     records = relationship(
         "Record",
         uselist=True,
@@ -243,7 +295,7 @@ class Resource(Base):
         primaryjoin="and_(Resource.id == Record.resource_id, Record.enqueue_date != None, Record.finished == False)",
         order_by="Record.enqueue_date.asc()",
         uselist=True,
-        overlaps="finished_records, take_record, records",
+        overlaps="take_record, records",
         viewonly=True
     )
     take_record = relationship(
@@ -251,16 +303,7 @@ class Resource(Base):
         lazy="selectin",
         primaryjoin="and_(Resource.id == Record.resource_id, Record.take_date != None, Record.finished == False)",
         uselist=False,
-        overlaps="finished_records, queue_records, records",
-        viewonly=True
-    )
-    finished_records = relationship(
-        "Record",
-        uselist=True,
-        lazy="selectin",
-        primaryjoin="and_(Resource.id == Record.resource_id, Record.finished == True)",
-        order_by="Record.return_date.desc()",
-        overlaps="take_record, queue_records, records",
+        overlaps="queue_records, records",
         viewonly=True
     )
     created_at: Mapped[Optional[datetime]] = mapped_column(server_default=func.now())
@@ -290,3 +333,34 @@ class Resource(Base):
 
     def short_str(self) -> str:
         return f"{self.name} с id {self.id} и артикулом {self.vendor_code}"
+
+    @classmethod
+    def get_editable_fields_names(cls) -> list[str]:
+        """Поля, которые можно править через /edit: без id, дат создания и правки и колонок состояния"""
+        service_fields = {"id", "created_at", "updated_at", *RESOURCE_STATE_FIELDS}
+        return [i for i in cls.get_fields_names() if i not in service_fields]
+
+
+class StaffStatus(Base):
+    """Статус сотрудника из Стаффа"""
+    __tablename__ = "staff_status"
+
+    email: Mapped[str] = mapped_column(primary_key=True)
+    dismissed: Mapped[bool] = mapped_column(server_default=expression.false())
+    created_at: Mapped[Optional[datetime]] = mapped_column(server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return f"StaffStatus(email={self.email}, dismissed={self.dismissed}, updated_at={self.updated_at})"
+
+
+class StaffSync(Base):
+    """Водяной знак синхронизации со Стаффом"""
+    __tablename__ = "staff_sync"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    synced_until: Mapped[datetime] = mapped_column()
+    updated_at: Mapped[Optional[datetime]] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return f"StaffSync(name={self.name}, synced_until={self.synced_until})"
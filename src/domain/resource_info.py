@@ -1,9 +1,11 @@
 import re
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Any
 
 from pydantic import BaseModel, field_validator, ConfigDict
 
+_object_setattr = object.__setattr__
+
 
 class ResourceInfoDTO(BaseModel):
     model_config = ConfigDict(extra='ignore')
@@ -20,6 +22,49 @@ class ResourceInfoDTO(BaseModel):
     take_date: Optional[datetime] = None
     return_date: Optional[datetime] = None
 
+    @classmethod
+    def trusted(
+            cls,
+            id: int,
+            name: str,
+            category_name: str,
+            vendor_code: str,
+            reg_date: Optional[datetime] = None,
+            firmware: Optional[str] = None,
+            comment: Optional[str] = None,
+            user_email: Optional[str] = None,
+            address: Optional[str] = None,
+            take_date: Optional[datetime] = None,
+            return_date: Optional[datetime] = None
+    ) -> 'ResourceInfoDTO':
+        """
+        Создает DTO без валидации - в разы быстрее конструктора. Только для данных из БД, которые проверили при записи.
+        Все, что ввел пользователь (таблица, добавление и редактирование), идет через обычный конструктор
+        """
+        dto = cls.__new__(cls)
+        _object_setattr(dto, "__dict__", {
+            "id": id,
+            "name": name,
+            "category_name": category_name,
+            "vendor_code": vendor_code,
+            "reg_date": reg_date,
+            "firmware": firmware,
+            "comment": comment,
+            "user_email": user_email,
+            "address": address,
+            "take_date": take_date,
+            "return_date": return_date
+        })
+        _object_setattr(dto, "__pydantic_fields_set__", set(_FIELDS))
+        _object_setattr(dto, "__pydantic_extra__", None)
+        _object_setattr(dto, "__pydantic_private__", None)
+        return dto
+
+    @classmethod
+    def from_row(cls, row: Any) -> 'ResourceInfoDTO':
+        """DTO из строки запроса, колонки которой идут в порядке полей"""
+        return cls.trusted(*row)
+
     def short_str(self) -> str:
         return f"{self.name} с id {self.id} и артикулом {self.vendor_code}"
 
@@ -87,3 +132,12 @@ class ResourceInfoDTO(BaseModel):
         if not isinstance(other, ResourceInfoDTO):
             return False
         return other.id == self.id
+
+
+_FIELDS = frozenset(ResourceInfoDTO.model_fields)
+
+
+class VersionedResourceDTO(BaseModel):
+    """Устройство и его updated_at - по нему правка через /edit узнает, что устройство успели изменить"""
+    resource: ResourceInfoDTO
+    updated_at: Optional[datetime] = None
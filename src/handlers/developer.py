@@ -10,7 +10,7 @@ from datetime import datetime
 from io import StringIO, BytesIO
 from typing import Optional, List
 
-from aiogram import Router, F
+from aiogram import Bot, Router, F
 from aiogram.filters import Command, StateFilter
 from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
@@ -26,6 +26,8 @@ from domain.resource_info import ResourceInfoDTO
 from helpers import tghelper as tg
 from helpers.fsmhelper import CANCEL_KEYBOARD, fill_date_from_calendar
 from helpers.presentation import format_note
+from helpers.profiling import CPU_PROFILER, MEMORY_PROFILER, parse_profiling_limit
+from helpers.slow_queries import SLOW_QUERIES
 from helpers.tghelper import Paginator, SEPARATOR_FOR_CALLBACK_DATA, start_calendar, nameof
 from middlewares.authorize_middleware import Authorize
 from resources import strings
@@ -43,6 +45,9 @@ class InfoFSM(StatesGroup):
     confirm_delete_free_devices = State()
     confirm_delete_db = State()
     confirm_get_revisions = State()
+    confirm_cpu_profile = State()
+    cpu_profile_limit = State()
+    confirm_memory_snapshot = State()
 
 
 router = Router()
@@ -78,6 +83,11 @@ def get_options_keyboard() -> ReplyKeyboardMarkup:
         "Удалить незанятые",
         "Удалить базу",
         "Потестить календарь",
+        "Медленные запросы",
+        "Архив записей",
+        "Профилировать CPU",
+        "Снимок памяти",
+        "Выключить профилирование",
         "Выйти"
     ]
     return tg.get_reply_keyboard(buttons)
@@ -160,6 +170,39 @@ async def choosing_handler(
             text=strings.password_required_msg,
             reply_markup=CANCEL_KEYBOARD
         )
+    elif text == "Медленные запросы":
+        if Settings().slow_query_ms is None:
+            await message.answer("Журнал медленных запросов выключен: задайте SLOW_QUERY_MS")
+            return
+        report = SLOW_QUERIES.render().encode("utf-8")
+        input_file = BufferedInputFile(report, f"slow-queries-{datetime.now().strftime('%d-%m-%Y-%H-%M-%S')}.txt")
+        await message.reply_document(input_file)
+        logging.warning(f"Пользователь {repr(visitor)} скачал журнал медленных запросов")
+    elif text == "Архив записей":
+        stats = (await record_service.get_archive_stats()).unwrap()
+        await message.answer(strings.archive_stats_msg(stats, Settings().archive_after_days))
+        logging.info(f"Пользователь {repr(visitor)} посмотрел статистику архива записей")
+    elif text == "Профилировать CPU":
+        if CPU_PROFILER.is_active:
+            await message.answer("Профилирование CPU уже запущено")
+            return
+        await state.set_state(InfoFSM.confirm_cpu_profile)
+        await message.answer(
+            text=strings.password_required_msg,
+            reply_markup=CANCEL_KEYBOARD
+        )
+    elif text == "Снимок памяти":
+        await state.set_state(InfoFSM.confirm_memory_snapshot)
+        await message.answer(
+            text=strings.password_required_msg,
+            reply_markup=CANCEL_KEYBOARD
+        )
+    elif text == "Выключить профилирование":
+        if MEMORY_PROFILER.is_active:
+            MEMORY_PROFILER.stop()
+        await CPU_PROFILER.finish()
+        await message.answer("Профилирование выключено")
+        logging.warning(f"Пользователь {repr(visitor)} выключил профилирование")
     elif text == "Потестить календарь":
         await state.set_state(InfoFSM.calendar)
         now_date = datetime.now()
@@ -273,6 +316,55 @@ async def confirm_get_revisions_handler(
     logging.warning(f"Пользователь {repr(visitor)} получил инфу про миграции")
 
 
+@router.message(InfoFSM.confirm_cpu_profile)
+async def confirm_cpu_profile_handler(message: Message, state: FSMContext, visitor: Visitor) -> None:
+    if not (await check_password_and_answer(visitor, message, state)):
+        return
+    await state.set_state(InfoFSM.cpu_profile_limit)
+    await message.answer(text=strings.profiling_limit_msg, reply_markup=CANCEL_KEYBOARD)
+
+
+@router.message(InfoFSM.cpu_profile_limit)
+async def cpu_profile_limit_handler(message: Message, state: FSMContext, visitor: Visitor, bot: Bot) -> None:
+    try:
+        updates, seconds = parse_profiling_limit(message.text or "")
+    except ValueError:
+        await message.answer(text=strings.profiling_limit_msg, reply_markup=CANCEL_KEYBOARD)
+        return
+    if CPU_PROFILER.is_active:
+        await state.clear()
+        await message.answer("Профилирование CPU уже запущено", reply_markup=ReplyKeyboardRemove())
+        return
+    CPU_PROFILER.start(bot, message.chat.id, updates, seconds)
+    await state.clear()
+    limit = f"{updates} апдейтов" if updates is not None else f"{seconds} секунд"
+    await message.answer(
+        text=f"Профилирую следующие {limit}, потом пришлю отчет",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    logging.warning(f"Пользователь {repr(visitor)} включил профилирование CPU на {limit}")
+
+
+@router.message(InfoFSM.confirm_memory_snapshot)
+async def confirm_memory_snapshot_handler(message: Message, state: FSMContext, visitor: Visitor) -> None:
+    if not (await check_password_and_answer(visitor, message, state)):
+        return
+    await state.clear()
+    if not MEMORY_PROFILER.is_active:
+        MEMORY_PROFILER.start()
+        await message.answer(
+            text="Отслеживание памяти включено. Через какое-то время сделайте снимок еще раз - "
+                 "пришлю, что выросло. Не забудьте выключить профилирование",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        logging.warning(f"Пользователь {repr(visitor)} включил отслеживание памяти")
+        return
+    report = MEMORY_PROFILER.diff().encode("utf-8")
+    input_file = BufferedInputFile(report, f"memory-{datetime.now().strftime('%d-%m-%Y-%H-%M-%S')}.txt")
+    await message.reply_document(input_file, reply_markup=ReplyKeyboardRemove())
+    logging.warning(f"Пользователь {repr(visitor)} получил снимок памяти")
+
+
 async def check_password_and_answer(visitor: Visitor, message: Message, state: FSMContext) -> bool:
     """Проверяет, соответствует ли пароль переменной среды. Сообщает пользователю об ошибке"""
     admin_pass = Settings().zoo_admin_pass
@@ -6,6 +6,8 @@
 """
 
 import logging
+from datetime import datetime
+from typing import Optional
 
 from aiogram import F, Router
 from aiogram.filters import StateFilter
@@ -18,6 +20,7 @@ from aiogram_calendar import SimpleCalendarCallback
 import resources.strings
 from configs.config import Settings
 from domain.models import Resource, Visitor, Record
+from domain.resource_info import VersionedResourceDTO
 from helpers import fsmhelper, tghelper as tg
 from helpers.fsmhelper import Buttons, CHOOSE_CONFIRM_OR_RETURN_MSG, CONFIRM_OR_RETURN_KEYBOARD, \
     SKIP_OR_RETURN_KEYBOARD, fill_date_from_calendar, handle_text_instead_of_date_from_calendar
@@ -74,6 +77,17 @@ def buttons_for_edit(resource_is_free: bool) -> list[str]:
     return buttons
 
 
+async def save_version(state: FSMContext, versioned: VersionedResourceDTO) -> None:
+    """Запоминает updated_at устройства: правка применится, только если с тех пор его никто не менял"""
+    updated_at = versioned.updated_at.isoformat() if versioned.updated_at is not None else None
+    await state.update_data(updated_at=updated_at)
+
+
+def restore_version(data: dict) -> Optional[datetime]:
+    updated_at = data.get("updated_at")
+    return datetime.fromisoformat(updated_at) if updated_at is not None else None
+
+
 async def escape_editing(
         visitor: Visitor,
         message: Message,
@@ -123,22 +137,24 @@ async def cancel_handler(
     action_result = await record_service.get_available_action(resource_id, visitor.email)
     action = action_result.unwrap()
     note = format_note(resource, visitor, action)
-    get_take_result = await resource_service.get_take_record(resource_id)
-
     await message.answer(
         text=f"Вы вернулись к редактированию\r\n\r\n{note}",
-        reply_markup=tg.get_reply_keyboard(buttons_for_edit(get_take_result.unwrap() is None))
+        reply_markup=tg.get_reply_keyboard(buttons_for_edit(resource.user_email is None))
     )
 
 
 @router.message(F.text.regexp(r"\/edit.+"))
 async def edit_resource_handler(message: Message, state: FSMContext, resource_service: ResourceService) -> None:
     resource_id = int(message.text.removeprefix("/edit"))
-    get_take_result = await resource_service.get_take_record(resource_id)
-    take_record = get_take_result.unwrap()
-    buttons = buttons_for_edit(take_record is None)
+    result = await resource_service.get_versioned(resource_id)
+    if result.is_failure:
+        await message.answer(strings.not_found_msg)
+        return
+    versioned = result.unwrap()
+    buttons = buttons_for_edit(versioned.resource.user_email is None)
     await state.set_state(EditFSM.choosing)
     await state.update_data(resource_id=resource_id)
+    await save_version(state, versioned)
     await message.answer(
         text="Выберите действие",
         reply_markup=tg.get_reply_keyboard(buttons)
@@ -206,7 +222,8 @@ async def editing_handler(message: Message, state: FSMContext, resource_service:
     value = message.text.strip()
     if value == EditButtons.CLEAR:
         value = None
-    field_name = (await state.get_data())["field_name"]
+    data = await state.get_data()
+    field_name = data["field_name"]
     if field_name == nameof(Resource.reg_date) and value:
         value = try_convert_to_ddmmyyyy(value)
         if not value:
@@ -215,18 +232,36 @@ async def editing_handler(message: Message, state: FSMContext, resource_service:
     if field_name == nameof(Resource.category_name) and value not in Settings().get_categories():
         await message.answer(f"{strings.ResourceError.WRONG_CATEGORY.value}. {strings.choose_option_msg}")
         return
-    resource_id = (await state.get_data())["resource_id"]
-    result = await resource_service.update_field(resource_id, field_name, value)
-    resource = result.unwrap()
-    get_take_result = await resource_service.get_take_record(resource_id)
-    take_record = get_take_result.unwrap()
+    resource_id = data["resource_id"]
+    result = await resource_service.update_field(resource_id, field_name, value, restore_version(data))
+    if result.is_failure and result.error_code == 404:
+        await state.clear()
+        await message.answer(strings.not_found_msg, reply_markup=ReplyKeyboardRemove())
+        return
+    await state.set_state(EditFSM.choosing)
+    if result.is_failure and result.error_code == 409:
+        logging.warning(f"Админ с chat_id {message.chat.id} не смог изменить поле {field_name} "
+                        f"ресурса {resource_id}: {result.error}")
+        current = await resource_service.get_versioned(resource_id)
+        if current.is_failure:
+            await state.clear()
+            await message.answer(strings.not_found_msg, reply_markup=ReplyKeyboardRemove())
+            return
+        versioned = current.unwrap()
+        await save_version(state, versioned)
+        await message.answer(
+            text=f"{strings.edit_conflict_msg}\r\n\r\n{versioned.resource.description()}",
+            reply_markup=tg.get_reply_keyboard(buttons_for_edit(versioned.resource.user_email is None))
+        )
+        return
+    versioned = result.unwrap()
+    await save_version(state, versioned)
     logging.info(
         f"Пользователь{strings.get_username_str(message)}с chat_id {message.chat.id} отредактировал "
-        f"поле {field_name} для ресурса {repr(resource)}")
-    await state.set_state(EditFSM.choosing)
+        f"поле {field_name} для ресурса {versioned.resource.values()}")
     await message.answer(
         text=strings.edit_success_msg,
-        reply_markup=tg.get_reply_keyboard(buttons_for_edit(take_record is None))
+        reply_markup=tg.get_reply_keyboard(buttons_for_edit(versioned.resource.user_email is None))
     )
 
 
@@ -269,19 +304,15 @@ async def confirm_delete_handler(message: Message, state: FSMContext, resource_s
     text = message.text.strip()
     resource_id = (await state.get_data())["resource_id"]
     if text == Buttons.CONFIRM:
-        result = await resource_service.get(resource_id)
-        resource = result.unwrap()
-        get_take_result = await resource_service.get_take_record(resource_id)
-        # TODO перенести логику в сервис
-        take_record = get_take_result.unwrap()
-        if take_record and take_record.user_email:
+        delete_result = await resource_service.delete(resource_id, only_free=True)
+        if delete_result.error_code == 409:
             await message.answer(
                 text=strings.delete_taken_error_msg,
                 reply_markup=ReplyKeyboardRemove()
             )
             await state.clear()
             return
-        delete_result = await resource_service.delete(resource_id)
+        resource = delete_result.unwrap()
         logging.info(
             f"Админ{strings.get_username_str(message)}с chat_id {message.chat.id} удалил "
             f"ресурс {repr(resource)}")
@@ -1,16 +1,19 @@
 """
 Основной роутер для пользователя, позволяет искать ресурсы разными способами
 """
+from re import Match
 from typing import Optional
 
 from aiogram import F, Router
 from aiogram.filters import Command, CommandObject
 from aiogram.types import CallbackQuery, Message
 
-from domain.models import Visitor
+from domain.history_dto import HistoryFilter
+from domain.models import Visitor, ActionType
 from helpers import tghelper as tg
+from helpers.history import HISTORY_PAGE_HANDLE, cursor_for, decode_query, parse_date_range, send_history_page
 from helpers.presentation import format_note
-from helpers.texthelper import format_date
+from helpers.search_session import SearchSessionStore
 from helpers.tghelper import SEPARATOR_FOR_CALLBACK_DATA
 from resources import strings
 from service.services import ResourceService, VisitorService, RecordService
@@ -61,31 +64,30 @@ async def welcome(message: Message, visitor: Visitor) -> None:
 
 @router.message(Command("all"))
 async def get_all_handler(message: Message, visitor: Visitor, resource_service: ResourceService,
-                          record_service: RecordService) -> None:
-    await search_resource(record_service, resource_service, message, 1, visitor, True)
+                          record_service: RecordService, search_sessions: SearchSessionStore) -> None:
+    await search_resource(record_service, resource_service, search_sessions, message, visitor, True)
 
 
 async def search_resource(
         record_service: RecordService,
         resource_service: ResourceService,
+        search_sessions: SearchSessionStore,
         message: Message,
-        page: int,
         visitor: Visitor,
         get_all: bool = False
 ) -> None:
-    """Выводит для пользователя список ресурсов на определенной странице"""
+    """Выводит для пользователя первую страницу найденных ресурсов и запоминает результат поиска"""
     if get_all:
-        query = ''
         get_all_result = await resource_service.get_all()
         resources = get_all_result.unwrap()
     else:
-        query = message.text
-        search_result = await resource_service.search(query, 200, 10000)
+        search_result = await resource_service.search(message.text, 200, 10000)
         resources = search_result.unwrap()
     if len(resources) == 0:
         await message.answer(strings.not_found_msg)
         return
-    paginator = tg.Paginator(page, resources)
+    token = await search_sessions.save([i.id for i in resources])
+    paginator = tg.Paginator(1, resources)
     notes = ""
     for i in paginator.get_objects_on_page():
         get_result = await record_service.get_available_action(i.id, visitor.email)
@@ -93,7 +95,7 @@ async def search_resource(
         notes += format_note(i, visitor, action)
     await message.answer(
         text=paginator.result_message() + notes,
-        reply_markup=paginator.create_keyboard("search_resource", query)
+        reply_markup=paginator.create_keyboard("search_resource", token)
     )
 
 
@@ -102,44 +104,51 @@ async def search_callback_handler(
         call: CallbackQuery,
         visitor: Visitor,
         resource_service: ResourceService,
-        record_service: RecordService
+        record_service: RecordService,
+        search_sessions: SearchSessionStore
 ) -> None:
     await call.answer()
     data = (str(call.data)).split(SEPARATOR_FOR_CALLBACK_DATA)
     page_number = int(data[1])
-    search_users_by_query = len(data) >= 2
-    if search_users_by_query:
-        query = " ".join(data[2:])
-        search_result = await resource_service.search(query, 200)
-        resources = search_result.unwrap()
-    else:
-        query = ''
-        get_all_result = await resource_service.get_all()
-        resources = get_all_result.unwrap()
-    paginator = tg.Paginator(page_number, resources)
+    token = data[2]
+    await show_search_session_page(call, visitor, resource_service, record_service, search_sessions,
+                                   "search_resource", token, page_number)
+
+
+async def show_search_session_page(
+        call: CallbackQuery,
+        visitor: Visitor,
+        resource_service: ResourceService,
+        record_service: RecordService,
+        search_sessions: SearchSessionStore,
+        page_handle: str,
+        token: str,
+        page: int
+) -> None:
+    """Показывает страницу сохраненного результата поиска: достает из БД только ресурсы этой страницы"""
+    resource_ids = await search_sessions.get(token)
+    if resource_ids is None:
+        await call.message.answer(strings.search_session_expired_msg)  # type: ignore
+        return
+    paginator = tg.Paginator(page, resource_ids)
+    get_many_result = await resource_service.get_many(paginator.get_objects_on_page())
     notes = ""
-    for i in paginator.get_objects_on_page():
-        get_result = await record_service.get_available_action(i.id,visitor.email)
+    for i in get_many_result.unwrap():
+        get_result = await record_service.get_available_action(i.id, visitor.email)
         action = get_result.unwrap()
         notes += format_note(i, visitor, action)
     await call.message.edit_text(  # type: ignore
         text=paginator.result_message() + notes,
-        reply_markup=paginator.create_keyboard("search_resource", query)
+        reply_markup=paginator.create_keyboard(page_handle, token)
     )
 
 
 @router.message(Command("wishlist"))
-async def wishlist_handler(
-        message: Message,
-        visitor: Visitor,
-        visitor_service: VisitorService,
-        record_service: RecordService
-) -> None:
-    await get_wishlist(record_service, visitor_service, message, visitor, 1)
+async def wishlist_handler(message: Message, visitor: Visitor, visitor_service: VisitorService) -> None:
+    await get_wishlist(visitor_service, message, visitor, 1)
 
 
 async def get_wishlist(
-        record_service: RecordService,
         visitor_service: VisitorService,
         message: Message,
         visitor: Visitor,
@@ -147,18 +156,16 @@ async def get_wishlist(
         call: Optional[CallbackQuery] = None
 ) -> None:
     """Выводит для пользователя список из вишлиста на определенной странице"""
-    wishlist_result = await visitor_service.get_queue(visitor)
-    resources = wishlist_result.unwrap()
-    if len(resources) == 0:
+    dashboard_result = await visitor_service.get_dashboard(visitor.email)
+    queued = dashboard_result.unwrap().queued
+    if len(queued) == 0:
         await message.answer(strings.empty_wishlist)
         return
-    paginator = tg.Paginator(page, resources)
+    paginator = tg.Paginator(page, queued)
     keyboard = paginator.create_keyboard("wishlist")
     notes = ""
     for i in paginator.get_objects_on_page():
-        get_result = await record_service.get_available_action(i.id, visitor.email)
-        action = get_result.unwrap()
-        notes += format_note(i, visitor, action)
+        notes += format_note(i.resource, visitor, i.available_action, i.queue_position, i.queue_length)
     text = paginator.result_message() + notes
     if call:
         await call.message.edit_text(text=text, reply_markup=keyboard)  # type: ignore
@@ -167,30 +174,19 @@ async def get_wishlist(
 
 
 @router.callback_query(F.data.startswith("wishlist"))
-async def wishlist_callback_handler(
-        call: CallbackQuery,
-        visitor: Visitor,
-        record_service: RecordService,
-        visitor_service: VisitorService
-) -> None:
+async def wishlist_callback_handler(call: CallbackQuery, visitor: Visitor, visitor_service: VisitorService) -> None:
     await call.answer()
     data = str(call.data)
     page_number = int(data.split(SEPARATOR_FOR_CALLBACK_DATA)[1])
-    await get_wishlist(record_service, visitor_service, call.message, visitor, page_number, call)
+    await get_wishlist(visitor_service, call.message, visitor, page_number, call)
 
 
 @router.message(Command("mine"))
-async def get_mine_resources_handler(
-        message: Message,
-        visitor: Visitor,
-        visitor_service: VisitorService,
-        record_service: RecordService
-) -> None:
-    await get_mine_resources(record_service, visitor_service, message, visitor, 1)
+async def get_mine_resources_handler(message: Message, visitor: Visitor, visitor_service: VisitorService) -> None:
+    await get_mine_resources(visitor_service, message, visitor, 1)
 
 
 async def get_mine_resources(
-        record_service: RecordService,
         visitor_service: VisitorService,
         message: Message,
         visitor: Visitor,
@@ -198,8 +194,8 @@ async def get_mine_resources(
         call: Optional[CallbackQuery] = None
 ) -> None:
     """Выводит список записанных на пользователя ресурсов на определенной странице"""
-    get_taken_result = await visitor_service.get_taken_resources(visitor)
-    resources = get_taken_result.unwrap()
+    dashboard_result = await visitor_service.get_dashboard(visitor.email)
+    resources = dashboard_result.unwrap().taken
     if len(resources) == 0:
         await message.answer(strings.user_have_no_device_msg)  # type: ignore
         return
@@ -207,9 +203,7 @@ async def get_mine_resources(
     keyboard = paginator.create_keyboard("mine")
     notes = ""
     for i in paginator.get_objects_on_page():
-        get_result = await record_service.get_available_action(i.id, visitor.email)
-        action = get_result.unwrap()
-        notes += format_note(i, visitor, action)
+        notes += format_note(i, visitor, ActionType.RETURN)
     text = paginator.result_message() + notes
     if not call:
         await message.answer(text=text, reply_markup=keyboard)  # type: ignore
@@ -218,16 +212,11 @@ async def get_mine_resources(
 
 
 @router.callback_query(F.data.startswith("mine"))
-async def mine_callback_handler(
-        call: CallbackQuery,
-        visitor: Visitor,
-        visitor_service: VisitorService,
-        record_service: RecordService
-) -> None:
+async def mine_callback_handler(call: CallbackQuery, visitor: Visitor, visitor_service: VisitorService) -> None:
     await call.answer()
     data = str(call.data)
     page_number = int(data.split(SEPARATOR_FOR_CALLBACK_DATA)[1])
-    await get_mine_resources(record_service, visitor_service, call.message, visitor, page_number, call)
+    await get_mine_resources(visitor_service, call.message, visitor, page_number, call)
 
 
 @router.message(Command("categories"))
@@ -248,23 +237,25 @@ async def category_callback_handler(
         call: CallbackQuery,
         visitor: Visitor,
         resource_service: ResourceService,
-        record_service: RecordService
+        record_service: RecordService,
+        search_sessions: SearchSessionStore
 ) -> None:
     await call.answer()
     data = str(call.data).split(SEPARATOR_FOR_CALLBACK_DATA)
-    if len(data) <= 2:
-        page = 1
-        category = str(call.data).split(SEPARATOR_FOR_CALLBACK_DATA)[1]
-    else:
-        page = int(data[1])
-        category = data[2]
+    if len(data) > 2:
+        # Листание страниц: вместо категории в колбэке токен сессии поиска
+        await show_search_session_page(call, visitor, resource_service, record_service, search_sessions,
+                                       "categories", data[2], int(data[1]))
+        return
+    category = data[1]
     result = await resource_service.list_by_category_name(category)
     if result.is_failure or len(result.unwrap()) == 0:
         await call.message.answer(strings.not_found_msg)  # type: ignore
         return
     resources = result.unwrap()
-    paginator = tg.Paginator(page, resources)
-    keyboard = paginator.create_keyboard("categories", category)
+    token = await search_sessions.save([i.id for i in resources])
+    paginator = tg.Paginator(1, resources)
+    keyboard = paginator.create_keyboard("categories", token)
     notes = ""
     for i in paginator.get_objects_on_page():
         get_result = await record_service.get_available_action(i.id, visitor.email)
@@ -274,28 +265,38 @@ async def category_callback_handler(
     await call.message.edit_text(text=text, reply_markup=keyboard)  # type: ignore
 
 
-@router.message(F.text.regexp(r"\/history.+"))
-async def edit_resource_handler(message: Message, visitor: Visitor, resource_service: ResourceService) -> None:
+@router.message(F.text.regexp(r"^\/history(\d+)(?:\s+(.+))?$").as_("match"))
+async def history_handler(message: Message, match: Match[str], visitor: Visitor, record_service: RecordService) -> None:
     if not visitor.is_admin:
         await message.answer(strings.not_admin_error_msg)
         return
-    resource_id = int(message.text.removeprefix("/history"))
-    result = await resource_service.get_finished_records(resource_id)
-    resource_infos = result.unwrap()
-    if len(resource_infos) == 0:
-        await message.answer("Нет информации о прошлых записях")
-    else:
-        reply = f"История для {resource_infos[0].short_str()}: \n\n"
-        for i in resource_infos:
-            reply += f"{format_date(i.take_date)} - {format_date(i.return_date)}: {i.user_email}. Адрес: {i.address or 'не указан'}\n"
-        await message.answer(reply)
+    try:
+        date_from, date_to = parse_date_range(match.group(2))
+    except ValueError:
+        await message.answer(strings.history_period_error_msg)
+        return
+    history_filter = HistoryFilter(resource_id=int(match.group(1)), date_from=date_from, date_to=date_to)
+    await send_history_page(message, record_service, history_filter)
+
+
+@router.callback_query(F.data.startswith(HISTORY_PAGE_HANDLE))
+async def history_page_callback_handler(call: CallbackQuery, visitor: Visitor, record_service: RecordService) -> None:
+    await call.answer()
+    if not visitor.is_admin:
+        await call.message.answer(strings.not_admin_error_msg)  # type: ignore
+        return
+    data = str(call.data).split(SEPARATOR_FOR_CALLBACK_DATA)
+    page_number = int(data[1])
+    history_filter, current_page, last_id = decode_query(data[2])
+    await send_history_page(call.message, record_service, history_filter, page_number,  # type: ignore
+                            cursor_for(page_number, current_page, last_id), call)
 
 
 @router.message(F.text)
 async def search_resource_handler(message: Message, visitor: Visitor, resource_service: ResourceService,
-                                  record_service: RecordService) -> None:
+                                  record_service: RecordService, search_sessions: SearchSessionStore) -> None:
     text = message.text.strip()
     if text is None or text == "":
         await welcome_handler(message)
         return
-    await search_resource(record_service, resource_service, message, 1, visitor, False)
+    await search_resource(record_service, resource_service, search_sessions, message, visitor, False)
@@ -12,14 +12,16 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
 
+from domain.history_dto import HistoryFilter
 from helpers import tghelper as tg
+from helpers.history import parse_date_range, send_history_page
 from helpers.fsmhelper import Buttons, CHOOSE_CONFIRM_OR_RETURN_MSG, CONFIRM_OR_RETURN_KEYBOARD, RETURN_KEYBOARD
-from helpers.texthelper import format_date
+from helpers.search_session import SearchSessionStore
 from helpers.tghelper import render_visitors, SEPARATOR_FOR_CALLBACK_DATA
 from middlewares.authorize_middleware import Authorize
 from resources import strings
 from service import resource_checker
-from service.services import VisitorService
+from service.services import VisitorService, RecordService
 
 
 class UsersFSM(StatesGroup):
@@ -37,8 +39,9 @@ router.callback_query.middleware(Authorize())
 
 
 @router.message(Command("users"))
-async def users_handler(message: Message, state: FSMContext, visitor_service: VisitorService) -> None:
-    await search_user(visitor_service, message, 1, True)
+async def users_handler(message: Message, state: FSMContext, visitor_service: VisitorService,
+                        search_sessions: SearchSessionStore) -> None:
+    await search_user(visitor_service, search_sessions, message, True)
     await state.set_state(UsersFSM.search)
     await message.answer(
         "Включен режим поиска по пользователям. Воспользуйтесь списком выше или "
@@ -181,8 +184,7 @@ async def ask_comment_handler(message: Message, state: FSMContext) -> None:
     )
 
 
-@router.message(StateFilter(UsersFSM),
-                F.text.regexp(r"^(\/comment|\/email|\/delete|\/user_history)(\d+)$").as_("match"))
+@router.message(StateFilter(UsersFSM), F.text.regexp(r"^(\/comment|\/email|\/delete)(\d+)$").as_("match"))
 async def actions_handler(
         message: Message,
         match: Match[str],
@@ -210,63 +212,68 @@ async def actions_handler(
             text="Вы уверены, что хотите удалить пользователя?",
             reply_markup=CONFIRM_OR_RETURN_KEYBOARD
         )
-    elif action == "/user_history":
-        get_finished_result = await visitor_service.get_finished_records(visitor_id)
-        visitor_infos = get_finished_result.unwrap()
-        if len(visitor_infos) == 0:
-            await message.answer("Пока что нет данных об истории", reply_markup=ReplyKeyboardRemove())
-            await state.clear()
-            return
-        reply = f"История для пользователя {visitor_infos[0].visitor_email} (@{visitor_infos[0].visitor_username}):\n\n"
-        for i in visitor_infos:
-            reply += f"{format_date(i.take_date)} - {format_date(i.return_date)}: {i.resource_name} с id {i.resource_id}. Адрес: {i.address or 'не указан'}\n"
-        await message.answer(reply, reply_markup=ReplyKeyboardRemove())
-        await state.clear()
     else:
         await message.answer("Выбрано некорректное действие над пользователем")
 
 
+@router.message(StateFilter(UsersFSM), F.text.regexp(r"^\/user_history(\d+)(?:\s+(.+))?$").as_("match"))
+async def user_history_handler(
+        message: Message,
+        match: Match[str],
+        state: FSMContext,
+        record_service: RecordService
+) -> None:
+    await state.clear()
+    try:
+        date_from, date_to = parse_date_range(match.group(2))
+    except ValueError:
+        await message.answer(strings.history_period_error_msg)
+        return
+    history_filter = HistoryFilter(visitor_id=int(match.group(1)), date_from=date_from, date_to=date_to)
+    await send_history_page(message, record_service, history_filter)
+
+
 @router.callback_query(F.data.startswith("search_user"))
-async def search_callback(call: CallbackQuery, visitor_service: VisitorService) -> None:
+async def search_callback(call: CallbackQuery, visitor_service: VisitorService,
+                          search_sessions: SearchSessionStore) -> None:
     await call.answer()
     data = (str(call.data)).split(SEPARATOR_FOR_CALLBACK_DATA)
     page_number = int(data[1])
-    search_users_by_query = len(data) >= 2
-    if search_users_by_query:
-        query = " ".join(data[2:])
-        search_result = await visitor_service.search(query)
-        visitors = search_result.unwrap()
-    else:
-        query = ''
-        visitors = (await visitor_service.get_all()).unwrap()
-    paginator = tg.Paginator(page_number, visitors)
-    reply = paginator.result_message() + render_visitors(paginator.get_objects_on_page())
+    token = data[2]
+    visitor_ids = await search_sessions.get(token)
+    if visitor_ids is None:
+        await call.message.answer(strings.search_session_expired_msg)  # type: ignore
+        return
+    paginator = tg.Paginator(page_number, visitor_ids)
+    visitors = (await visitor_service.get_many(paginator.get_objects_on_page())).unwrap()
+    reply = paginator.result_message() + render_visitors(visitors)
     await call.message.edit_text(  # type: ignore
         text=reply,
-        reply_markup=paginator.create_keyboard("search_user", query)
+        reply_markup=paginator.create_keyboard("search_user", token)
     )
 
 
-async def search_user(visitor_service: VisitorService, message: Message, page_number: int,
+async def search_user(visitor_service: VisitorService, search_sessions: SearchSessionStore, message: Message,
                       get_all: bool = False) -> None:
-    """Выводит список пользователей на определенной странице"""
-    query = '' if get_all else message.text.replace("@", "")
+    """Выводит первую страницу найденных пользователей и запоминает результат поиска"""
     if get_all:
         visitors = (await visitor_service.get_all()).unwrap()
     else:
-        visitors = (await visitor_service.search(query)).unwrap()
+        visitors = (await visitor_service.search(message.text.replace("@", ""))).unwrap()
     if len(visitors) == 0:
         reply = "Пользователь не найден. Поищите иначе или вернитесь в режим поиска по устройствам: /cancel"
         await message.answer(reply)
         return
-    paginator = tg.Paginator(page_number, visitors)
+    token = await search_sessions.save([i.id for i in visitors])
+    paginator = tg.Paginator(1, visitors)
     reply = paginator.result_message() + render_visitors(paginator.get_objects_on_page())
     await message.answer(
         text=reply,
-        reply_markup=paginator.create_keyboard("search_user", query)
+        reply_markup=paginator.create_keyboard("search_user", token)
     )
 
 
 @router.message(StateFilter(UsersFSM), F.text)
-async def search_user_handler(message: Message, visitor_service: VisitorService) -> None:
-    await search_user(visitor_service, message, 1, False)
+async def search_user_handler(message: Message, visitor_service: VisitorService,
+                              search_sessions: SearchSessionStore) -> None:
+    await search_user(visitor_service, search_sessions, message, False)
@@ -0,0 +1,176 @@
+"""
+FSM-хранилище с буфером на время апдейта.
+
+Шаг FSM обычно читает состояние (это делает aiogram до хэндлера), потом update_data (get + set) и set_state -
+с RedisStorage это три-четыре похода в Redis. BufferedStorage на время апдейта держит состояние и данные в памяти:
+первое обращение к ключу читает состояние и данные одним пайплайном, дальше чтения и записи идут в кэш,
+а в конце апдейта все изменения пишутся одним пайплайном MULTI/EXEC. Итого на шаг - одно чтение и одна запись.
+Буфер открывает BufferedIsolation под той же блокировкой чата, что и обработка апдейта, поэтому следующий апдейт
+того же чата видит уже записанные изменения. Вне апдейта (например, из воркера) обертка просто пропускает вызовы.
+Если под оберткой не RedisStorage, буфер тоже работает, но загрузка и запись идут обычными методами хранилища.
+
+Classes
+--------
+BufferedStorage
+    Обертка над FSM-хранилищем с кэшем на время апдейта и одной записью в конце
+BufferedIsolation
+    Обертка над events_isolation, которая открывает буфер на время обработки апдейта
+"""
+
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+
+from helpers.metrics import STORAGE_DURATION
+
+
+@dataclass
+class _Entry:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    loaded: bool = False
+    state_changed: bool = False
+    data_changed: bool = False
+
+
+_buffer: ContextVar[Optional[Dict[StorageKey, _Entry]]] = ContextVar("fsm_buffer", default=None)
+
+
+def _decode(value: Any) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class BufferedStorage(BaseStorage):
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    @asynccontextmanager
+    async def buffer(self) -> AsyncGenerator[None, None]:
+        """Внутри блока хранилище работает через кэш, изменения записываются при выходе - даже если была ошибка"""
+        if _buffer.get() is not None:
+            yield
+            return
+        entries: Dict[StorageKey, _Entry] = dict()
+        token = _buffer.set(entries)
+        try:
+            yield
+        finally:
+            _buffer.reset(token)
+            await self._flush(entries)
+
+    async def _entry(self, key: StorageKey) -> Optional[_Entry]:
+        """Запись кэша с загруженными состоянием и данными или None, если буфер не открыт"""
+        entries = _buffer.get()
+        if entries is None:
+            return None
+        entry = entries.setdefault(key, _Entry())
+        if not entry.loaded and not (entry.state_changed and entry.data_changed):
+            state, data = await self._load(key)
+            if not entry.state_changed:
+                entry.state = state
+            if not entry.data_changed:
+                entry.data = data
+            entry.loaded = True
+        return entry
+
+    async def _load(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        started_at = time.perf_counter()
+        try:
+            if not isinstance(self.storage, RedisStorage):
+                return await self.storage.get_state(key), await self.storage.get_data(key)
+            async with self.storage.redis.pipeline(transaction=False) as pipe:
+                pipe.get(self.storage.key_builder.build(key, "state"))
+                pipe.get(self.storage.key_builder.build(key, "data"))
+                state, data = await pipe.execute()
+            return _decode(state), self.storage.json_loads(_decode(data)) if data is not None else {}
+        finally:
+            STORAGE_DURATION.observe(time.perf_counter() - started_at, "load")
+
+    async def _flush(self, entries: Dict[StorageKey, _Entry]) -> None:
+        changed = [(key, entry) for key, entry in entries.items() if entry.state_changed or entry.data_changed]
+        if not changed:
+            return
+        started_at = time.perf_counter()
+        try:
+            if not isinstance(self.storage, RedisStorage):
+                for key, entry in changed:
+                    if entry.state_changed:
+                        await self.storage.set_state(key, entry.state)
+                    if entry.data_changed:
+                        await self.storage.set_data(key, entry.data)
+                return
+            storage = self.storage
+            async with storage.redis.pipeline(transaction=True) as pipe:
+                for key, entry in changed:
+                    # Как в RedisStorage: пустое состояние и пустые данные - это удаление ключа
+                    if entry.state_changed:
+                        state_key = storage.key_builder.build(key, "state")
+                        if entry.state is None:
+                            pipe.delete(state_key)
+                        else:
+                            pipe.set(state_key, entry.state, ex=storage.state_ttl)
+                    if entry.data_changed:
+                        data_key = storage.key_builder.build(key, "data")
+                        if not entry.data:
+                            pipe.delete(data_key)
+                        else:
+                            pipe.set(data_key, storage.json_dumps(entry.data), ex=storage.data_ttl)
+                await pipe.execute()
+        finally:
+            STORAGE_DURATION.observe(time.perf_counter() - started_at, "flush")
+
+    def _pending(self, key: StorageKey) -> Optional[_Entry]:
+        """Запись кэша без загрузки - для записи загружать нечего"""
+        entries = _buffer.get()
+        return entries.setdefault(key, _Entry()) if entries is not None else None
+
+    async def set_state(self, key: StorageKey, state: str | State | None = None) -> None:
+        entry = self._pending(key)
+        if entry is None:
+            await self.storage.set_state(key, state)
+            return
+        entry.state = state.state if isinstance(state, State) else state
+        entry.state_changed = True
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = await self._entry(key)
+        if entry is None:
+            return await self.storage.get_state(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = self._pending(key)
+        if entry is None:
+            await self.storage.set_data(key, data)
+            return
+        entry.data = dict(data)
+        entry.data_changed = True
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = await self._entry(key)
+        if entry is None:
+            return await self.storage.get_data(key)
+        return dict(entry.data)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+class BufferedIsolation(BaseEventIsolation):
+    def __init__(self, isolation: BaseEventIsolation, storage: BufferedStorage):
+        self.isolation = isolation
+        self.storage = storage
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        async with self.isolation.lock(key), self.storage.buffer():
+            yield
+
+    async def close(self) -> None:
+        await self.isolation.close()
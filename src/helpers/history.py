@@ -0,0 +1,122 @@
+"""
+Постраничный вывод истории устройства (/history) и пользователя (/user_history).
+
+История не загружается целиком: на каждую страницу - один запрос за ее записями и один за общим количеством.
+В колбэк кнопок пагинации попадает, чья это история, период и последняя запись текущей страницы -
+следующая страница ищется от этой записи по индексу, а не через OFFSET.
+Период задается после команды: /history12 01.09.2024-30.09.2024 или /history12 01.09.2024 (с этой даты).
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, Message, CallbackQuery
+
+from domain.history_dto import HistoryFilter, HistoryPageDTO, HistoryRecordDTO
+from helpers.texthelper import format_date
+from helpers.tghelper import Paginator
+from resources import strings
+from service.services import RecordService
+
+HISTORY_PAGE_HANDLE = "history_page"
+HISTORY_PAGE_SIZE = 5
+QUERY_SEPARATOR = "."
+DATE_FORMAT = "%d%m%y"
+
+
+def parse_date_range(text: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Разбирает 'дд.мм.гггг-дд.мм.гггг' или 'дд.мм.гггг'. Вторая дата включительно, поэтому к ней прибавляется день"""
+    if text is None or text.strip() == "":
+        return None, None
+    parts = [i.strip() for i in text.split("-")]
+    if len(parts) > 2:
+        raise ValueError("Период нужно указать как дд.мм.гггг-дд.мм.гггг")
+    date_from = datetime.strptime(parts[0], "%d.%m.%Y") if parts[0] else None
+    date_to = datetime.strptime(parts[1], "%d.%m.%Y") + timedelta(days=1) if len(parts) == 2 and parts[1] else None
+    return date_from, date_to
+
+
+def _format_query_date(date: Optional[datetime]) -> str:
+    return date.strftime(DATE_FORMAT) if date is not None else ""
+
+
+def _parse_query_date(text: str) -> Optional[datetime]:
+    return datetime.strptime(text, DATE_FORMAT) if text else None
+
+
+def encode_query(history_filter: HistoryFilter, page: int, last_id: Optional[int]) -> str:
+    """Упаковывает фильтр и курсор в колбэк: 'r12.010924.011024.3.4567' - укладывается в 64 байта телеграма"""
+    owner = f"r{history_filter.resource_id}" if history_filter.resource_id is not None \
+        else f"v{history_filter.visitor_id}"
+    return QUERY_SEPARATOR.join([
+        owner,
+        _format_query_date(history_filter.date_from),
+        _format_query_date(history_filter.date_to),
+        str(page),
+        str(last_id) if last_id is not None else ""
+    ])
+
+
+def decode_query(query: str) -> Tuple[HistoryFilter, int, Optional[int]]:
+    """Обратное к encode_query: фильтр, номер страницы, с которой листают, и ее последняя запись"""
+    owner, date_from, date_to, page, last_id = query.split(QUERY_SEPARATOR)
+    owner_id = int(owner[1:])
+    history_filter = HistoryFilter(
+        resource_id=owner_id if owner[0] == "r" else None,
+        visitor_id=owner_id if owner[0] == "v" else None,
+        date_from=_parse_query_date(date_from),
+        date_to=_parse_query_date(date_to)
+    )
+    return history_filter, int(page), int(last_id) if last_id else None
+
+
+def cursor_for(requested_page: int, current_page: int, last_id: Optional[int]) -> Optional[int]:
+    """Курсор есть только для перехода на следующую страницу, на остальные переходим через OFFSET"""
+    return last_id if requested_page == current_page + 1 else None
+
+
+def format_history_record(record: HistoryRecordDTO, by_resource: bool) -> str:
+    who = record.user_email if by_resource else f"{record.resource_name} с id {record.resource_id}"
+    take_date = format_date(record.take_date) if record.take_date else "?"
+    return_date = format_date(record.return_date) if record.return_date else "?"
+    return f"{take_date} - {return_date}: {who}. Адрес: {record.address or 'не указан'}\n"
+
+
+def render_history_page(history_filter: HistoryFilter, page: HistoryPageDTO) -> Tuple[str, InlineKeyboardMarkup]:
+    """Текст страницы истории и стандартная клавиатура пагинации"""
+    by_resource = history_filter.resource_id is not None
+    first = page.records[0]
+    if by_resource:
+        header = f"История для {first.resource_name} с id {first.resource_id} и артикулом {first.vendor_code}"
+    else:
+        header = f"История для пользователя {first.user_email} (@{first.username})"
+    if history_filter.date_from or history_filter.date_to:
+        date_to = history_filter.date_to - timedelta(days=1) if history_filter.date_to else None
+        header += f" за период {format_date(history_filter.date_from) if history_filter.date_from else '...'}" \
+                  f" - {format_date(date_to) if date_to else '...'}"
+    paginator = Paginator(page.page, page.records, HISTORY_PAGE_SIZE, total=page.total)
+    text = f"{header}:\n\n{paginator.result_message()}" + \
+           "".join(format_history_record(i, by_resource) for i in paginator.get_objects_on_page())
+    keyboard = paginator.create_keyboard(HISTORY_PAGE_HANDLE, encode_query(history_filter, page.page,
+                                                                           page.records[-1].record_id))
+    return text, keyboard
+
+
+async def send_history_page(
+        message: Message,
+        record_service: RecordService,
+        history_filter: HistoryFilter,
+        page: int = 1,
+        after_id: Optional[int] = None,
+        call: Optional[CallbackQuery] = None
+) -> None:
+    """Выводит страницу истории или сообщение, что истории нет"""
+    result = await record_service.get_history(history_filter, page, HISTORY_PAGE_SIZE, after_id)
+    if result.is_failure or len(result.unwrap().records) == 0:
+        await message.answer(strings.empty_history_msg)
+        return
+    text, keyboard = render_history_page(history_filter, result.unwrap())
+    if call:
+        await call.message.edit_text(text=text, reply_markup=keyboard)  # type: ignore
+    else:
+        await message.answer(text=text, reply_markup=keyboard)
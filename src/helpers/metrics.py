@@ -0,0 +1,295 @@
+"""
+Метрики в формате Prometheus.
+
+Своя маленькая реализация вместо prometheus_client: нужны только счетчики и гистограммы,
+а лишняя зависимость в образе бота и воркера ни к чему. Метрики отдаются на /metrics
+отдельным aiohttp-сервером, если задан METRICS_PORT.
+
+Что меряем:
+- время обработки апдейта, количество SQL-запросов и время в БД на апдейт - по хэндлерам
+  (см. middlewares.metrics_middleware);
+- время каждого SQL-запроса - по событиям алхимии before/after_cursor_execute;
+- время запросов к Bot API - по методам (мидлварь сессии бота);
+- время операций с FSM-хранилищем;
+- время и ошибки задач arq-воркера.
+
+Classes
+--------
+Counter
+    Монотонный счетчик с метками
+Histogram
+    Гистограмма с фиксированными бакетами и метками
+Registry
+    Набор метрик, который умеет отдавать их текстом для Prometheus
+UpdateStats
+    Счетчики текущего апдейта или задачи: сколько было SQL-запросов и сколько они заняли
+TelegramRequestMetrics
+    Мидлварь сессии бота, которая меряет запросы к Bot API
+TimedStorage
+    Обертка над FSM-хранилищем, которая меряет его операции
+"""
+
+import functools
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, cast
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.methods import TelegramMethod, Response
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+LabelValues = Tuple[str, ...]
+T = TypeVar("T")
+Job = TypeVar("Job", bound=Callable[..., Awaitable[Any]])
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: Dict[LabelValues, float] = dict()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+            self,
+            name: str,
+            description: str,
+            labels: Tuple[str, ...] = (),
+            buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # Для каждого набора меток: количество наблюдений в каждом бакете (не накопительно), сумма и количество
+        self.values: Dict[LabelValues, Tuple[List[int], float, int]] = dict()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        counts, total, count = self.values.get(label_values) or ([0] * len(self.buckets), 0.0, 0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self.values[label_values] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _format_labels(self.labels, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: List[Counter | Histogram] = []
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, description, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+            self,
+            name: str,
+            description: str,
+            labels: Tuple[str, ...] = (),
+            buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, description, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join([line for metric in self.metrics for line in metric.render()]) + "\n"
+
+
+REGISTRY = Registry()
+UPDATE_DURATION = REGISTRY.histogram(
+    "zoo_update_duration_seconds", "Время обработки апдейта", ("handler",))
+UPDATE_SQL_STATEMENTS = REGISTRY.histogram(
+    "zoo_update_sql_statements", "Количество SQL-запросов на апдейт", ("handler",), COUNT_BUCKETS)
+UPDATE_SQL_DURATION = REGISTRY.histogram(
+    "zoo_update_sql_seconds", "Суммарное время SQL-запросов на апдейт", ("handler",))
+UPDATE_ERRORS = REGISTRY.counter(
+    "zoo_update_errors_total", "Апдейты, обработка которых закончилась исключением", ("handler",))
+SQL_DURATION = REGISTRY.histogram(
+    "zoo_sql_duration_seconds", "Время одного SQL-запроса", ("statement",))
+TELEGRAM_DURATION = REGISTRY.histogram(
+    "zoo_telegram_request_seconds", "Время запроса к Bot API", ("method",))
+TELEGRAM_ERRORS = REGISTRY.counter(
+    "zoo_telegram_request_errors_total", "Запросы к Bot API, которые закончились исключением", ("method",))
+STORAGE_DURATION = REGISTRY.histogram(
+    "zoo_fsm_storage_seconds", "Время операции с FSM-хранилищем", ("operation",))
+JOB_DURATION = REGISTRY.histogram(
+    "zoo_job_duration_seconds", "Время выполнения задачи воркера", ("job",), DEFAULT_BUCKETS + (30, 60, 300))
+JOB_SQL_STATEMENTS = REGISTRY.histogram(
+    "zoo_job_sql_statements", "Количество SQL-запросов на задачу воркера", ("job",), COUNT_BUCKETS + (1000, 10000))
+JOB_ERRORS = REGISTRY.counter(
+    "zoo_job_errors_total", "Задачи воркера, которые закончились исключением", ("job",))
+
+
+@dataclass
+class UpdateStats:
+    """Счетчики текущего апдейта или задачи воркера. Живут в контекстной переменной"""
+    handler: str = "unhandled"
+    sql_statements: int = 0
+    sql_time: float = 0.0
+    failed: bool = False
+
+
+current_stats: ContextVar[Optional[UpdateStats]] = ContextVar("current_stats", default=None)
+
+
+def _statement_kind(statement: str) -> str:
+    """Тип запроса для метки - полный текст запроса в метку класть нельзя"""
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                           executemany: bool) -> None:
+    conn.info.setdefault("zoo_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                          executemany: bool) -> None:
+    starts = conn.info.get("zoo_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    SQL_DURATION.observe(elapsed, _statement_kind(statement))
+    stats = current_stats.get()
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_time += elapsed
+
+
+def instrument_sqlalchemy() -> None:
+    """Подписывается на события всех движков алхимии. Повторный вызов ничего не делает"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[T],
+            bot: Bot,
+            method: TelegramMethod[T],
+    ) -> Response[T]:
+        method_name = type(method).__name__
+        started_at = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            TELEGRAM_ERRORS.inc(method_name)
+            raise
+        finally:
+            TELEGRAM_DURATION.observe(time.perf_counter() - started_at, method_name)
+
+
+class TimedStorage(BaseStorage):
+    """Обертка над FSM-хранилищем, которая меряет время каждой операции"""
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def _timed(self, operation: str, call: Awaitable[T]) -> T:
+        started_at = time.perf_counter()
+        try:
+            return await call
+        finally:
+            STORAGE_DURATION.observe(time.perf_counter() - started_at, operation)
+
+    async def set_state(self, key: StorageKey, state: str | State | None = None) -> None:
+        await self._timed("set_state", self.storage.set_state(key, state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._timed("get_state", self.storage.get_state(key))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._timed("set_data", self.storage.set_data(key, data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self._timed("get_data", self.storage.get_data(key))
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+def instrument_job(job: Job) -> Job:
+    """Декоратор для задач arq: время, количество SQL-запросов и ошибки"""
+
+    @functools.wraps(job)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        stats = UpdateStats(handler=job.__name__)
+        token = current_stats.set(stats)
+        started_at = time.perf_counter()
+        try:
+            return await job(*args, **kwargs)
+        except Exception:
+            JOB_ERRORS.inc(job.__name__)
+            raise
+        finally:
+            current_stats.reset(token)
+            JOB_DURATION.observe(time.perf_counter() - started_at, job.__name__)
+            JOB_SQL_STATEMENTS.observe(stats.sql_statements, job.__name__)
+
+    # Тот же тип, что у задачи: cron() из arq проверяет сигнатуру
+    return cast(Job, wrapper)
+
+
+async def start_metrics_server(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    """Поднимает aiohttp-сервер, который отдает метрики на /metrics"""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
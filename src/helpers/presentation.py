@@ -1,11 +1,23 @@
+from typing import Optional
+
 from domain.models import Visitor, ActionType
 from domain.resource_info import ResourceInfoDTO
+from resources import strings
 
 
-def format_note(resource_info: ResourceInfoDTO, visitor: Visitor, available_action: ActionType) -> str:
-    """Выводит информацию про ресурс + доступные действия"""
+def format_note(
+        resource_info: ResourceInfoDTO,
+        visitor: Visitor,
+        available_action: ActionType,
+        queue_position: Optional[int] = None,
+        queue_length: Optional[int] = None
+) -> str:
+    """Выводит информацию про ресурс + место пользователя в очереди, если оно известно, + доступные действия"""
     command = available_action.value
-    note = f"{resource_info.description()}\r\n{command}{resource_info.id}\r\n"
+    note = f"{resource_info.description()}\r\n"
+    if queue_position is not None:
+        note += f"{strings.queue_position_msg(queue_position, queue_length)}\r\n"
+    note += f"{command}{resource_info.id}\r\n"
     if available_action == ActionType.RETURN:
         note += f"{ActionType.CHANGE.value}{resource_info.id}\r\n"
     if visitor.is_admin:
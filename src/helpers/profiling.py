@@ -0,0 +1,176 @@
+"""
+Профилирование по запросу из меню /info - без передеплоя.
+
+CPU: cProfile включается на следующие N апдейтов или на T секунд, после чего разработчику приходит
+текстовый отчет и .prof-файл (открывается в snakeviz). cProfile видит все корутины,
+которые крутятся в цикле событий, пока он включен, поэтому апдейты профилируются вместе с фоновыми задачами.
+Пока профилирование выключено, накладные расходы - одна проверка флага на апдейт.
+
+Память: tracemalloc включается по запросу, каждый следующий снимок сравнивается с предыдущим -
+так видно, что растет между снимками. Пока tracemalloc включен, аллокации заметно дороже, поэтому его стоит выключать.
+
+Classes
+--------
+CpuProfiler
+    Профилирование следующих N апдейтов или T секунд
+MemoryProfiler
+    Снимки tracemalloc и разница между ними
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+# Профилирование, про которое забыли, выключится само
+MAX_PROFILING_SECONDS = 600
+
+
+def parse_profiling_limit(text: str) -> Tuple[Optional[int], Optional[int]]:
+    """Разбирает '200' (апдейтов) или '30s' (секунд). Возвращает (апдейты, секунды)"""
+    value = text.strip().lower()
+    seconds = value.endswith("s") or value.endswith("с")
+    number = int(value[:-1] if seconds else value)
+    if number <= 0:
+        raise ValueError("Нужно положительное число")
+    if seconds and number > MAX_PROFILING_SECONDS:
+        raise ValueError(f"Профилировать можно максимум {MAX_PROFILING_SECONDS} секунд")
+    return (None, number) if seconds else (number, None)
+
+
+class CpuProfiler:
+    def __init__(self) -> None:
+        self.profile: Optional[cProfile.Profile] = None
+        self.updates_left: Optional[int] = None
+        self.started_at = 0.0
+        self.updates_done = 0
+        self.bot: Optional[Bot] = None
+        self.chat_id: Optional[int] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.profile is not None
+
+    def start(self, bot: Bot, chat_id: int, updates: Optional[int] = None, seconds: Optional[float] = None) -> None:
+        """Включает профилирование на updates апдейтов или seconds секунд. Отчет уйдет в chat_id"""
+        if self.is_active:
+            raise RuntimeError("Профилирование уже запущено")
+        self.bot = bot
+        self.chat_id = chat_id
+        self.updates_left = updates
+        self.updates_done = 0
+        self.started_at = time.monotonic()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self._timer = asyncio.create_task(self._stop_later(min(seconds or MAX_PROFILING_SECONDS, MAX_PROFILING_SECONDS)))
+        logging.warning(f"Включено профилирование CPU: апдейтов {updates}, секунд {seconds}")
+
+    async def on_update_processed(self) -> None:
+        """Вызывается мидлварью после каждого апдейта"""
+        if not self.is_active:
+            return
+        self.updates_done += 1
+        if self.updates_left is not None:
+            self.updates_left -= 1
+            if self.updates_left <= 0:
+                await self.finish()
+
+    async def _stop_later(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+        self._timer = None
+        await self.finish()
+
+    async def finish(self) -> None:
+        """Выключает профилирование и отправляет отчет"""
+        profile = self.profile
+        if profile is None:
+            return
+        profile.disable()
+        self.profile = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        elapsed = time.monotonic() - self.started_at
+        header = f"Профилирование CPU: {self.updates_done} апдейтов за {elapsed:.1f} с"
+        logging.warning(header)
+        if self.bot is None or self.chat_id is None:
+            return
+        name = f"profile-{datetime.now().strftime('%d-%m-%Y-%H-%M-%S')}"
+        await self.bot.send_document(
+            self.chat_id,
+            BufferedInputFile(self.render(profile, header).encode("utf-8"), f"{name}.txt"),
+            caption=header
+        )
+        profile.create_stats()
+        await self.bot.send_document(self.chat_id, BufferedInputFile(marshal.dumps(profile.stats), f"{name}.prof"))
+
+    @staticmethod
+    def render(profile: cProfile.Profile, header: str, limit: int = 60) -> str:
+        text = io.StringIO()
+        text.write(f"{header}\n\nПо суммарному времени (cumulative):\n")
+        stats = pstats.Stats(profile, stream=text)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        text.write("\nПо собственному времени (tottime):\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(limit)
+        return text.getvalue()
+
+
+class MemoryProfiler:
+    def __init__(self, frames: int = 10) -> None:
+        self.frames = frames
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def is_active(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        tracemalloc.start(self.frames)
+        self.snapshot = self._take_snapshot()
+        logging.warning("Включено отслеживание памяти (tracemalloc)")
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.snapshot = None
+        logging.warning("Отслеживание памяти выключено")
+
+    def diff(self, limit: int = 40) -> str:
+        """Делает снимок, сравнивает его с предыдущим и запоминает как новую точку отсчета"""
+        snapshot = self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Сейчас отслеживается {current / 2 ** 20:.1f} МиБ, пик {peak / 2 ** 20:.1f} МиБ",
+            f"Что выросло с прошлого снимка (топ {limit}):",
+            ""
+        ]
+        if self.snapshot is not None:
+            for stat in snapshot.compare_to(self.snapshot, "traceback")[:limit]:
+                lines.append(f"{stat.size_diff / 1024:+.1f} КиБ, {stat.count_diff:+d} блоков, "
+                             f"всего {stat.size / 1024:.1f} КиБ")
+                lines += [f"    {i}" for i in stat.traceback.format()]
+        lines += ["", f"Больше всего памяти сейчас (топ {limit} по строкам):", ""]
+        lines += [str(i) for i in snapshot.statistics("lineno")[:limit]]
+        self.snapshot = snapshot
+        return "\n".join(lines)
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ])
+
+
+CPU_PROFILER = CpuProfiler()
+MEMORY_PROFILER = MemoryProfiler()
@@ -0,0 +1,144 @@
+"""
+Поиск N+1 запросов.
+
+Пока активен трекер (контекстный менеджер track_queries), все SQL-запросы группируются по форме:
+текст запроса без параметров и литералов. Если запрос одной формы выполнился больше threshold раз -
+почти наверняка где-то запрос в цикле. Для каждой формы запоминается место вызова в нашем коде.
+
+В разработке трекер включается на каждый апдейт настройкой NPLUSONE_THRESHOLD
+(см. middlewares.query_tracking_middleware), в интеграционных тестах - фикстурой assert_max_queries.
+
+Classes
+--------
+StatementStats
+    Сколько раз выполнился запрос одной формы и откуда его вызвали
+QueryTracker
+    Собирает запросы и строит отчет о повторяющихся
+"""
+
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Корень проекта (папка src) - фреймы вне него (алхимия, asyncio, aiogram) в месте вызова не показываем
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Файлы со слушателями событий алхимии - их фреймы в месте вызова не нужны
+IGNORED_FILES = {os.path.abspath(__file__)}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:::\w+)?(?:\s*,\s*\?(?:::\w+)?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Форма запроса: без литералов и параметров, списки в IN схлопнуты"""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("(...)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+def _project_frames() -> List[traceback.FrameSummary]:
+    """
+    Фреймы нашего кода, от внешнего к внутреннему. Алхимия выполняет запрос в отдельном гринлете,
+    поэтому асинхронная часть стека (хэндлер, сервис, репозиторий) лежит в родительских гринлетах
+    """
+    stacks = []
+    current = greenlet.getcurrent()
+    stacks.append(traceback.extract_stack())
+    current = current.parent
+    while current is not None:
+        if current.gr_frame is not None:
+            stacks.append(traceback.extract_stack(current.gr_frame))
+        current = current.parent
+    frames = [frame for stack in reversed(stacks) for frame in stack]
+    return [
+        i for i in frames
+        if i.filename.startswith(PROJECT_ROOT) and os.path.abspath(i.filename) not in IGNORED_FILES
+        and "site-packages" not in i.filename
+    ]
+
+
+def call_site(depth: int = 3) -> str:
+    """Несколько ближайших к запросу фреймов нашего кода: 'database/...:120 <- service/...:80'"""
+    frames = _project_frames()[-depth:]
+    return " <- ".join(
+        f"{os.path.relpath(i.filename, PROJECT_ROOT)}:{i.lineno} {i.name}" for i in reversed(frames)
+    ) or "неизвестно"
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    call_sites: Counter = field(default_factory=Counter)
+
+
+class QueryTracker:
+    def __init__(self, name: str = "", threshold: int = 5):
+        self.name = name
+        self.threshold = threshold
+        self.statements: Dict[str, StatementStats] = dict()
+
+    @property
+    def total(self) -> int:
+        return sum(i.count for i in self.statements.values())
+
+    def record(self, statement: str) -> None:
+        stats = self.statements.setdefault(normalize_statement(statement), StatementStats())
+        stats.count += 1
+        stats.call_sites[call_site()] += 1
+
+    def repeated(self, threshold: Optional[int] = None) -> List[Tuple[str, StatementStats]]:
+        """Формы запросов, которые выполнились больше threshold раз, от самых частых"""
+        limit = self.threshold if threshold is None else threshold
+        result = [(shape, stats) for shape, stats in self.statements.items() if stats.count > limit]
+        return sorted(result, key=lambda x: x[1].count, reverse=True)
+
+    def report(self, threshold: Optional[int] = None) -> str:
+        lines = [f"{self.name}: {self.total} SQL-запросов"]
+        for shape, stats in self.repeated(threshold):
+            lines.append(f"  {stats.count} раз: {shape[:300]}")
+            for site, count in stats.call_sites.most_common(3):
+                lines.append(f"    {count} раз из {site}")
+        return "\n".join(lines)
+
+
+current_tracker: ContextVar[Optional[QueryTracker]] = ContextVar("current_tracker", default=None)
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                           executemany: bool) -> None:
+    tracker = current_tracker.get()
+    if tracker is not None:
+        tracker.record(statement)
+
+
+def instrument_query_tracking() -> None:
+    """Подписывается на события всех движков алхимии. Повторный вызов ничего не делает"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def track_queries(name: str = "", threshold: int = 5) -> Iterator[QueryTracker]:
+    """Собирает SQL-запросы, выполненные внутри блока (в том числе в вызванных корутинах)"""
+    instrument_query_tracking()
+    tracker = QueryTracker(name, threshold)
+    token = current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        current_tracker.reset(token)
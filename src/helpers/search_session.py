@@ -0,0 +1,93 @@
+"""
+Сессии поиска для пагинации.
+
+При первом поиске упорядоченный список id найденных объектов сохраняется под коротким токеном,
+а в колбэки кнопок пагинации попадает только токен и номер страницы. Поэтому при листании
+запрос не выполняется заново, а длинный запрос не обрезается лимитом телеграма в 64 байта на колбэк.
+
+Classes
+--------
+SearchSessionStore
+    Интерфейс хранилища сессий поиска
+RedisSearchSessionStore
+    Хранит сессии в редисе с TTL - чтобы они переживали перезапуск бота и были общими для реплик
+MemorySearchSessionStore
+    Хранит сессии в памяти процесса - для запуска без редиса
+"""
+
+import json
+import secrets
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional, Dict, Tuple
+
+from redis.asyncio import Redis
+
+from configs.config import Settings, RedisConfig
+
+KEY_PREFIX = "zoo:search"
+
+
+class SearchSessionStore(ABC):
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def save(self, ids: List[int]) -> str:
+        """Сохраняет список id и возвращает токен сессии"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, token: str) -> Optional[List[int]]:
+        """Возвращает список id по токену или None, если сессия устарела"""
+        raise NotImplementedError
+
+    @staticmethod
+    def new_token() -> str:
+        return secrets.token_urlsafe(6)
+
+
+class RedisSearchSessionStore(SearchSessionStore):
+    def __init__(self, redis: Redis, ttl: int):
+        super().__init__(ttl)
+        self.redis = redis
+
+    async def save(self, ids: List[int]) -> str:
+        token = self.new_token()
+        await self.redis.set(f"{KEY_PREFIX}:{token}", json.dumps(ids), ex=self.ttl)
+        return token
+
+    async def get(self, token: str) -> Optional[List[int]]:
+        value = await self.redis.get(f"{KEY_PREFIX}:{token}")
+        return None if value is None else json.loads(value)
+
+
+class MemorySearchSessionStore(SearchSessionStore):
+    def __init__(self, ttl: int):
+        super().__init__(ttl)
+        self._sessions: Dict[str, Tuple[float, List[int]]] = dict()
+
+    async def save(self, ids: List[int]) -> str:
+        self._delete_expired()
+        token = self.new_token()
+        self._sessions[token] = (time.monotonic() + self.ttl, ids)
+        return token
+
+    async def get(self, token: str) -> Optional[List[int]]:
+        session = self._sessions.get(token)
+        if session is None or session[0] < time.monotonic():
+            return None
+        return session[1]
+
+    def _delete_expired(self) -> None:
+        now = time.monotonic()
+        for token in [token for token, (expires_at, _) in self._sessions.items() if expires_at < now]:
+            del self._sessions[token]
+
+
+def create_search_session_store() -> SearchSessionStore:
+    """Возвращает хранилище в редисе или в памяти - так же, как выбирается хранилище для FSM"""
+    settings = Settings()
+    if settings.use_redis:
+        return RedisSearchSessionStore(Redis.from_url(RedisConfig().get_connection_str()), settings.search_session_ttl)
+    return MemorySearchSessionStore(settings.search_session_ttl)
@@ -0,0 +1,166 @@
+"""
+Журнал медленных SQL-запросов.
+
+Запросы дольше порога SLOW_QUERY_MS попадают в кольцевой буфер на SLOW_QUERY_LOG_SIZE записей:
+текст запроса, типы параметров (без значений), длительность и место вызова в нашем коде -
+обычно это метод репозитория из database/orm_repository.py и сервис, который его вызвал.
+Для доли SLOW_QUERY_EXPLAIN_RATE медленных запросов в отдельном соединении снимается план:
+EXPLAIN (ANALYZE, BUFFERS) для SELECT и просто EXPLAIN для остальных - изменяющие запросы повторно не выполняются.
+Буфер скачивается разработчиком из меню /info, а в воркерах, у которых меню нет, хватает предупреждений в логе.
+
+Classes
+--------
+SlowQuery
+    Запись о медленном запросе
+SlowQueryLog
+    Кольцевой буфер медленных запросов и снятие планов
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from database.engine import get_engine_async
+from helpers.query_tracker import IGNORED_FILES, call_site
+
+IGNORED_FILES.add(os.path.abspath(__file__))
+
+MAX_STATEMENT_LENGTH = 10000
+
+Explainer = Callable[[str, Any, bool], Awaitable[str]]
+
+
+def _first_word(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else ""
+
+
+def parameters_shape(parameters: Any, executemany: bool = False) -> str:
+    """Типы параметров без значений: '(int, str, NoneType)'"""
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = parameters_shape(parameters[0]) if parameters else "()"
+        return f"{len(parameters)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+async def explain_in_side_connection(statement: str, parameters: Any, analyze: bool) -> str:
+    """Снимает план в отдельном соединении, транзакция откатывается"""
+    options = "(ANALYZE, BUFFERS) " if analyze else ""
+    async with get_engine_async().connect() as connection:
+        result = await connection.exec_driver_sql(f"EXPLAIN {options}{statement}", parameters)
+        plan = "\n".join(str(row[0]) for row in result)
+        await connection.rollback()
+    return plan
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    parameters: str
+    duration: float
+    call_site: str
+    happened_at: datetime = field(default_factory=datetime.now)
+    plan: Optional[str] = None
+
+    def render(self) -> str:
+        lines = [
+            f"{self.happened_at:%d.%m.%Y %H:%M:%S} {self.duration * 1000:.0f} мс из {self.call_site}",
+            f"Параметры: {self.parameters}",
+            self.statement,
+        ]
+        if self.plan is not None:
+            lines += ["План:", self.plan]
+        return "\n".join(lines)
+
+
+class SlowQueryLog:
+    def __init__(
+            self,
+            threshold: float = 0.2,
+            size: int = 200,
+            explain_rate: float = 0.0,
+            explainer: Explainer = explain_in_side_connection
+    ):
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.explainer = explainer
+        self.queries: Deque[SlowQuery] = deque(maxlen=size)
+        self._explaining: Set[asyncio.Task] = set()
+
+    def configure(self, threshold: float, size: int, explain_rate: float) -> None:
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.queries = deque(self.queries, maxlen=size)
+
+    def record(self, statement: str, parameters: Any, duration: float, executemany: bool = False) -> None:
+        if duration < self.threshold or _first_word(statement) == "EXPLAIN":
+            return
+        query = SlowQuery(statement[:MAX_STATEMENT_LENGTH], parameters_shape(parameters, executemany), duration,
+                          call_site(depth=4))
+        self.queries.append(query)
+        logging.warning(f"Медленный запрос: {duration * 1000:.0f} мс из {query.call_site}")
+        if not executemany and self._should_explain():
+            self._start_explain(query, statement, parameters)
+
+    def _should_explain(self) -> bool:
+        # Одновременно снимаем не больше одного плана, чтобы не нагружать базу, которая и так тормозит
+        return self.explain_rate > 0 and not self._explaining and random.random() < self.explain_rate
+
+    def _start_explain(self, query: SlowQuery, statement: str, parameters: Any) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._explain(query, statement, parameters))
+        self._explaining.add(task)
+        task.add_done_callback(self._explaining.discard)
+
+    async def _explain(self, query: SlowQuery, statement: str, parameters: Any) -> None:
+        # WITH может содержать изменяющие CTE, поэтому ANALYZE - только для чистого SELECT
+        analyze = _first_word(statement) == "SELECT"
+        try:
+            query.plan = await self.explainer(statement, parameters, analyze)
+        except Exception as e:
+            query.plan = f"Не удалось снять план: {e!r}"
+            logging.warning(f"Не удалось снять план медленного запроса: {e!r}")
+
+    def render(self) -> str:
+        queries: List[SlowQuery] = list(self.queries)
+        header = f"Медленные запросы (дольше {self.threshold * 1000:.0f} мс), последние {len(queries)}"
+        return "\n\n".join([header] + [i.render() for i in reversed(queries)])
+
+
+SLOW_QUERIES = SlowQueryLog()
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                           executemany: bool) -> None:
+    conn.info.setdefault("zoo_slow_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                          executemany: bool) -> None:
+    starts = conn.info.get("zoo_slow_query_start")
+    if starts:
+        SLOW_QUERIES.record(statement, parameters, time.perf_counter() - starts.pop(), executemany)
+
+
+def instrument_slow_queries(threshold: float, size: int, explain_rate: float) -> None:
+    """Подписывается на события всех движков алхимии. Повторный вызов только меняет настройки"""
+    SLOW_QUERIES.configure(threshold, size, explain_rate)
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,152 @@
+"""
+Кэш поиска в Стаффе для логина.
+
+Каждое сообщение из незарегистрированного чата приводит к поиску почт по нику в Стаффе.
+Найденные почты кэшируются на staff_cache_ttl, а пустой результат - на staff_negative_cache_ttl,
+поэтому посторонний, который пишет боту, не порождает запрос в Стафф на каждое сообщение.
+Одновременные поиски одного ника внутри процесса схлопываются в один запрос,
+а ходить в Стафф при логине одного пользователя можно не чаще раза в staff_login_cooldown секунд -
+ответы из кэша кулдаун не тратят.
+
+Classes
+--------
+StaffLookupCache
+    Интерфейс хранилища результатов поиска и кулдаунов
+RedisStaffLookupCache
+    Хранит в редисе - общий кэш для всех реплик
+MemoryStaffLookupCache
+    Хранит в памяти процесса - для запуска без редиса
+StaffLookup
+    Поиск почт по нику: кэш, single-flight и кулдаун
+"""
+
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from configs.config import Settings, RedisConfig
+from helpers import staffhelper
+
+KEY_PREFIX = "zoo:staff"
+
+
+class StaffLookupCache(ABC):
+    @abstractmethod
+    async def get(self, username: str) -> Optional[List[str]]:
+        """Возвращает закэшированные почты (пустой список - если в прошлый раз никого не нашли) или None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, username: str, emails: List[str], ttl: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def acquire_cooldown(self, user_id: int, cooldown: int) -> bool:
+        """Возвращает True, если пользователь не пытался залогиниться последние cooldown секунд"""
+        raise NotImplementedError
+
+
+class RedisStaffLookupCache(StaffLookupCache):
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    async def get(self, username: str) -> Optional[List[str]]:
+        value = await self.redis.get(f"{KEY_PREFIX}:emails:{username}")
+        return None if value is None else json.loads(value)
+
+    async def set(self, username: str, emails: List[str], ttl: int) -> None:
+        await self.redis.set(f"{KEY_PREFIX}:emails:{username}", json.dumps(emails), ex=ttl)
+
+    async def acquire_cooldown(self, user_id: int, cooldown: int) -> bool:
+        return bool(await self.redis.set(f"{KEY_PREFIX}:cooldown:{user_id}", 1, ex=cooldown, nx=True))
+
+
+class MemoryStaffLookupCache(StaffLookupCache):
+    def __init__(self) -> None:
+        self._emails: Dict[str, Tuple[float, List[str]]] = dict()
+        self._cooldowns: Dict[int, float] = dict()
+
+    async def get(self, username: str) -> Optional[List[str]]:
+        cached = self._emails.get(username)
+        if cached is None or cached[0] < time.monotonic():
+            return None
+        return cached[1]
+
+    async def set(self, username: str, emails: List[str], ttl: int) -> None:
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._emails.items() if expires_at < now]:
+            del self._emails[key]
+        self._emails[username] = (now + ttl, emails)
+
+    async def acquire_cooldown(self, user_id: int, cooldown: int) -> bool:
+        now = time.monotonic()
+        for key in [key for key, expires_at in self._cooldowns.items() if expires_at < now]:
+            del self._cooldowns[key]
+        if user_id in self._cooldowns:
+            return False
+        self._cooldowns[user_id] = now + cooldown
+        return True
+
+
+class StaffLookup:
+    """Поиск почт сотрудника по нику в телеграме с кэшем перед Стаффом"""
+
+    def __init__(
+            self,
+            cache: StaffLookupCache,
+            ttl: int,
+            negative_ttl: int,
+            cooldown: int,
+            search: Callable[[str], Awaitable[Optional[List[str]]]] = staffhelper.search_emails
+    ):
+        self.cache = cache
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cooldown = cooldown
+        self.search = search
+        self._in_flight: Dict[str, asyncio.Future] = dict()
+
+    async def try_login(self, user_id: int) -> bool:
+        """Возвращает False, если пользователь слишком часто пытается залогиниться через Стафф"""
+        return await self.cache.acquire_cooldown(user_id, self.cooldown)
+
+    async def get_cached(self, username: str) -> Optional[List[str]]:
+        """Почты из кэша, без запроса в Стафф. None - если в кэше ничего нет"""
+        return await self.cache.get(username.lower())
+
+    async def search_emails(self, username: str) -> Optional[List[str]]:
+        """Возвращает почты по нику. None - если Стафф недоступен, такой результат не кэшируется"""
+        username = username.lower()
+        cached = await self.cache.get(username)
+        if cached is not None:
+            return cached
+        in_flight = self._in_flight.get(username)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[username] = future
+        try:
+            emails = await self.search(username)
+            if emails is not None:
+                await self.cache.set(username, emails, self.ttl if emails else self.negative_ttl)
+            future.set_result(emails)
+            return emails
+        except Exception as e:
+            future.set_exception(e)
+            # Чтобы не было предупреждения о неполученном исключении, если никто не ждал
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[username]
+
+
+def create_staff_lookup() -> StaffLookup:
+    """Кэш в редисе или в памяти - так же, как выбирается хранилище для FSM"""
+    settings = Settings()
+    cache = RedisStaffLookupCache(Redis.from_url(RedisConfig().get_connection_str())) if settings.use_redis \
+        else MemoryStaffLookupCache()
+    return StaffLookup(cache, settings.staff_cache_ttl, settings.staff_negative_cache_ttl, settings.staff_login_cooldown)
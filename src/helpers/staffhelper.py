@@ -1,6 +1,22 @@
+"""
+Клиент для АПИ Стаффа.
+
+Classes
+--------
+StaffApiError
+    Стафф не ответил или ответил ошибкой
+CircuitBreaker
+    Размыкатель: после серии ошибок перестает ходить в Стафф на время, чтобы хэндлеры не висели на таймаутах
+StaffClient
+    Клиент с кэшем токена паспорта, общим пулом соединений, таймаутами и повторами с джиттером
+"""
+
+import asyncio
 import datetime
 import logging
-from typing import Optional, List, Any
+import random
+import time
+from typing import Optional, List, Any, Dict
 
 import httpx
 
@@ -9,60 +25,175 @@ from configs import config
 CONFIG = config.Settings()
 PASSPORT_URL = "https://passport.skbkontur.ru"
 STAFF_URL = "https://staff.skbkontur.ru"
+PATCH_MAX_DAYS = 7
+# За сколько дней назад максимум можно запросить изменения в /api/Users/patch
 
 
-async def get_staff_token() -> Optional[str]:
-    """Получает в паспорте токен для запросов в АПИ Стаффа"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{PASSPORT_URL}/connect/token",
-            data={
-                "grant_type": "client_credentials",
-                "scope": "profiles",
-            },
-            auth=httpx.BasicAuth(CONFIG.staff_client_id, CONFIG.staff_client_secret),
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
-    if response.status_code == 200:
-        return response.json()["access_token"]
-    else:
-        logging.error(f"Ошибка при запросе токена: {response.status_code}")
-        return None
+class StaffApiError(Exception):
+    pass
 
 
-async def search_emails(query: str) -> Optional[List[str]]:
-    """Ищет по всей инфе о сотруднике в Стаффе и возвращает почты действующих сотрудников"""
-    token = await get_staff_token()
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{STAFF_URL}/api/Suggest/bytype",
-            params={"Q": query, "Types": 7},
-            headers={"Authorization": f"Bearer {token}"},
-        )
-    if response.status_code == 200:
-        data = response.json()["items"]
-        if len(data) == 0:
-            return []
-        else:
-            return [item["email"] for item in data if item["status"] != "dismissed"]
-    else:
-        logging.error(f"Ошибка при поиске пользователей: {response.status_code}")
-        return None
+class CircuitBreaker:
+    """Размыкается после failure_threshold ошибок подряд и через reset_timeout пропускает один пробный запрос"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.is_open:
+            return False
+        # Полуоткрытое состояние: пропускаем пробный запрос, а до его результата остальные ждут следующего окна
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logging.warning(f"Стафф ответил ошибкой {self.failures} раз подряд, запросы приостановлены")
+            self.opened_at = time.monotonic()
+
+
+class StaffClient:
+    """Клиент Стаффа. Один на процесс: токен и соединения переиспользуются между запросами"""
 
+    def __init__(
+            self,
+            client_id: str,
+            client_secret: str,
+            timeout: httpx.Timeout = httpx.Timeout(5.0, connect=2.0),
+            retries: int = 2,
+            backoff: float = 0.2,
+            breaker: Optional[CircuitBreaker] = None,
+            transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
 
-async def get_dismissed_users_emails(from_days_ago: int) -> set[Any]:
-    if from_days_ago >= 7:
-        raise ValueError("Данный метод подходит, только если мы берем обновления максимум за 7 дней")
-    from_date = datetime.datetime.now() - datetime.timedelta(days=from_days_ago)
-    token = await get_staff_token()
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{STAFF_URL}/api/Users/patch",
-            params={"LastModifedDate": str(from_date)},
-            headers={"Authorization": f"Bearer {token}"},
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                transport=self.transport
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def get_token(self) -> str:
+        """Возвращает токен паспорта из кэша, а за минуту до истечения запрашивает новый"""
+        if self._token is not None and time.monotonic() < self._token_expires_at:
+            return self._token
+        async with self._token_lock:
+            if self._token is not None and time.monotonic() < self._token_expires_at:
+                return self._token
+            response = await self._send(
+                "POST",
+                f"{PASSPORT_URL}/connect/token",
+                data={
+                    "grant_type": "client_credentials",
+                    "scope": "profiles",
+                },
+                auth=httpx.BasicAuth(self.client_id, self.client_secret),
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+            if response.status_code != 200:
+                raise StaffApiError(f"Ошибка при запросе токена: {response.status_code}")
+            body = response.json()
+            self._token = body["access_token"]
+            self._token_expires_at = time.monotonic() + max(int(body.get("expires_in", 300)) - 60, 0)
+            return self._token
+
+    async def get(self, url: str, params: Dict[str, Any]) -> httpx.Response:
+        """GET в Стафф с токеном. Если токен отозвали раньше срока - один раз запрашивает новый"""
+        token = await self.get_token()
+        response = await self._send("GET", url, params=params, headers={"Authorization": f"Bearer {token}"})
+        if response.status_code == 401:
+            self._token = None
+            token = await self.get_token()
+            response = await self._send("GET", url, params=params, headers={"Authorization": f"Bearer {token}"})
+        if response.status_code != 200:
+            raise StaffApiError(f"Стафф ответил {response.status_code} на {url}")
+        return response
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Отправляет запрос с повторами при сетевых ошибках, 429 и 5xx"""
+        if not self.breaker.allow():
+            raise StaffApiError("Стафф временно недоступен, запросы приостановлены")
+        for attempt in range(self.retries + 1):
+            error: Optional[str] = None
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                if response.status_code != 429 and response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                error = f"статус {response.status_code}"
+            except httpx.TransportError as e:
+                error = repr(e)
+            if attempt < self.retries:
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                logging.warning(f"Запрос в Стафф не удался ({error}), повтор через {delay:.2f} с")
+                await asyncio.sleep(delay)
+        self.breaker.record_failure()
+        raise StaffApiError(f"Стафф не ответил на {url}: {error}")
+
+    async def search_emails(self, query: str) -> List[str]:
+        """Ищет по всей инфе о сотруднике в Стаффе и возвращает почты действующих сотрудников"""
+        response = await self.get(f"{STAFF_URL}/api/Suggest/bytype", params={"Q": query, "Types": 7})
+        return [item["email"] for item in response.json()["items"] if item["status"] != "dismissed"]
+
+    async def get_fired_users_emails(self, since: datetime.datetime) -> List[str]:
+        """Возвращает почты сотрудников, уволенных после since"""
+        if datetime.datetime.now() - since >= datetime.timedelta(days=PATCH_MAX_DAYS):
+            raise ValueError(f"Изменения можно запросить максимум за {PATCH_MAX_DAYS} дней")
+        response = await self.get(f"{STAFF_URL}/api/Users/patch", params={"LastModifedDate": str(since)})
+        return [i["email"] for i in response.json()["firedUsers"]]
+
+
+_staff_client: Optional[StaffClient] = None
+
+
+def get_staff_client() -> StaffClient:
+    global _staff_client
+    if _staff_client is None:
+        _staff_client = StaffClient(
+            CONFIG.staff_client_id,
+            CONFIG.staff_client_secret,
+            timeout=httpx.Timeout(CONFIG.staff_timeout, connect=min(CONFIG.staff_timeout, 2.0))
         )
-    if response.status_code != 200:
-        logging.error(f"Ошибка при получении уволенных пользователей: {response.status_code} {response.json()}")
-        return set()
-    fired_users = response.json()["firedUsers"]
-    return set([i["email"] for i in fired_users])
+    return _staff_client
+
+
+async def search_emails(query: str) -> Optional[List[str]]:
+    """Ищет почты действующих сотрудников. None - если Стафф недоступен"""
+    try:
+        return await get_staff_client().search_emails(query)
+    except StaffApiError as e:
+        logging.error(f"Ошибка при поиске пользователей: {e}")
+        return None
@@ -8,18 +8,25 @@ Paginator
     Методы класса неплохо покрыты тестами.
 """
 
+import asyncio
+import logging
 import math
 from datetime import datetime
 from enum import StrEnum
 from typing import Optional, BinaryIO, Any
 
-from aiogram import types
+from aiogram import types, Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import ReplyKeyboardMarkup, InlineKeyboardMarkup, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiogram_calendar import SimpleCalendar
+from aiohttp import web
 
 import helpers.texthelper as texthelper
-from configs.config import Settings
+from configs.config import Settings, WebhookSettings
+from helpers.metrics import TelegramRequestMetrics
 from domain.models import Visitor
 
 SEPARATOR_FOR_CALLBACK_DATA: str = ','
@@ -27,6 +34,17 @@ SEPARATOR_FOR_CALLBACK_DATA: str = ','
 locale = Settings().locale_for_calendar
 
 
+def create_bot(token: Optional[str] = None) -> Bot:
+    """Создает бота. Если задан telegram_api_url, запросы пойдут не в телеграм, а на этот адрес"""
+    settings = Settings()
+    session = None
+    if settings.telegram_api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.telegram_api_url))
+    bot = Bot(token=token or settings.token, session=session)
+    bot.session.middleware(TelegramRequestMetrics())
+    return bot
+
+
 def get_calendar_ru() -> SimpleCalendar:
     return SimpleCalendar(show_alerts=True, locale=locale, cancel_btn="Отмена", today_btn="Этот месяц")
 
@@ -74,16 +92,23 @@ class Paginator:
                f"visible_results={self.visible_results}, " \
                f"page_elements={self.page_elements}, " \
                f"pages={self.pages}, " \
-               f"len objects={len(self.objects)})"
+               f"total={self.total})"
 
     def __str__(self) -> str:
         return f"Пагинатор для страницы {self.page}: " \
                f"количество элементов {self.page_elements}, " \
                f"количество видимых страниц {self.visible_results}"
 
-    def __init__(self, page: int, objects: list, visible_results: int = 5, page_elements: int = 5):
+    def __init__(self, page: int, objects: list, visible_results: int = 5, page_elements: int = 5,
+                 total: Optional[int] = None):
+        """
+        total - если в objects уже только объекты страницы page, а всего их total:
+        так листаются списки, которые целиком из БД не достаются
+        """
         self.objects = objects
-        self.pages = math.ceil(len(objects) / visible_results)
+        self.total = len(objects) if total is None else total
+        self.is_single_page = total is not None
+        self.pages = math.ceil(self.total / visible_results)
         self.visible_results = visible_results
         self.page_elements = page_elements
         self.page = page
@@ -117,6 +142,8 @@ class Paginator:
 
     def get_objects_on_page(self) -> list:
         """Возвращает список объектов на странице"""
+        if self.is_single_page:
+            return self.objects
         left, right = self.get_array_indexes()
         return self.objects[left: right + 1]
 
@@ -128,7 +155,7 @@ class Paginator:
 
     def result_message(self) -> str:
         """Формирует сообщение о результате поиска"""
-        count = len(self.objects)
+        count = self.total
         return f"Всего найден{texthelper.get_word_ending(count, ['', 'о', 'о'])} " \
                f"{count} результат{texthelper.get_word_ending(count, ['', 'а', 'ов'])}:\r\n\r\n"
 
@@ -162,20 +189,42 @@ def nameof(field: Any) -> str:
     """
     return str(field).split(".")[1]
 
-# async def start_webhook(bot: Bot, dp: Dispatcher, webhook_path: str, webhook_secret: str, host: str, port: int) -> None:
-#     """Запускает приложение в режиме вебкуха"""
-#     from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
-#     from aiohttp import web
-#     webhook_route = "/webhook"
-#     webhook_url = f"{webhook_path}{webhook_route}"
-#     logging.info(f"Телеграму передан адрес вебхука: {webhook_url}")
-#     await bot.set_webhook(webhook_url, secret_token=webhook_secret)
-#     app = web.Application()
-#     webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot,
-#                                                     secret_token=webhook_secret)
-#     webhook_requests_handler.register(app, path=webhook_route)
-#     setup_application(app, dp, bot=bot)
-#     logging.info(
-#         f"Приложение запустилось на сервере. Хост: {host}, порт: {port}. "
-#         f"URL вебхука: {webhook_url}")
-#     await web._run_app(app, host=host, port=port)
+
+async def start_webhook(
+        bot: Bot,
+        dp: Dispatcher,
+        webhook_settings: WebhookSettings,
+        allowed_updates: Optional[list[str]] = None
+) -> None:
+    """
+    Запускает приложение в режиме вебкуха.
+    Телеграму сразу отвечаем 200, а апдейт обрабатываем в фоне - иначе медленный хэндлер
+    задерживает доставку следующих апдейтов. Запросы без правильного секрета отклоняются
+    """
+    webhook_url = webhook_settings.get_webhook_url()
+    await bot.set_webhook(
+        webhook_url,
+        secret_token=webhook_settings.zoo_webhook_secret,
+        allowed_updates=allowed_updates if allowed_updates is not None else dp.resolve_used_update_types()
+    )
+    logging.info(f"Телеграму передан адрес вебхука: {webhook_url}")
+    app = web.Application()
+    webhook_requests_handler = SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=webhook_settings.zoo_webhook_secret
+    )
+    webhook_requests_handler.register(app, path=webhook_settings.zoo_webhook_route)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=webhook_settings.zoo_host, port=webhook_settings.zoo_port)
+    await site.start()
+    logging.info(
+        f"Приложение запустилось на сервере. Хост: {webhook_settings.zoo_host}, порт: {webhook_settings.zoo_port}. "
+        f"URL вебхука: {webhook_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
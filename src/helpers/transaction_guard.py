@@ -0,0 +1,96 @@
+"""
+Для разработки: проверка, что пока открыта транзакция, в сеть никто не ходит.
+
+Соединение из пула занято, пока открыта транзакция OrmUnitOfWork. Если внутри нее ждать ответа телеграма или Стаффа,
+соединение простаивает idle in transaction, и пул кончается из-за сети, а не из-за SQL.
+OrmUnitOfWork отмечает открытую транзакцию в contextvar задачи, а install_transaction_guard оборачивает
+aiohttp.ClientSession (через него ходит aiogram) и httpx.AsyncClient (клиент Стаффа):
+если запрос уходит при открытой транзакции, в лог пишется, где она открыта и откуда запрос, а в режиме raise
+запрос еще и падает с NetworkInTransactionError. Включается настройкой TRANSACTION_GUARD=log или raise.
+
+Classes
+--------
+NetworkInTransactionError
+    Сетевой запрос при открытой транзакции в режиме raise
+"""
+
+import functools
+import logging
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import httpx
+
+from helpers.query_tracker import call_site
+
+GUARD_MODES = ("log", "raise")
+
+_open_transaction: ContextVar[Optional[str]] = ContextVar("open_transaction", default=None)
+_mode: Optional[str] = None
+
+
+class NetworkInTransactionError(RuntimeError):
+    pass
+
+
+def transaction_started() -> Token:
+    """Отмечает, что задача открыла транзакцию. Место открытия ищется, только если проверка включена"""
+    return _open_transaction.set(call_site() if _mode is not None else "")
+
+
+def transaction_finished(token: Token) -> None:
+    _open_transaction.reset(token)
+
+
+def describe_request(method: Any, url: Any) -> str:
+    """'POST api.telegram.org/.../sendMessage' - без остального пути, в нем у телеграма токен бота"""
+    parts = urlsplit(str(url))
+    return f"{method} {parts.hostname}/.../{parts.path.rsplit('/', 1)[-1]}"
+
+
+def check_no_transaction(request: str) -> None:
+    """Пишет в лог или падает, если у текущей задачи открыта транзакция"""
+    opened_at = _open_transaction.get()
+    if _mode is None or opened_at is None:
+        return
+    message = f"Сетевой запрос {request} при открытой транзакции. Транзакция открыта: {opened_at or 'неизвестно'}. " \
+              f"Запрос: {call_site()}"
+    if _mode == "raise":
+        raise NetworkInTransactionError(message)
+    logging.warning(message)
+
+
+def _guarded(send: Callable[..., Any], describe: Callable[..., str]) -> Callable[..., Any]:
+    @functools.wraps(send)
+    async def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        check_no_transaction(describe(*args, **kwargs))
+        return await send(self, *args, **kwargs)
+
+    wrapper.__transaction_guard__ = True  # type: ignore
+    return wrapper
+
+
+def install_transaction_guard(mode: str) -> None:
+    """Включает проверку для aiohttp и httpx. Повторный вызов только меняет режим"""
+    global _mode
+    if mode not in GUARD_MODES:
+        raise ValueError(f"Режим проверки должен быть одним из {GUARD_MODES}, а не {mode}")
+    _mode = mode
+    if not getattr(aiohttp.ClientSession._request, "__transaction_guard__", False):
+        aiohttp.ClientSession._request = _guarded(  # type: ignore
+            aiohttp.ClientSession._request,
+            lambda method, url, *args, **kwargs: describe_request(method, url)
+        )
+    if not getattr(httpx.AsyncClient.send, "__transaction_guard__", False):
+        httpx.AsyncClient.send = _guarded(  # type: ignore
+            httpx.AsyncClient.send,
+            lambda request, *args, **kwargs: describe_request(request.method, request.url)
+        )
+
+
+def uninstall_transaction_guard() -> None:
+    """Выключает проверку, обертки остаются, но ничего не делают"""
+    global _mode
+    _mode = None
@@ -0,0 +1,112 @@
+"""
+Очередь апдейтов в Redis Streams.
+
+Приемник (поллинг или вебхук) только складывает сырые апдейты в стримы, а обрабатывают их
+воркеры workers.update_consumer. Стримов несколько (партиции), партиция выбирается по chat_id,
+и каждую партицию читает ровно один воркер - так апдейты одного чата обрабатываются по порядку.
+
+Classes
+--------
+UpdateStream
+    Обертка над стримами: публикация, чтение через consumer group, подтверждение и перехват зависших записей
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+STREAM_PREFIX = "zoo:updates"
+GROUP_NAME = "zoo-workers"
+
+# Запись стрима: партиция, id записи в стриме, сырой апдейт в json
+StreamEntry = Tuple[int, str, str]
+
+
+def partition_for(chat_id: Optional[int], partitions: int) -> int:
+    """Возвращает партицию для чата. Апдейты без чата складываются в нулевую"""
+    return chat_id % partitions if chat_id is not None else 0
+
+
+def owned_partitions(worker_index: int, workers: int, partitions: int) -> List[int]:
+    """Возвращает партиции, которые читает воркер с определенным номером"""
+    if not 0 <= worker_index < workers:
+        raise ValueError(f"Номер воркера должен быть от 0 до {workers - 1}, а не {worker_index}")
+    return [i for i in range(partitions) if i % workers == worker_index]
+
+
+class UpdateStream:
+    """Стримы с апдейтами, разбитые на партиции по chat_id"""
+
+    def __init__(self, redis: Redis, partitions: int, max_len: int = 100000):
+        self.redis = redis
+        self.partitions = partitions
+        self.max_len = max_len
+
+    @classmethod
+    def from_url(cls, url: str, partitions: int) -> 'UpdateStream':
+        return cls(Redis.from_url(url, decode_responses=True), partitions)
+
+    @staticmethod
+    def stream_key(partition: int) -> str:
+        return f"{STREAM_PREFIX}:{partition}"
+
+    def _partition_of(self, stream_key: str) -> int:
+        return int(stream_key.rsplit(":", 1)[1])
+
+    async def publish(self, chat_id: Optional[int], raw_update: str) -> str:
+        key = self.stream_key(partition_for(chat_id, self.partitions))
+        return await self.redis.xadd(key, {"update": raw_update}, maxlen=self.max_len, approximate=True)
+
+    async def ensure_groups(self, partitions: Iterable[int]) -> None:
+        """Создает consumer group для партиций, если ее еще нет"""
+        for partition in partitions:
+            try:
+                await self.redis.xgroup_create(self.stream_key(partition), GROUP_NAME, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def read(self, consumer: str, partitions: Iterable[int], count: int, block_ms: Optional[int]) -> \
+            List[StreamEntry]:
+        """Читает новые записи из партиций"""
+        streams = {self.stream_key(i): ">" for i in partitions}
+        response = await self.redis.xreadgroup(GROUP_NAME, consumer, streams, count=count, block=block_ms)
+        result = []
+        for stream_key, entries in response or []:
+            partition = self._partition_of(stream_key)
+            result += [(partition, entry_id, fields["update"]) for entry_id, fields in entries if fields]
+        return result
+
+    async def read_pending(self, consumer: str, start_ids: Dict[int, str], count: int) -> \
+            Tuple[List[StreamEntry], Dict[int, str]]:
+        """
+        Читает записи, уже выданные этому воркеру, но не подтвержденные (например, воркер упал посреди обработки),
+        с id больше start_ids (для партиции "0" - с начала). Вторым значением возвращает, с каких id читать
+        следующую пачку: партиций, где такие записи кончились, в нем нет
+        """
+        streams = {self.stream_key(partition): entry_id for partition, entry_id in start_ids.items()}
+        response = await self.redis.xreadgroup(GROUP_NAME, consumer, streams, count=count)
+        result, next_ids = [], dict()
+        for stream_key, entries in response or []:
+            if not entries:
+                continue
+            partition = self._partition_of(stream_key)
+            # Записи, которые успели удалить из стрима, приходят без полей - их пропускаем, но id учитываем
+            result += [(partition, entry_id, fields["update"]) for entry_id, fields in entries if fields]
+            next_ids[partition] = entries[-1][0]
+        return result, next_ids
+
+    async def claim_stale(self, consumer: str, partition: int, min_idle_ms: int, count: int) -> List[StreamEntry]:
+        """Забирает себе записи, которые слишком долго висят неподтвержденными у других воркеров"""
+        response = await self.redis.xautoclaim(
+            self.stream_key(partition), GROUP_NAME, consumer, min_idle_time=min_idle_ms, count=count
+        )
+        entries = response[1]
+        return [(partition, entry_id, fields["update"]) for entry_id, fields in entries if fields]
+
+    async def ack(self, partition: int, entry_id: str) -> None:
+        await self.redis.xack(self.stream_key(partition), GROUP_NAME, entry_id)
+
+    async def close(self) -> None:
+        await self.redis.close()
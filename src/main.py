@@ -1,15 +1,28 @@
 import asyncio
 import logging
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Dispatcher, types
 from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.fsm.storage.memory import MemoryStorage
-from configs.config import RedisConfig, Settings
+from aiogram.filters import ExceptionTypeFilter
+from configs.config import RedisConfig, Settings, PostgresSettings, WebhookSettings
 from handlers import actions, add_resource, cancel, edit, developer, search, take, users
+from helpers import tghelper
+from helpers.buffered_storage import BufferedIsolation, BufferedStorage
+from helpers.metrics import TimedStorage, instrument_sqlalchemy, start_metrics_server
+from helpers.slow_queries import instrument_slow_queries
+from helpers.transaction_guard import install_transaction_guard
+from helpers.update_stream import UpdateStream
 from middlewares.authenticate_middlware import Auth
+from middlewares.metrics_middleware import UpdateMetrics, HandlerMetrics
+from middlewares.profiling_middleware import ProfilingCounter
+from middlewares.query_tracking_middleware import QueryTracking
 from middlewares.service_provider_middleware import ServiceProvider
 from middlewares.try_execute_middlware import TryExecuteInner
 from middlewares.try_filter_middleware import TryFilterOuter
+from middlewares.update_publisher import UpdatePublisher
+from middlewares.update_scheduler import UpdateScheduler, SchedulerOverflowError, drop_overflowed_update
+from service.catalog import CatalogSnapshot
 from service.database_service import DatabaseService
 from service.orm_uow import OrmUnitOfWork
 
@@ -34,30 +47,82 @@ async def main(zoo_settings: Settings) -> None:
         logging.error("Произошла неожиданная ошибка, приложение остановлено", exc_info=True)
 
 
-async def start_bot(token: str, redis_connection_str: str) -> None:
-    settings = Settings()
-    bot = Bot(token=token)
+def build_dispatcher(settings: Settings, redis_connection_str: str) -> Dispatcher:
+    """Собирает диспетчер со всеми роутерами и мидлварями"""
     storage = RedisStorage.from_url(redis_connection_str) if settings.use_redis else MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    dp.update.outer_middleware(ServiceProvider())
+    instrument_sqlalchemy()
+    if settings.slow_query_ms is not None:
+        instrument_slow_queries(settings.slow_query_ms / 1000, settings.slow_query_log_size,
+                                settings.slow_query_explain_rate)
+    if settings.transaction_guard is not None:
+        install_transaction_guard(settings.transaction_guard)
+    scheduler = UpdateScheduler(
+        max_concurrency=PostgresSettings().get_max_connections(),
+        max_backlog=settings.updates_backlog
+    )
+    # Состояние и данные FSM читаются один раз за апдейт, а изменения пишутся одной пачкой в конце
+    buffered_storage = BufferedStorage(storage)
+    dp = Dispatcher(
+        storage=TimedStorage(buffered_storage),
+        events_isolation=BufferedIsolation(scheduler, buffered_storage)
+    )
+    dp.errors.register(drop_overflowed_update, ExceptionTypeFilter(SchedulerOverflowError))
+    catalog = None
+    if settings.use_catalog_snapshot:
+        catalog = CatalogSnapshot(settings.catalog_refresh_interval)
+        dp.startup.register(catalog.start)
+        dp.shutdown.register(catalog.stop)
+    dp.update.outer_middleware(UpdateMetrics())
+    dp.update.outer_middleware(ProfilingCounter())
+    if settings.nplusone_threshold is not None:
+        dp.update.outer_middleware(QueryTracking(settings.nplusone_threshold))
+    dp.update.outer_middleware(ServiceProvider(catalog))
     dp.message.outer_middleware(Auth())
     dp.callback_query.outer_middleware(Auth())
     dp.message.outer_middleware(TryFilterOuter())
     dp.callback_query.outer_middleware(TryFilterOuter())
     dp.message.middleware(TryExecuteInner())
     dp.callback_query.middleware(TryExecuteInner())
+    dp.message.middleware(HandlerMetrics())
+    dp.callback_query.middleware(HandlerMetrics())
     dp.include_routers(
         cancel.router, developer.router, users.router, add_resource.router,
         take.router, edit.router, actions.router, search.router
     )
+    return dp
+
+
+def build_receiver(settings: Settings, redis_connection_str: str) -> Dispatcher:
+    """
+    Собирает диспетчер, который только складывает апдейты в Redis Streams.
+    Обрабатывают их воркеры workers.update_consumer
+    """
+    receiver = Dispatcher(disable_fsm=True)
+    stream = UpdateStream.from_url(redis_connection_str, settings.update_stream_partitions)
+    receiver.update.outer_middleware(UpdatePublisher(stream))
+    return receiver
+
+
+async def start_bot(token: str, redis_connection_str: str) -> None:
+    settings = Settings()
+    bot = tghelper.create_bot(token)
+    dp = build_dispatcher(settings, redis_connection_str)
+    allowed_updates = dp.resolve_used_update_types()
+    if settings.use_update_stream:
+        dp = build_receiver(settings, redis_connection_str)
+        logging.info("Апдейты будут складываться в Redis Streams, обрабатывать их должны воркеры")
+    if settings.metrics_port:
+        await start_metrics_server(settings.metrics_host, settings.metrics_port)
     await bot.set_my_commands(COMMANDS)
+    if not settings.use_polling:
+        await tghelper.start_webhook(bot, dp, WebhookSettings(), allowed_updates)
+        return
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(
         bot,
-        allowed_updates=dp.resolve_used_update_types()
+        allowed_updates=allowed_updates
     )
 
-
 if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
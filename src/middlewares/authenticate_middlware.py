@@ -5,7 +5,7 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message, TelegramObject, ReplyKeyboardRemove, CallbackQuery
 
 from domain.models import Visitor
-from helpers import staffhelper
+from helpers.staff_cache import StaffLookup
 from resources import strings
 from service.services import VisitorService
 
@@ -18,17 +18,20 @@ class Auth(BaseMiddleware):
             data: Dict[str, Any]
     ) -> Any:
         visitor_service: VisitorService = data["visitor_service"]
+        staff_lookup: StaffLookup = data["staff_lookup"]
 
         if isinstance(event, Message):
             result = await visitor_service.get_by_chat_id(event.chat.id)
             if result.is_failure:
-                await login(event, visitor_service)
+                await login(event, visitor_service, staff_lookup)
                 return
             visitor = result.unwrap()
         elif isinstance(event, CallbackQuery):
             result = await visitor_service.get_by_chat_id(event.message.chat.id)
             if result.is_failure:
-                await login(event.message, visitor_service)
+                await login(event.message, visitor_service, staff_lookup)
+                # Колбэк до хэндлера не дойдет - отвечаем сами, иначе кнопка так и будет крутиться
+                await event.answer()
                 return
             visitor = result.unwrap()
         else:
@@ -37,12 +40,18 @@ class Auth(BaseMiddleware):
         return await handler(event, data)
 
 
-async def login(message: Message, visitor_service: VisitorService) -> None:
+async def login(message: Message, visitor_service: VisitorService, staff_lookup: StaffLookup) -> None:
     username = message.from_user.username
     if not username:
         await message.answer(strings.should_be_username_msg)
         return
-    emails = await staffhelper.search_emails(username)
+    emails = await staff_lookup.get_cached(username)
+    if emails is None:
+        # Кулдаун только на поход в Стафф: ответы из кэша и проверка ника его не тратят
+        if not await staff_lookup.try_login(message.chat.id):
+            logging.debug(f"Чат {message.chat.id} слишком часто пытается залогиниться, сообщение пропущено")
+            return
+        emails = await staff_lookup.search_emails(username)
     if emails is None:
         await message.answer(strings.unexpected_action_msg)
         logging.warning(f"Ошибка при запросе в Стафф для пользователя {username}")
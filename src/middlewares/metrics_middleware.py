@@ -0,0 +1,72 @@
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import TelegramObject
+
+from helpers.metrics import UpdateStats, current_stats, UPDATE_DURATION, UPDATE_SQL_STATEMENTS, \
+    UPDATE_SQL_DURATION, UPDATE_ERRORS
+
+
+def handler_label(handler: HandlerObject) -> str:
+    """
+    Метка хэндлера: модуль роутера и функция. У каждой функции свой набор фильтров,
+    поэтому такой метки хватает, чтобы отличить команды друг от друга
+    """
+    callback = handler.callback
+    module = getattr(callback, "__module__", "") or ""
+    return f"{module.removeprefix('handlers.')}.{getattr(callback, '__name__', type(callback).__name__)}"
+
+
+class UpdateMetrics(BaseMiddleware):
+    """
+    Внешняя мидлварь апдейта: меряет время обработки, количество и время SQL-запросов.
+    Метку хэндлера проставляет HandlerMetrics, когда роутеры уже выбрали хэндлер
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        stats = UpdateStats()
+        token = current_stats.set(stats)
+        started_at = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            if not stats.failed:
+                UPDATE_ERRORS.inc(stats.handler)
+            raise
+        finally:
+            current_stats.reset(token)
+            UPDATE_DURATION.observe(time.perf_counter() - started_at, stats.handler)
+            UPDATE_SQL_STATEMENTS.observe(stats.sql_statements, stats.handler)
+            UPDATE_SQL_DURATION.observe(stats.sql_time, stats.handler)
+
+
+class HandlerMetrics(BaseMiddleware):
+    """
+    Внутренняя мидлварь: запоминает, какой хэндлер обрабатывает апдейт, и считает его ошибки.
+    Регистрируется после TryExecuteInner, иначе не увидит исключений - тот их гасит
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        stats = current_stats.get()
+        handler_object = data.get("handler")
+        if stats is None or handler_object is None:
+            return await handler(event, data)
+        stats.handler = handler_label(handler_object)
+        try:
+            return await handler(event, data)
+        except Exception:
+            stats.failed = True
+            UPDATE_ERRORS.inc(stats.handler)
+            raise
@@ -0,0 +1,26 @@
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from helpers.profiling import CPU_PROFILER
+
+
+class ProfilingCounter(BaseMiddleware):
+    """
+    Считает апдейты, пока включено профилирование CPU из меню /info, и выключает его после N-го.
+    Апдейт, который профилирование включил, не считается
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if not CPU_PROFILER.is_active:
+            return await handler(event, data)
+        try:
+            return await handler(event, data)
+        finally:
+            await CPU_PROFILER.on_update_processed()
@@ -0,0 +1,30 @@
+import logging
+from typing import Callable, Dict, Any, Awaitable, cast
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from helpers.query_tracker import track_queries
+
+
+class QueryTracking(BaseMiddleware):
+    """
+    Для разработки: собирает SQL-запросы апдейта и предупреждает,
+    если запрос одной формы выполнился больше threshold раз (похоже на N+1)
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        update = cast(Update, event)  # мидлварь вешается на dp.update
+        with track_queries(f"Апдейт {update.update_id} ({update.event_type})", self.threshold) as tracker:
+            result = await handler(event, data)
+        if tracker.repeated():
+            logging.warning(f"Похоже на N+1 запросы. {tracker.report()}")
+        return result
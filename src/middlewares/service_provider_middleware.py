@@ -1,8 +1,11 @@
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message, TelegramObject, CallbackQuery
 
+from helpers.search_session import create_search_session_store
+from helpers.staff_cache import create_staff_lookup
+from service.catalog import CatalogSnapshot
 from service.database_service import DatabaseService
 from service.orm_uow import OrmUnitOfWork
 from service.services import CategoryService, ResourceService, VisitorService, RecordService
@@ -10,15 +13,20 @@ from service.notification_service import NotificationService
 
 
 class ServiceProvider(BaseMiddleware):
+    def __init__(self, catalog: Optional[CatalogSnapshot] = None) -> None:
+        self.search_sessions = create_search_session_store()
+        self.staff_lookup = create_staff_lookup()
+        self.catalog = catalog
+
     async def __call__(
             self,
             handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
             event: Message | CallbackQuery,
             data: Dict[str, Any]
     ) -> Any:
-        uow = OrmUnitOfWork()
+        uow = OrmUnitOfWork(self.catalog)
         category_service = CategoryService(uow)
-        resource_service = ResourceService(uow)
+        resource_service = ResourceService(uow, self.catalog)
         visitor_service = VisitorService(uow)
         record_service = RecordService(uow)
         notification_service = NotificationService(uow)
@@ -31,4 +39,6 @@ class ServiceProvider(BaseMiddleware):
         data["record_service"] = record_service
         data["notification_service"] = notification_service
         data["database_service"] = database_service
+        data["search_sessions"] = self.search_sessions
+        data["staff_lookup"] = self.staff_lookup
         return await handler(event, data)
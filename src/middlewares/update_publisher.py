@@ -0,0 +1,30 @@
+import logging
+from typing import Callable, Dict, Any, Awaitable, cast
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.middlewares.user_context import EVENT_CONTEXT_KEY, EventContext
+from aiogram.types import TelegramObject, Update
+
+from helpers.update_stream import UpdateStream
+
+
+class UpdatePublisher(BaseMiddleware):
+    """
+    Вместо обработки складывает апдейт в Redis Streams - для приемника,
+    за которым апдейты обрабатывают воркеры workers.update_consumer
+    """
+
+    def __init__(self, stream: UpdateStream):
+        self.stream = stream
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        update = cast(Update, event)  # мидлварь вешается на dp.update
+        context: EventContext = data[EVENT_CONTEXT_KEY]
+        chat_id = context.chat_id or context.user_id
+        await self.stream.publish(chat_id, update.model_dump_json(exclude_none=True))
+        logging.debug(f"Апдейт {update.update_id} из чата {chat_id} отправлен в очередь")
@@ -0,0 +1,110 @@
+"""
+Планировщик обработки апдейтов.
+
+Подключается в диспетчер как events_isolation: aiogram оборачивает им загрузку стейта FSM и вызов хэндлера.
+Поэтому апдейты одного чата обрабатываются строго по очереди (двойные нажатия не гоняются за стейт),
+а общее количество одновременно работающих хэндлеров ограничено размером пула соединений с БД.
+
+Classes
+--------
+SchedulerStats
+    Счетчики планировщика: сколько апдейтов ждет, обрабатывается, обработано и отброшено
+UpdateScheduler
+    Сериализует апдейты по ключу чата и ограничивает глобальную конкурентность
+SchedulerOverflowError
+    Выбрасывается, когда очередь ожидающих апдейтов переполнена
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import AsyncGenerator, Dict
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.types import ErrorEvent
+
+
+class SchedulerOverflowError(Exception):
+    pass
+
+
+@dataclass
+class SchedulerStats:
+    """Счетчики планировщика. Время ожидания - в секундах"""
+    max_concurrency: int
+    max_backlog: int
+    waiting: int = 0
+    in_flight: int = 0
+    processed: int = 0
+    dropped: int = 0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+
+    def observe_wait(self, seconds: float) -> None:
+        self.wait_time_total += seconds
+        self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return asdict(self)
+
+
+class UpdateScheduler(BaseEventIsolation):
+    """Сериализует апдейты одного чата и ограничивает количество одновременно обрабатываемых апдейтов"""
+
+    def __init__(self, max_concurrency: int, max_backlog: int) -> None:
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_backlog = max_backlog
+        self.stats = SchedulerStats(max_concurrency=max_concurrency, max_backlog=max_backlog)
+        self._locks: Dict[StorageKey, asyncio.Lock] = dict()
+        self._lock_users: Dict[StorageKey, int] = dict()
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        if self.stats.waiting >= self.max_backlog:
+            self.stats.dropped += 1
+            raise SchedulerOverflowError(f"Очередь апдейтов переполнена: {self.stats.waiting} ожидают обработки")
+        started = time.monotonic()
+        self.stats.waiting += 1
+        waiting = True
+        lock = self._acquire_lock_for(key)
+        try:
+            async with lock, self.semaphore:
+                self.stats.waiting -= 1
+                waiting = False
+                self.stats.observe_wait(time.monotonic() - started)
+                self.stats.in_flight += 1
+                try:
+                    yield
+                finally:
+                    self.stats.in_flight -= 1
+                    self.stats.processed += 1
+        finally:
+            if waiting:
+                self.stats.waiting -= 1
+            self._release_lock_for(key)
+
+    def _acquire_lock_for(self, key: StorageKey) -> asyncio.Lock:
+        """Возвращает лок чата и запоминает, что он кому-то нужен"""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        return lock
+
+    def _release_lock_for(self, key: StorageKey) -> None:
+        """Удаляет лок чата, когда он больше никому не нужен, чтобы словарь не рос бесконечно"""
+        self._lock_users[key] -= 1
+        if self._lock_users[key] == 0:
+            del self._lock_users[key]
+            del self._locks[key]
+
+    async def close(self) -> None:
+        logging.info(f"Планировщик апдейтов остановлен. Статистика: {self.stats.as_dict()}")
+        self._locks.clear()
+        self._lock_users.clear()
+
+
+async def drop_overflowed_update(event: ErrorEvent) -> bool:
+    """Обработчик ошибки переполнения: апдейт отбрасывается без падения поллинга"""
+    logging.warning(f"Апдейт {event.update.update_id} отброшен: {event.exception}")
+    return True
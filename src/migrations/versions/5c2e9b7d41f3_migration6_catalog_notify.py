@@ -0,0 +1,58 @@
+"""migration6_catalog_notify
+
+Revision ID: 5c2e9b7d41f3
+Revises: a373c2729ea1
+Create Date: 2026-10-19 12:04:31.518202
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e9b7d41f3'
+down_revision: Union[str, None] = 'a373c2729ea1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # При изменении ресурса или его записей шлем id ресурса в канал zoo_catalog - его слушает снимок каталога
+    op.execute("""
+        CREATE OR REPLACE FUNCTION zoo_catalog_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'resource' THEN
+                IF TG_OP <> 'INSERT' THEN
+                    PERFORM pg_notify('zoo_catalog', OLD.id::text);
+                END IF;
+                IF TG_OP <> 'DELETE' AND (TG_OP = 'INSERT' OR NEW.id <> OLD.id) THEN
+                    PERFORM pg_notify('zoo_catalog', NEW.id::text);
+                END IF;
+            ELSE
+                IF TG_OP <> 'INSERT' THEN
+                    PERFORM pg_notify('zoo_catalog', OLD.resource_id::text);
+                END IF;
+                IF TG_OP <> 'DELETE' AND (TG_OP = 'INSERT' OR NEW.resource_id <> OLD.resource_id) THEN
+                    PERFORM pg_notify('zoo_catalog', NEW.resource_id::text);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER resource_catalog_notify AFTER INSERT OR UPDATE OR DELETE ON resource
+        FOR EACH ROW EXECUTE FUNCTION zoo_catalog_notify();
+    """)
+    op.execute("""
+        CREATE TRIGGER record_catalog_notify AFTER INSERT OR UPDATE OR DELETE ON record
+        FOR EACH ROW EXECUTE FUNCTION zoo_catalog_notify();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS record_catalog_notify ON record")
+    op.execute("DROP TRIGGER IF EXISTS resource_catalog_notify ON resource")
+    op.execute("DROP FUNCTION IF EXISTS zoo_catalog_notify()")
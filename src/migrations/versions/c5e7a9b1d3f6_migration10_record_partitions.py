@@ -0,0 +1,109 @@
+"""migration10_record_partitions
+
+Revision ID: c5e7a9b1d3f6
+Revises: b2f4d6e8a013
+Create Date: 2026-10-19 20:31:47.215093
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e7a9b1d3f6'
+down_revision: Union[str, None] = 'b2f4d6e8a013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, resource_id, user_email, address, enqueue_date, take_date, return_date, finished, created_at, updated_at"
+MONTHS_AHEAD = 2
+
+
+def _add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _create_history_indexes() -> None:
+    op.create_index('record_resource_history_idx', 'record', ['resource_id', 'return_date', 'id'], unique=False,
+                    postgresql_where=sa.text('finished'))
+    op.create_index('record_user_history_idx', 'record', ['user_email', 'return_date', 'id'], unique=False,
+                    postgresql_where=sa.text('finished'))
+
+
+def _create_catalog_trigger() -> None:
+    op.execute("""
+        CREATE TRIGGER record_catalog_notify AFTER INSERT OR UPDATE OR DELETE ON record
+        FOR EACH ROW EXECUTE FUNCTION zoo_catalog_notify();
+    """)
+
+
+def _rename_old_table(has_pkey: bool) -> None:
+    # Последовательность id переезжает в новую таблицу, поэтому отвязываем ее, чтобы она не удалилась со старой
+    op.execute("ALTER SEQUENCE record_id_seq OWNED BY NONE")
+    op.execute("DROP TRIGGER IF EXISTS record_catalog_notify ON record")
+    op.execute("ALTER TABLE record RENAME TO record_old")
+    if has_pkey:
+        op.execute("ALTER INDEX record_pkey RENAME TO record_old_pkey")
+    op.execute("ALTER INDEX record_resource_history_idx RENAME TO record_old_resource_history_idx")
+    op.execute("ALTER INDEX record_user_history_idx RENAME TO record_old_user_history_idx")
+
+
+def _record_columns() -> str:
+    return """
+        id INTEGER NOT NULL DEFAULT nextval('record_id_seq'),
+        resource_id INTEGER NOT NULL,
+        user_email VARCHAR NOT NULL,
+        address VARCHAR,
+        enqueue_date TIMESTAMP WITHOUT TIME ZONE,
+        take_date TIMESTAMP WITHOUT TIME ZONE,
+        return_date TIMESTAMP WITHOUT TIME ZONE,
+        finished BOOLEAN NOT NULL DEFAULT false,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        CONSTRAINT record_resource_id_resource_fkey FOREIGN KEY (resource_id) REFERENCES resource (id)
+            ON UPDATE CASCADE ON DELETE CASCADE,
+        CONSTRAINT record_user_email_visitor_fkey FOREIGN KEY (user_email) REFERENCES visitor (email)
+            ON UPDATE CASCADE ON DELETE CASCADE
+    """
+
+
+def upgrade() -> None:
+    # Активные записи - в record_active, завершенные - в record_finished, разбитой по месяцам return_date.
+    # Первичный ключ у секционированной таблицы должен включать ключ секционирования, а return_date бывает NULL,
+    # поэтому первичный ключ (id) объявлен на каждой конечной секции, а уникальность id дает последовательность
+    connection = op.get_bind()
+    _rename_old_table(has_pkey=True)
+    op.execute(f"CREATE TABLE record ({_record_columns()}) PARTITION BY LIST (finished)")
+    op.execute("CREATE TABLE record_active PARTITION OF record (PRIMARY KEY (id)) FOR VALUES IN (false)")
+    op.execute("CREATE TABLE record_finished PARTITION OF record FOR VALUES IN (true) PARTITION BY RANGE (return_date)")
+    op.execute("CREATE TABLE record_finished_default PARTITION OF record_finished (PRIMARY KEY (id)) DEFAULT")
+    # Секции на каждый месяц истории, которую еще не заархивировали, и на несколько месяцев вперед
+    current = datetime(datetime.now().year, datetime.now().month, 1)
+    first_return = connection.scalar(sa.text("SELECT min(return_date) FROM record_old WHERE finished"))
+    month = min(datetime(first_return.year, first_return.month, 1), current) if first_return else current
+    last_month = _add_months(current, MONTHS_AHEAD)
+    while month <= last_month:
+        upper = _add_months(month, 1)
+        op.execute(f"CREATE TABLE record_finished_y{month:%Y}m{month:%m} PARTITION OF record_finished "
+                   f"(PRIMARY KEY (id)) FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')")
+        month = upper
+    op.execute(f"INSERT INTO record ({COLUMNS}) SELECT {COLUMNS} FROM record_old")
+    op.execute("DROP TABLE record_old")
+    op.execute("ALTER SEQUENCE record_id_seq OWNED BY record.id")
+    _create_history_indexes()
+    _create_catalog_trigger()
+    op.execute("ANALYZE record")
+
+
+def downgrade() -> None:
+    _rename_old_table(has_pkey=False)
+    op.execute(f"CREATE TABLE record ({_record_columns()}, CONSTRAINT record_pkey PRIMARY KEY (id))")
+    op.execute(f"INSERT INTO record ({COLUMNS}) SELECT {COLUMNS} FROM record_old")
+    op.execute("DROP TABLE record_old")
+    op.execute("ALTER SEQUENCE record_id_seq OWNED BY record.id")
+    _create_history_indexes()
+    _create_catalog_trigger()
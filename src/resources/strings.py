@@ -3,10 +3,12 @@
 """
 
 from enum import StrEnum
+from typing import Optional
 
 import emoji
 from aiogram.types import Message
 
+from domain.history_dto import ArchiveStatsDTO
 from domain.models import Resource, Record
 from domain.resource_info import ResourceInfoDTO
 
@@ -167,6 +169,19 @@ def confirm_leave_msg(resource: Resource | ResourceInfoDTO) -> str:
     return f"{Emoji.CHECK.value} Вы покинули очередь за устройством {resource.short_str()}"
 
 
+def queue_position_msg(position: int, length: Optional[int] = None) -> str:
+    return f"Вы в очереди {position}-й" + (f" из {length}" if length is not None else "")
+
+
+def archive_stats_msg(stats: ArchiveStatsDTO, archive_after_days: int) -> str:
+    """Отчет об архиве записей - для админа"""
+    period = f"\r\nВ архиве записи, возвращенные с {stats.oldest_archived:%d.%m.%Y} по {stats.newest_archived:%d.%m.%Y}" \
+        if stats.oldest_archived and stats.newest_archived else ""
+    return f"Завершенных записей в рабочей таблице: {stats.finished}\r\n" \
+           f"Записей в архиве: {stats.archived}{period}\r\n" \
+           f"В архив переносятся записи, возвращенные больше {archive_after_days} дней назад"
+
+
 ask_way_of_adding_msg = "Выберите, добавить устройства по одному или загрузить файл в формате эксель или csv"
 ask_file_msg = f"Загрузите эксель-файл или csv. В верхней строке должны быть:\r\n\r\n{ResourceColumn.cols_str()}\r\n\r\n" \
                f"Первые 4 поля обязательные. Пример строки: 49,MSPOS-N,ККТ,4894892299,18.05.2024"
@@ -178,8 +193,14 @@ unexpected_action_msg = "Респект от тестировщика: возн
 
 pass_date_error_msg = f"{ResourceError.PASSED_DATE.value}. Пожалуйста, поделитесь маховиком времени с автором бота"
 not_found_msg = "Устройство не найдено, попробуйте поискать по-другому"
+search_session_expired_msg = "Результаты поиска устарели, поищите снова"
 user_have_no_device_msg = "На вас не записано ни одно устройство. Спите спокойно, Эдуард не держит вас на карандашике"
 empty_wishlist = "Вы не стоите в очереди ни на одно устройство"
+empty_history_msg = "Нет информации о прошлых записях"
+history_period_error_msg = "Период нужно указать после команды в формате дд.мм.гггг-дд.мм.гггг, например: " \
+                           "/history12 01.09.2024-30.09.2024"
+
+
 return_others_device_msg = "Нельзя вернуть устройство, которое на вас не записано!"
 leaving_queue_error_msg = "Нельзя покинуть очередь, в которой вы не стоите!"
 unexpected_resource_not_found_error_msg = "Устройство не найдено. " + unexpected_action_msg
@@ -197,7 +218,10 @@ leave_left_error_msg = "Покинуть очередь не удалось: в
                        "Заигрались в путешествия во времени и опять перепутали порядок событий?"
 
 user_not_found_msg = "Нет такого пользователя. Попробуйте снова найти его в поиске"
+edit_conflict_msg = "Пока вы редактировали, устройство изменил кто-то еще, ваша правка не сохранена. " \
+                    "Актуальные данные ниже - если нужно, внесите правку снова"
 password_required_msg = "Опасное действие. Введите пароль для продолжения"
+profiling_limit_msg = "Сколько профилировать? Число апдейтов, например 200, или секунды с буквой s, например 30s"
 table_error_prefix = "В строке"
 id_doubles_prefix = "Есть дубли айди в строках"
 vendor_code_doubles_prefix = "Есть дубли артикулов в строках"
@@ -0,0 +1,249 @@
+"""
+Снимок каталога устройств в памяти процесса (режим USE_CATALOG_SNAPSHOT).
+
+Каталог маленький, а читается почти на каждом апдейте, поэтому get, search, list_by_category_name и get_all
+у ResourceService отвечают из памяти. Запись по-прежнему идет в постгрес: триггеры на resource и record
+отправляют NOTIFY с id ресурса, а каждая реплика слушает канал через LISTEN и перечитывает только эти ресурсы.
+Свои изменения реплика применяет сразу после коммита (см. OrmUnitOfWork), не дожидаясь уведомления.
+Раз в catalog_refresh_interval секунд и после переподключения снимок перечитывается целиком -
+на случай потерянных уведомлений.
+
+Classes
+--------
+CatalogItem
+    Компактная запись о ресурсе, его текущем держателе и длине очереди
+CatalogSnapshot
+    Снимок каталога с индексами по id, артикулу и категории, плюс слушатель уведомлений
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import asyncpg
+from sqlalchemy import select, Select
+from sqlalchemy.engine import make_url
+
+from configs.config import PostgresSettings
+from database.engine import get_session_factory
+from domain.models import Resource, Category
+from domain.resource_info import ResourceInfoDTO
+
+CHANNEL = "zoo_catalog"
+RESOURCE = Resource.__table__.c
+
+
+def _catalog_select() -> Select:
+    """Колонки в порядке аргументов CatalogItem. Держатель и очередь - из колонок состояния, без record"""
+    return select(
+        RESOURCE.id, RESOURCE.name, RESOURCE.category_name, RESOURCE.vendor_code, RESOURCE.reg_date,
+        RESOURCE.firmware, RESOURCE.comment, RESOURCE.holder_email, RESOURCE.holder_address, RESOURCE.take_date,
+        RESOURCE.due_date, RESOURCE.queue_length
+    )
+
+
+class CatalogItem:
+    """Запись о ресурсе в снимке. __slots__ - чтобы тысячи записей занимали поменьше памяти"""
+    __slots__ = (
+        "id", "name", "category_name", "vendor_code", "reg_date", "firmware", "comment",
+        "user_email", "address", "take_date", "return_date", "queue_length", "search_text"
+    )
+
+    def __init__(
+            self,
+            id: int,
+            name: str,
+            category_name: str,
+            vendor_code: str,
+            reg_date: Optional[datetime] = None,
+            firmware: Optional[str] = None,
+            comment: Optional[str] = None,
+            user_email: Optional[str] = None,
+            address: Optional[str] = None,
+            take_date: Optional[datetime] = None,
+            return_date: Optional[datetime] = None,
+            queue_length: int = 0
+    ):
+        self.id = id
+        self.name = name
+        self.category_name = category_name
+        self.vendor_code = vendor_code
+        self.reg_date = reg_date
+        self.firmware = firmware
+        self.comment = comment
+        self.user_email = user_email
+        self.address = address
+        self.take_date = take_date
+        self.return_date = return_date
+        self.queue_length = queue_length
+        # Поля, по которым ищет OrmResourceInfoRepository.search, в нижнем регистре. Разделитель не даст найти запрос на стыке полей
+        self.search_text = "\x00".join([name, category_name, vendor_code]).lower()
+
+    def to_dto(self) -> ResourceInfoDTO:
+        return ResourceInfoDTO.trusted(
+            id=self.id,
+            name=self.name,
+            category_name=self.category_name,
+            vendor_code=self.vendor_code,
+            reg_date=self.reg_date,
+            firmware=self.firmware,
+            comment=self.comment,
+            user_email=self.user_email,
+            address=self.address,
+            take_date=self.take_date,
+            return_date=self.return_date
+        )
+
+
+class CatalogSnapshot:
+    """Снимок каталога. Читать можно только после загрузки - пока is_ready ложно, сервисы идут в БД"""
+
+    def __init__(self, refresh_interval: int = 300):
+        self.refresh_interval = refresh_interval
+        self.is_ready = False
+        self.categories: Set[str] = set()
+        self._items: Dict[int, CatalogItem] = dict()
+        self._by_vendor_code: Dict[str, CatalogItem] = dict()
+        self._by_category: Dict[str, Dict[int, CatalogItem]] = dict()
+        self._pending: Set[int] = set()
+        self._has_pending = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._loaded = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def get(self, resource_id: int) -> Optional[CatalogItem]:
+        return self._items.get(resource_id)
+
+    def get_by_vendor_code(self, vendor_code: str) -> Optional[CatalogItem]:
+        return self._by_vendor_code.get(vendor_code)
+
+    def list(self) -> List[CatalogItem]:
+        return list(self._items.values())
+
+    def list_by_category_name(self, category_name: str) -> List[CatalogItem]:
+        return list(self._by_category.get(category_name, dict()).values())
+
+    def search(self, search_key: str, limit: int, max_id: int) -> List[CatalogItem]:
+        """Ищет так же, как OrmResourceInfoRepository.search: по id или по подстроке без учета регистра"""
+        if search_key.isnumeric() and int(search_key) < max_id:
+            item = self._items.get(int(search_key))
+            return [item] if item else []
+        key = search_key.lower()
+        result = []
+        for item in self._items.values():
+            if key in item.search_text:
+                result.append(item)
+                if len(result) == limit:
+                    break
+        return result
+
+    def replace(self, items: Iterable[CatalogItem], categories: Iterable[str]) -> None:
+        """Подменяет содержимое снимка целиком"""
+        self._items = dict()
+        self._by_vendor_code = dict()
+        self._by_category = dict()
+        self.categories = set(categories)
+        for item in sorted(items, key=lambda x: x.id):
+            self._put(item)
+        self.is_ready = True
+
+    def apply(self, resource_id: int, item: Optional[CatalogItem]) -> None:
+        """Обновляет запись о ресурсе, а если item - None, удаляет ее"""
+        self._remove(resource_id)
+        if item is not None:
+            self._put(item)
+
+    def _put(self, item: CatalogItem) -> None:
+        self._items[item.id] = item
+        self._by_vendor_code[item.vendor_code] = item
+        self._by_category.setdefault(item.category_name, dict())[item.id] = item
+
+    def _remove(self, resource_id: int) -> None:
+        item = self._items.pop(resource_id, None)
+        if item is None:
+            return
+        if self._by_vendor_code.get(item.vendor_code) is item:
+            del self._by_vendor_code[item.vendor_code]
+        self._by_category.get(item.category_name, dict()).pop(resource_id, None)
+
+    async def load(self) -> None:
+        """Загружает снимок из БД целиком"""
+        async with self._lock:
+            async with get_session_factory()() as session:
+                rows = await session.execute(_catalog_select())
+                items = [CatalogItem(*i) for i in rows]
+                categories = (await session.scalars(select(Category.name))).all()
+            self.replace(items, categories)
+        logging.info(f"Снимок каталога загружен: {len(items)} устройств")
+
+    async def refresh(self, resource_ids: Iterable[int]) -> None:
+        """Перечитывает из БД только указанные ресурсы"""
+        resource_ids = set(resource_ids)
+        if not resource_ids or not self.is_ready:
+            return
+        async with self._lock:
+            async with get_session_factory()() as session:
+                rows = await session.execute(_catalog_select().filter(RESOURCE.id.in_(resource_ids)))
+                items = {i.id: CatalogItem(*i) for i in rows}
+            for resource_id in resource_ids:
+                self.apply(resource_id, items.get(resource_id))
+
+    async def start(self, timeout: float = 30) -> None:
+        """Подписывается на уведомления и загружает снимок. Подходит для dp.startup"""
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._apply_pending())]
+        try:
+            await asyncio.wait_for(self._loaded.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Снимок каталога не загрузился, пока устройства будут читаться из БД")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _on_notify(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        self._pending.add(int(payload))
+        self._has_pending.set()
+
+    async def _apply_pending(self) -> None:
+        """Применяет уведомления пачками: за время одного перечитывания их может прийти много"""
+        while True:
+            await self._has_pending.wait()
+            self._has_pending.clear()
+            resource_ids, self._pending = self._pending, set()
+            try:
+                await self.refresh(resource_ids)
+            except Exception:
+                logging.error("Не удалось обновить снимок каталога", exc_info=True)
+                self._pending |= resource_ids
+                await asyncio.sleep(1)
+                self._has_pending.set()
+
+    async def _listen(self) -> None:
+        dsn = make_url(PostgresSettings().pg_connection_str).set(drivername="postgresql")
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn.render_as_string(hide_password=False))
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(CHANNEL, self._on_notify)
+                # Пока слушателя не было, уведомления могли потеряться - поэтому после подключения читаем все
+                await self.load()
+                self._loaded.set()
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), self.refresh_interval)
+                    except asyncio.TimeoutError:
+                        await self.load()
+                logging.warning("Соединение для уведомлений о каталоге закрылось, переподключаемся")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.error("Ошибка при прослушивании уведомлений о каталоге", exc_info=True)
+                await asyncio.sleep(5)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
@@ -1,8 +1,10 @@
 import asyncio
 import logging
+from datetime import datetime
 from io import StringIO
-from typing import List
+from typing import List, Optional, Tuple
 
+from database.record_partitions import months_to_create, months_to_drop, partition_name
 from database.uow import UnitOfWork
 from domain.models import CATEGORIES, Category
 
@@ -30,6 +32,38 @@ class DatabaseService:
                 uow.categories.add(Category(name=category))
             logging.info(f"В БД добавлены категории: {' '.join(CATEGORIES)}")
 
+    async def maintain_record_partitions(
+            self,
+            months_ahead: int = 2,
+            drop_before: Optional[datetime] = None
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Создает секции record на текущий и months_ahead следующих месяцев,
+        удаляет пустые секции месяцев раньше drop_before. Возвращает созданные и удаленные секции
+        """
+        async with self.unit_of_work as uow:
+            if not await uow.database.is_record_partitioned():
+                return [], []
+            partitions = await uow.database.list_record_partitions()
+        created, dropped = [], []
+        for month in months_to_create(datetime.now(), months_ahead):
+            name = partition_name(month)
+            if name in partitions:
+                continue
+            async with self.unit_of_work as uow:
+                await uow.database.create_record_partition(month)
+            created.append(name)
+            logging.info(f"Создана секция {name}")
+        for name in months_to_drop(partitions, drop_before) if drop_before else []:
+            async with self.unit_of_work as uow:
+                is_dropped = await uow.database.drop_record_partition(name)
+            if is_dropped:
+                dropped.append(name)
+                logging.info(f"Удалена пустая секция {name}")
+            else:
+                logging.warning(f"Секция {name} старше {drop_before:%d.%m.%Y}, но еще не заархивирована")
+        return created, dropped
+
     async def drop_base(self) -> None:
         async with self.unit_of_work as uow:
             await uow.database.drop()
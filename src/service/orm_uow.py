@@ -2,30 +2,46 @@ import logging
 import traceback
 from abc import ABC
 from types import TracebackType
-from typing import Optional, Type, Any
+from contextvars import Token
+from typing import Optional, Type, Any, Set, Iterable
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, AsyncSessionTransaction
+from sqlalchemy.orm import Session
 
 from database.engine import get_session_factory
 from database.orm_repository import OrmResourceRepository, OrmVisitorRepository, OrmRecordRepository, \
-    OrmCategoryRepository, OrmDatabaseRepository
+    OrmCategoryRepository, OrmDatabaseRepository, OrmStaffRepository, OrmResourceInfoRepository
 from database.uow import UnitOfWork
+from domain.models import Resource, Record
+from helpers.transaction_guard import transaction_started, transaction_finished
+from service.catalog import CatalogSnapshot
 
 
 class OrmUnitOfWork(UnitOfWork, ABC):
-    def __init__(self) -> None:
+    def __init__(self, catalog: Optional[CatalogSnapshot] = None) -> None:
         self.session_factory = get_session_factory()
         self.session: Optional[AsyncSession] = None
         self.transaction: Optional[AsyncSessionTransaction] = None
+        self.catalog = catalog
+        self._changed_resources: Set[int] = set()
+        self._changed_states: Set[int] = set()
+        self._transaction_token: Optional[Token] = None
 
     async def __aenter__(self) -> 'OrmUnitOfWork':
         self.session = self.session_factory()
         self._resources = OrmResourceRepository(self.session)
+        self._resource_infos = OrmResourceInfoRepository(self.session)
         self._visitors = OrmVisitorRepository(self.session)
         self._records = OrmRecordRepository(self.session)
         self._categories = OrmCategoryRepository(self.session)
+        self._staff = OrmStaffRepository(self.session)
         self._database = OrmDatabaseRepository(self.session)
+        self._changed_resources = set()
+        self._changed_states = set()
+        event.listen(self.session.sync_session, "after_flush", self._collect_changed_resources)
         self.transaction = await self.session.begin()
+        self._transaction_token = transaction_started()
         return self
 
     async def __aexit__(
@@ -39,9 +55,38 @@ class OrmUnitOfWork(UnitOfWork, ABC):
                 await self.rollback()
                 # если здесь вернуть true - ошибка не выкинется на уровень выше
             else:
+                await self._refresh_states()
                 await self.commit()
         finally:
             await self.session.close()
+            transaction_finished(self._transaction_token)
+        if exc_type is None and self.catalog is not None:
+            # Свои изменения видны в снимке сразу, а не когда дойдет NOTIFY
+            await self.catalog.refresh(self._changed_resources)
+
+    def _collect_changed_resources(self, session: Session, flush_context: Any) -> None:
+        for obj in [*session.new, *session.dirty, *session.deleted]:
+            if isinstance(obj, Resource):
+                self._changed_resources.add(obj.id)
+            elif isinstance(obj, Record):
+                self._changed_resources.add(obj.resource_id)
+                self._changed_states.add(obj.resource_id)
+
+    def mark_changed(self, resource_ids: Iterable[int], records: bool = False) -> None:
+        """
+        Для правок через Core UPDATE, которых не видит after_flush: обновит снимок каталога,
+        а если менялись записи (records=True) - еще и пересчитает состояние устройств перед коммитом
+        """
+        resource_ids = set(resource_ids)
+        self._changed_resources |= resource_ids
+        if records:
+            self._changed_states |= resource_ids
+
+    async def _refresh_states(self) -> None:
+        """Пересчитывает состояние устройств, чьи записи менялись, в той же транзакции - перед коммитом"""
+        await self.session.flush()
+        if self._changed_states:
+            await self._resources.refresh_state(self._changed_states)
 
     async def commit(self) -> None:
         if self.transaction and self.transaction.is_active:
@@ -62,6 +107,10 @@ class OrmUnitOfWork(UnitOfWork, ABC):
     def resources(self, resources: OrmResourceRepository) -> None:
         self._resources = resources
 
+    @property
+    def resource_infos(self) -> OrmResourceInfoRepository:
+        return self._resource_infos
+
     @property
     def visitors(self) -> OrmVisitorRepository:
         return self._visitors
@@ -86,6 +135,10 @@ class OrmUnitOfWork(UnitOfWork, ABC):
     def categories(self, categories: OrmCategoryRepository) -> None:
         self._categories = categories
 
+    @property
+    def staff(self) -> OrmStaffRepository:
+        return self._staff
+
     @property
     def database(self) -> OrmDatabaseRepository:
         return self._database
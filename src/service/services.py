@@ -1,18 +1,49 @@
+import functools
 import logging
+import time
 from collections import Counter
-from datetime import datetime as dt
-from typing import Optional, List, Any, Tuple
+from datetime import datetime as dt, timedelta as td
+from typing import Optional, List, Any, Tuple, Callable, Awaitable, TypeVar, ParamSpec
 
 from configs.config import Settings
+from database.engine import is_serialization_failure
 from database.uow import UnitOfWork
 from domain.converters import convert_resource_to_dto
+from domain.dashboard_dto import DashboardDTO
 from domain.expiring_records_dto import ExpiringRecordsDTO
+from domain.history_dto import HistoryFilter, HistoryPageDTO, ArchiveReportDTO, ArchiveStatsDTO
 from domain.models import Visitor, Resource, Record, ActionType, Category
-from domain.resource_info import ResourceInfoDTO
+from domain.resource_info import ResourceInfoDTO, VersionedResourceDTO
 from domain.return_resource_dto import ReturnResourceDto
-from domain.visitor_info_dto import VisitorInfoDTO
+from helpers.staffhelper import StaffClient, StaffApiError, PATCH_MAX_DAYS
+from service.catalog import CatalogSnapshot
 from service.service_result import ServiceResult
 
+P = ParamSpec("P")
+R = TypeVar("R")
+CONFLICT_ATTEMPTS = 3
+
+
+def retry_on_conflict(method: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """
+    Повторяет операцию с начала, если ее транзакцию откатили из-за параллельной: записи на одно устройство
+    меняют одну строку resource (колонки состояния), и на REPEATABLE READ вторая транзакция падает
+    """
+
+    @functools.wraps(method)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        attempt = 1
+        while True:
+            try:
+                return await method(*args, **kwargs)
+            except Exception as error:
+                if attempt >= CONFLICT_ATTEMPTS or not is_serialization_failure(error):
+                    raise
+                logging.warning(f"Конфликт транзакций в {method.__qualname__}, попытка {attempt}: {error}")
+                attempt += 1
+
+    return wrapper
+
 
 class VisitorService:
     def __init__(self, unit_of_work: UnitOfWork):
@@ -52,56 +83,47 @@ class VisitorService:
             visitor = await uow.visitors.list()
         return ServiceResult.success(visitor)
 
-    async def get_finished_records(self, visitor_id: int) -> ServiceResult[List[VisitorInfoDTO]]:
-        result = []
+    async def get_admins(self) -> ServiceResult[List[Visitor]]:
         async with self.unit_of_work as uow:
-            visitor = await uow.visitors.get_by_id(visitor_id)
-            finished_records: List[Record] = visitor.finished_records
-            for record in finished_records:
-                visitor_info = VisitorInfoDTO(
-                    visitor_id=visitor.id,
-                    visitor_email=visitor.email,
-                    visitor_name=visitor.full_name,
-                    visitor_username=visitor.username,
-                    resource_name=record.resource.name,
-                    resource_id=record.resource.id,
-                    record_id=record.id,
-                    take_date=record.take_date,
-                    return_date=record.return_date,
-                    enqueue_date=record.enqueue_date,
-                    finished=record.finished,
-                    address=record.address
-                )
-                result.append(visitor_info)
-        return ServiceResult.success(result)
+            visitors = await uow.visitors.list_admins()
+        return ServiceResult.success(visitors)
+
+    async def get_dismissed(self) -> ServiceResult[List[Visitor]]:
+        """Возвращает пользователей, уволенных по данным из таблицы staff_status"""
+        async with self.unit_of_work as uow:
+            visitors = await uow.visitors.list_dismissed()
+        return ServiceResult.success(visitors)
+
+    async def get_many(self, visitor_ids: List[int]) -> ServiceResult[List[Visitor]]:
+        """Возвращает пользователей по списку id с сохранением порядка"""
+        async with self.unit_of_work as uow:
+            visitors = await uow.visitors.list_by_ids(visitor_ids)
+        return ServiceResult.success(visitors)
 
     async def get_taken_resources(self, visitor: Visitor) -> ServiceResult[List[ResourceInfoDTO]]:
         """Возвращает список ресурсов, которыми владеет пользователь"""
         async with self.unit_of_work as uow:
-            existed_visitor = await uow.visitors.get(visitor.email)
-            if not existed_visitor:
+            if not await uow.visitors.exists(visitor.email):
                 return ServiceResult.failure(f"Visitor with email {visitor.email} not found", 404)
-            resources = await uow.visitors.get_taken_resources(visitor)
-        async with self.unit_of_work as uow:
-            result = []
-            for i in resources:
-                resource = await uow.merge(i)
-                result.append(convert_resource_to_dto(resource, resource.take_record))
+            result = await uow.resource_infos.list_taken_by(visitor.email)
         return ServiceResult.success(result)
 
     async def get_queue(self, visitor: Visitor) -> ServiceResult[List[ResourceInfoDTO]]:
         async with self.unit_of_work as uow:
-            existed_visitor = await uow.visitors.get(visitor.email)
-            if not existed_visitor:
+            if not await uow.visitors.exists(visitor.email):
                 return ServiceResult.failure(f"Visitor with email {visitor.email} not found", 404)
-            resources = await uow.visitors.get_queue(visitor)
-        async with self.unit_of_work as uow:
-            result = []
-            for i in resources:
-                resource = await uow.merge(i)
-                result.append(convert_resource_to_dto(resource, resource.take_record))
+            result = await uow.resource_infos.list_queued_by(visitor.email)
         return ServiceResult.success(result)
 
+    async def get_dashboard(self, email: str) -> ServiceResult[DashboardDTO]:
+        """
+        Взятые устройства и очереди пользователя с местом в каждой очереди - одним запросом.
+        Пользователь уже проверен авторизацией, поэтому для неизвестной почты просто вернется пустой результат
+        """
+        async with self.unit_of_work as uow:
+            dashboard = await uow.resource_infos.get_dashboard(email)
+        return ServiceResult.success(dashboard)
+
     async def auth(self, new_visitor: Visitor) -> ServiceResult[Visitor]:
         """Добавляет или обновляет пользователя при первом входе в систему"""
         async with self.unit_of_work as uow:
@@ -130,14 +152,14 @@ class VisitorService:
 
     async def update(self, visitor_id: int, email: Optional[str] = None, comment: Optional[str] = None) -> \
             ServiceResult[Visitor]:
+        values = {name: value for name, value in {"email": email, "comment": comment}.items() if value is not None}
         async with self.unit_of_work as uow:
-            visitor = await uow.visitors.get_by_id(visitor_id)
-            if not visitor:
-                return ServiceResult.failure(f"Visitor with id {visitor_id} not found", 404)
-            if email is not None:
-                visitor.email = email
-            if comment is not None:
-                visitor.comment = comment
+            if values:
+                visitor = await uow.visitors.update(visitor_id, values)
+            else:
+                visitor = await uow.visitors.get_by_id(visitor_id)
+        if not visitor:
+            return ServiceResult.failure(f"Visitor with id {visitor_id} not found", 404)
         return ServiceResult.success(visitor)
 
     async def delete(self, email: str) -> ServiceResult[Visitor]:
@@ -154,48 +176,56 @@ class VisitorService:
 
 
 class ResourceService:
-    def __init__(self, unit_of_work: UnitOfWork):
+    def __init__(self, unit_of_work: UnitOfWork, catalog: Optional[CatalogSnapshot] = None):
         self.unit_of_work = unit_of_work
+        self.catalog = catalog
+
+    @property
+    def _snapshot(self) -> Optional[CatalogSnapshot]:
+        """Снимок каталога, если он включен и уже загружен"""
+        return self.catalog if self.catalog is not None and self.catalog.is_ready else None
 
     async def get(self, resource_id: int) -> ServiceResult[ResourceInfoDTO]:
-        async with self.unit_of_work as uow:
-            resource = await uow.resources.get(resource_id)
-            if resource is None:
+        if self._snapshot:
+            item = self._snapshot.get(resource_id)
+            if item is None:
                 return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
-            result = convert_resource_to_dto(resource, resource.take_record)
+            return ServiceResult.success(item.to_dto())
+        async with self.unit_of_work as uow:
+            result = await uow.resource_infos.get(resource_id)
+        if result is None:
+            return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
         return ServiceResult.success(result)
 
     async def get_by_vendor_code(self, vendor_code: str) -> ServiceResult[ResourceInfoDTO]:
         async with self.unit_of_work as uow:
-            resource = await uow.resources.get_by_vendor_code(vendor_code)
-            if resource is None:
-                return ServiceResult.failure(f"Resource with vendor_code {vendor_code} not found", 404)
-            result = convert_resource_to_dto(resource, resource.take_record)
+            result = await uow.resource_infos.get_by_vendor_code(vendor_code)
+        if result is None:
+            return ServiceResult.failure(f"Resource with vendor_code {vendor_code} not found", 404)
         return ServiceResult.success(result)
 
     async def list_by_category_name(self, category_name: str) -> ServiceResult[List[ResourceInfoDTO]]:
+        if self._snapshot:
+            if category_name not in self._snapshot.categories:
+                return ServiceResult.failure(f"Category with name {category_name} not found", 404)
+            return ServiceResult.success([i.to_dto() for i in self._snapshot.list_by_category_name(category_name)])
         async with self.unit_of_work as uow:
             category = await uow.categories.get(category_name)
             if category is None:
                 return ServiceResult.failure(f"Category with name {category_name} not found", 404)
-            resources = await uow.resources.list_by_category_name(category_name)
-            result = [convert_resource_to_dto(i, i.take_record) for i in resources]
+            result = await uow.resource_infos.list_by_category_name(category_name)
         return ServiceResult.success(result)
 
-    async def get_categories(self) -> ServiceResult[List[str]]:
+    async def get_many(self, resource_ids: List[int]) -> ServiceResult[List[ResourceInfoDTO]]:
+        """Возвращает ресурсы по списку id с сохранением порядка"""
         async with self.unit_of_work as uow:
-            resources = await uow.resources.list()
-        categories = list(set([i.category_name for i in resources]))
-        return ServiceResult.success(categories)
+            result = await uow.resource_infos.list_by_ids(resource_ids)
+        return ServiceResult.success(result)
 
-    async def get_finished_records(self, resource_id: int) -> ServiceResult[List[ResourceInfoDTO]]:
+    async def get_categories(self) -> ServiceResult[List[str]]:
         async with self.unit_of_work as uow:
-            resource = await uow.resources.get(resource_id)
-            if resource is None:
-                return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
-            finished_records: List[Record] = resource.finished_records
-        result = [convert_resource_to_dto(resource, i) for i in finished_records]
-        return ServiceResult.success(result)
+            categories = await uow.resources.list_category_names()
+        return ServiceResult.success(categories)
 
     async def get_take_record(self, resource_id: int) -> ServiceResult[Record]:
         async with self.unit_of_work as uow:
@@ -212,9 +242,10 @@ class ResourceService:
             return ServiceResult.success(resource.queue_records)
 
     async def get_all(self) -> ServiceResult[List[ResourceInfoDTO]]:
+        if self._snapshot:
+            return ServiceResult.success([i.to_dto() for i in self._snapshot.list()])
         async with self.unit_of_work as uow:
-            resources = await uow.resources.list()
-            dtos = [convert_resource_to_dto(i, i.take_record) for i in resources]
+            dtos = await uow.resource_infos.list()
         return ServiceResult(dtos)
 
     async def delete_all_free(self) -> ServiceResult[List[Resource]]:
@@ -222,15 +253,39 @@ class ResourceService:
             resources = await uow.resources.delete_all(only_free_resources=True)
         return ServiceResult.success(resources)
 
-    async def update_field(self, resource_id: int, field_name: str, value: Any) -> ServiceResult[Resource]:
+    async def get_versioned(self, resource_id: int) -> ServiceResult[VersionedResourceDTO]:
+        """Устройство и его updated_at - версия, от которой считается правка через update_field"""
         async with self.unit_of_work as uow:
-            resource = await uow.resources.get(resource_id)
-            if resource is None:
-                return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
-            if field_name not in Resource.get_fields_names():
-                return ServiceResult.failure(f"Resource does not have this field_name: {field_name}", 400)
-            setattr(resource, field_name, value)
-        return ServiceResult.success(resource)
+            result = await uow.resource_infos.get_versioned(resource_id)
+        if result is None:
+            return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
+        return ServiceResult.success(result)
+
+    @retry_on_conflict
+    async def update_field(
+            self,
+            resource_id: int,
+            field_name: str,
+            value: Any,
+            expected_updated_at: Optional[dt] = None
+    ) -> ServiceResult[VersionedResourceDTO]:
+        """
+        Меняет одно поле одним запросом. expected_updated_at - версия устройства, которую видел админ:
+        если с тех пор устройство успели изменить, ничего не меняет и возвращает 409
+        """
+        if field_name not in Resource.get_editable_fields_names():
+            return ServiceResult.failure(f"Resource does not have this field_name: {field_name}", 400)
+        async with self.unit_of_work as uow:
+            result = await uow.resources.update_field(resource_id, field_name, value, expected_updated_at)
+            if result is None:
+                current = await uow.resource_infos.get_versioned(resource_id)
+                if current is None:
+                    return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
+                return ServiceResult.failure(
+                    f"Resource with id {resource_id} was changed at {current.updated_at}, "
+                    f"expected {expected_updated_at}", 409)
+            uow.mark_changed([resource_id])
+        return ServiceResult.success(result)
 
     async def add_with_record(self, resource: Resource, take_record: Optional[Record]) -> ServiceResult:
         async with self.unit_of_work as uow:
@@ -290,13 +345,26 @@ class ResourceService:
         return ServiceResult()
 
     async def search(self, search_key: str, limit: int, max_id: int = 10000) -> ServiceResult[List[ResourceInfoDTO]]:
+        if self._snapshot:
+            return ServiceResult.success([i.to_dto() for i in self._snapshot.search(search_key, limit, max_id)])
         async with self.unit_of_work as uow:
-            resources = await uow.resources.search_resource(search_key, limit, max_id)
-            result = [convert_resource_to_dto(i, i.take_record) for i in resources]
+            result = await uow.resource_infos.search(search_key, limit, max_id)
         return ServiceResult.success(result)
 
-    async def delete(self, resource_id: int) -> ServiceResult[Resource]:
+    async def check_state(self, fix: bool = True) -> ServiceResult[List[int]]:
+        """Ищет устройства, у которых колонки состояния разошлись с активными записями, и пересчитывает их"""
+        async with self.unit_of_work as uow:
+            resource_ids = await uow.resources.find_inconsistent_state()
+            if fix and resource_ids:
+                await uow.resources.refresh_state(resource_ids)
+        return ServiceResult.success(resource_ids)
+
+    @retry_on_conflict
+    async def delete(self, resource_id: int, only_free: bool = False) -> ServiceResult[Resource]:
+        """С only_free не удаляет устройство, которое кто-то взял, и возвращает 409"""
         async with self.unit_of_work as uow:
+            if only_free and await uow.resources.is_taken(resource_id):
+                return ServiceResult.failure(f"Resource with id {resource_id} is taken", 409)
             resource = await uow.resources.delete(resource_id)
         if resource is None:
             return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
@@ -317,12 +385,38 @@ class RecordService:
 
     async def get_all_taken(self) -> ServiceResult[List[ResourceInfoDTO]]:
         async with self.unit_of_work as uow:
-            records, resources = await uow.records.get_all_taken()
-            result = []
-            for record, resource in zip(records, resources):
-                result.append(convert_resource_to_dto(resource, record))
+            result = await uow.resource_infos.list_taken()
         return ServiceResult.success(result)
 
+    async def get_history(
+            self,
+            history_filter: HistoryFilter,
+            page: int = 1,
+            page_size: int = 5,
+            after_id: Optional[int] = None
+    ) -> ServiceResult[HistoryPageDTO]:
+        """
+        Страница истории устройства или пользователя, от новых записей к старым.
+        after_id - последняя запись страницы page - 1, если она известна: тогда страница ищется по индексу от нее
+        """
+        if page < 1:
+            return ServiceResult.failure(f"Page must be positive, got {page}", 400)
+        async with self.unit_of_work as uow:
+            total = await uow.records.count_history(history_filter)
+            if total == 0:
+                if history_filter.resource_id is not None and \
+                        await uow.resources.get(history_filter.resource_id) is None:
+                    return ServiceResult.failure(f"Resource with id {history_filter.resource_id} not found", 404)
+                if history_filter.visitor_id is not None and \
+                        await uow.visitors.get_by_id(history_filter.visitor_id) is None:
+                    return ServiceResult.failure(f"Visitor with id {history_filter.visitor_id} not found", 404)
+            if after_id is not None:
+                records = await uow.records.list_history(history_filter, page_size, after_id=after_id)
+            else:
+                # Первая страница или переход через несколько страниц - обычный OFFSET
+                records = await uow.records.list_history(history_filter, page_size, offset=(page - 1) * page_size)
+        return ServiceResult.success(HistoryPageDTO(records=records, total=total, page=page))
+
     async def get_expiring(self, expire_after_days: int) -> ServiceResult[List[ExpiringRecordsDTO]]:
         async with self.unit_of_work as uow:
             expiring_records_with_days = await uow.records.get_expiring(expire_after_days)
@@ -342,6 +436,7 @@ class RecordService:
             return ServiceResult.failure(f"Visitor with email {email} not found", 404)
         return ServiceResult()
 
+    @retry_on_conflict
     async def enqueue(self, resource_id: int, email: str) -> ServiceResult[Record]:
         check_result = await self._check_exists(resource_id, email)
         if check_result.is_failure:
@@ -356,28 +451,57 @@ class RecordService:
 
     async def get_available_action(self, resource_id: int, email: str) -> ServiceResult[ActionType]:
         # А если есть очередь, но ресурс не занят - это парадокс
-        check_result = await self._check_exists(resource_id, email)
-        if check_result.is_failure:
-            return check_result
         async with self.unit_of_work as uow:
-            resource = await uow.resources.get(resource_id)
-            resource_is_free = not resource.take_record
-            visitor_has_it = resource.take_record and resource.take_record.user_email == email
-            visitor_in_queue_for_it = email in [i.visitor.email for i in resource.queue_records]
-        if resource_is_free:
-            return ServiceResult.success(ActionType.TAKE)
-        elif visitor_has_it:
-            return ServiceResult.success(ActionType.RETURN)
-        elif visitor_in_queue_for_it:
+            resource = await uow.resource_infos.get(resource_id)
+            if resource is None:
+                return ServiceResult.failure(f"Resource with id {resource_id} not found", 404)
+            if not await uow.visitors.exists(email):
+                return ServiceResult.failure(f"Visitor with email {email} not found", 404)
+            if resource.user_email is None:
+                return ServiceResult.success(ActionType.TAKE)
+            if resource.user_email == email:
+                return ServiceResult.success(ActionType.RETURN)
+            visitor_in_queue_for_it = await uow.records.is_in_queue(resource_id, email)
+        if visitor_in_queue_for_it:
             return ServiceResult.success(ActionType.LEAVE)
         else:
             return ServiceResult.success(ActionType.QUEUE)
 
-    async def delete_old_finished_records(self, max_age: int = 100) -> ServiceResult:
-        async with self.unit_of_work as uow:
-            await uow.records.delete_finished(max_age)
-        return ServiceResult()
-
+    async def archive_finished_records(
+            self,
+            max_age: int = 100,
+            chunk_size: int = 1000,
+            max_chunks: Optional[int] = None
+    ) -> ServiceResult[ArchiveReportDTO]:
+        """
+        Переносит завершенные записи старше max_age дней в архив пачками по chunk_size.
+        Каждая пачка - отдельная короткая транзакция, поэтому блокировки не держатся на время всего переноса
+        """
+        if chunk_size < 1:
+            return ServiceResult.failure(f"Chunk size must be positive, got {chunk_size}", 400)
+        before = dt.now() - td(days=max_age)
+        started_at = time.perf_counter()
+        async with self.unit_of_work as uow:
+            expected = await uow.records.count_archivable(before)
+        moved, chunks = 0, 0
+        while moved < expected and (max_chunks is None or chunks < max_chunks):
+            async with self.unit_of_work as uow:
+                count = await uow.records.archive_finished(before, chunk_size)
+            if count == 0:
+                break
+            moved += count
+            chunks += 1
+            logging.info(f"Архивация записей до {before:%d.%m.%Y}: перенесено {moved} из {expected}")
+        report = ArchiveReportDTO(before=before, moved=moved, chunks=chunks, left=max(expected - moved, 0),
+                                  seconds=round(time.perf_counter() - started_at, 3))
+        return ServiceResult.success(report)
+
+    async def get_archive_stats(self) -> ServiceResult[ArchiveStatsDTO]:
+        async with self.unit_of_work as uow:
+            stats = await uow.records.get_archive_stats()
+        return ServiceResult.success(stats)
+
+    @retry_on_conflict
     async def leave_queue(self, resource_id: int, email: str) -> ServiceResult[Record]:
         check_result = await self._check_exists(resource_id, email)
         if check_result.is_failure:
@@ -389,6 +513,7 @@ class RecordService:
             await uow.records.delete(queue_record)
         return ServiceResult.success(queue_record)
 
+    @retry_on_conflict
     async def take_resource(
             self,
             resource_id: int,
@@ -416,6 +541,7 @@ class RecordService:
         dto = convert_resource_to_dto(resource, record)
         return ServiceResult.success(dto)
 
+    @retry_on_conflict
     async def return_resource(self, resource_id: int) -> ServiceResult[ReturnResourceDto]:
         """Снимает ресурс с текущего пользователя и передает следующему"""
         async with self.unit_of_work as uow:
@@ -437,17 +563,45 @@ class RecordService:
             return_resource_dto.new_visitor_email = first_in_queue_record.user_email
             return ServiceResult.success(return_resource_dto)
 
+    @retry_on_conflict
     async def put(self, record_id: int, address: str, return_date: dt) -> ServiceResult[ResourceInfoDTO]:
-        """Снимает ресурс с текущего пользователя и передает следующему"""
+        """Меняет адрес и дату возврата записи, возвращает устройство с новыми значениями"""
         async with self.unit_of_work as uow:
-            existed_record = await uow.records.get(record_id)
-            if existed_record is None:
+            result = await uow.records.put(record_id, address, return_date)
+            if result is None:
                 return ServiceResult.failure(f"Record with id {record_id} not found", 404)
-            record = await uow.records.put(record_id, address, return_date)
-            result = convert_resource_to_dto(record.resource, record)
+            uow.mark_changed([result.id], records=True)
         return ServiceResult.success(result)
 
 
+class StaffService:
+    """Синхронизирует локальную копию статусов сотрудников со Стаффом"""
+    USERS_PATCH_WATERMARK = "users_patch"
+
+    def __init__(self, unit_of_work: UnitOfWork, staff_client: StaffClient):
+        self.unit_of_work = unit_of_work
+        self.staff_client = staff_client
+
+    async def sync_dismissed(self) -> ServiceResult[int]:
+        """Запрашивает уволенных с момента прошлой синхронизации и возвращает, сколько их пришло"""
+        async with self.unit_of_work as uow:
+            watermark = await uow.staff.get_watermark(self.USERS_PATCH_WATERMARK)
+        started_at = dt.now()
+        oldest_allowed = started_at - td(days=PATCH_MAX_DAYS - 1)
+        if watermark is not None and watermark < oldest_allowed:
+            logging.warning(f"Синхронизации со Стаффом не было с {watermark}, часть увольнений могла потеряться")
+        since = max(watermark, oldest_allowed) if watermark is not None else oldest_allowed
+        # Запрос в Стафф - вне транзакции, чтобы не держать соединение с БД, пока ждем ответа
+        try:
+            emails = await self.staff_client.get_fired_users_emails(since)
+        except StaffApiError as e:
+            return ServiceResult.failure(str(e), 503)
+        async with self.unit_of_work as uow:
+            await uow.staff.mark_dismissed(emails)
+            await uow.staff.set_watermark(self.USERS_PATCH_WATERMARK, started_at)
+        return ServiceResult.success(len(emails))
+
+
 class CategoryService:
     def __init__(self, unit_of_work: UnitOfWork):
         self.unit_of_work = unit_of_work
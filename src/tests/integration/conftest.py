@@ -1,5 +1,9 @@
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Iterator, Optional
+
 import pytest
 
+from helpers.query_tracker import QueryTracker, track_queries
 from service.database_service import DatabaseService
 from service.orm_uow import OrmUnitOfWork
 from service.services import CategoryService, ResourceService, VisitorService, RecordService
@@ -35,3 +39,23 @@ def visitor_service(uow: OrmUnitOfWork) -> VisitorService:
 @pytest.fixture
 def record_service(uow: OrmUnitOfWork) -> RecordService:
     return RecordService(uow)
+
+
+@pytest.fixture
+def assert_max_queries() -> Callable[..., ContextManager[QueryTracker]]:
+    """
+    Проверяет, что в блоке не больше n SQL-запросов, а если задан max_repeats -
+    что ни один запрос не повторился больше max_repeats раз (N+1):
+        with assert_max_queries(5, max_repeats=1):
+            await resource_service.get_all()
+    """
+
+    @contextmanager
+    def check(n: int, max_repeats: Optional[int] = None) -> Iterator[QueryTracker]:
+        with track_queries("Блок теста", max_repeats if max_repeats is not None else n) as tracker:
+            yield tracker
+        assert tracker.total <= n, tracker.report(threshold=0)
+        if max_repeats is not None:
+            assert not tracker.repeated(), tracker.report()
+
+    return check
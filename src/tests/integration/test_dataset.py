@@ -0,0 +1,17 @@
+import pytest
+
+import tests.integration.data_gen as data_gen
+from benchmarks.dataset import DatasetSpec, generate, load
+from domain.models import Visitor
+from service.services import ResourceService, VisitorService
+
+
+@pytest.mark.asyncio
+async def test_load_dataset_with_copy(resource_service: ResourceService, visitor_service: VisitorService) -> None:
+    dataset = generate(DatasetSpec(resources=200, visitors=50, history=3, seed=1))
+    await load(dataset)
+    assert len((await resource_service.get_all()).unwrap()) == 200
+    assert len((await visitor_service.get_all()).unwrap()) == 50
+    # Последовательности сдвинуты - обычная вставка после COPY не падает на дубликате id
+    visitor = await data_gen.added_visitor(Visitor(email=data_gen.random_email(), is_admin=False))
+    assert (await visitor_service.get(visitor.email)).is_success
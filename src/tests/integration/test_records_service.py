@@ -1,11 +1,23 @@
+import asyncio
 import datetime
+import importlib.util
+from pathlib import Path
+from types import ModuleType
+from typing import AsyncIterator, List
 
 import pytest
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import Connection, text
 
 import tests.integration.data_gen as data_gen
+from database.engine import get_engine_async
+from database.record_partitions import ACTIVE_PARTITION, DEFAULT_PARTITION, add_months, month_start, partition_name
 from database.uow import UnitOfWork
 from domain.models import ActionType
-from service.services import RecordService
+from service.database_service import DatabaseService
+from service.orm_uow import OrmUnitOfWork
+from service.services import RecordService, ResourceService
 
 
 @pytest.mark.asyncio
@@ -126,6 +138,28 @@ async def test_enqueue_409(record_service: RecordService) -> None:
     assert result.error_code == 409
 
 
+@pytest.mark.asyncio
+async def test_concurrent_enqueue_success(resource_service: ResourceService) -> None:
+    take_record = await data_gen.added_take_record()
+    visitors = [await data_gen.added_visitor() for _ in range(2)]
+    # У каждого апдейта свой unit of work - как в ServiceProvider
+    results = await asyncio.gather(
+        *[RecordService(OrmUnitOfWork()).enqueue(take_record.resource_id, i.email) for i in visitors])
+    assert all(i.is_success for i in results)
+    queue = (await resource_service.get_queue_records(take_record.resource_id)).unwrap()
+    assert sorted(i.user_email for i in queue) == sorted(i.email for i in visitors)
+    assert (await resource_service.check_state(fix=False)).unwrap() == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_take_one_wins() -> None:
+    resource = await data_gen.added_resource()
+    visitors = [await data_gen.added_visitor() for _ in range(2)]
+    results = await asyncio.gather(
+        *[RecordService(OrmUnitOfWork()).take_resource(resource.id, i.email) for i in visitors])
+    assert sorted(i.error_code or 0 for i in results) == [0, 409]
+
+
 @pytest.mark.asyncio
 async def test_enqueue_no_visitor_404(record_service: RecordService) -> None:
     take_record = await data_gen.added_take_record()
@@ -189,6 +223,17 @@ async def test_put_success(record_service: RecordService) -> None:
     assert updated_record.return_date == return_date
 
 
+@pytest.mark.asyncio
+async def test_put_updates_resource_state(record_service: RecordService, resource_service: ResourceService) -> None:
+    take_record = await data_gen.added_take_record()
+    return_date = datetime.datetime.now() + datetime.timedelta(days=400)
+    address = data_gen.random_str()
+    await record_service.put(take_record.id, address, return_date)
+    resource = (await resource_service.get(take_record.resource_id)).unwrap()
+    assert resource.address == address
+    assert resource.return_date == return_date
+
+
 @pytest.mark.asyncio
 async def test_put_404(record_service: RecordService) -> None:
     return_date = datetime.datetime.now() + datetime.timedelta(days=400)
@@ -281,10 +326,123 @@ async def test_get_available_action_no_visitor_404(record_service: RecordService
 
 
 @pytest.mark.asyncio
-async def test_delete_old_finished_records_success(record_service: RecordService) -> None:
-    await data_gen.added_take_record()
+async def test_archive_finished_records_success(record_service: RecordService) -> None:
+    take_record = await data_gen.added_take_record()
     return_date = datetime.datetime.now() - datetime.timedelta(days=101)
-    finished_record = await data_gen.added_finished_record(return_date=return_date)
-    await record_service.delete_old_finished_records(100)
-    get_record_result = await record_service.get(finished_record.id)
-    assert get_record_result.is_failure
+    old_records = [await data_gen.added_finished_record(return_date=return_date) for _ in range(5)]
+    fresh_record = await data_gen.added_finished_record()
+    report = (await record_service.archive_finished_records(100, chunk_size=2)).unwrap()
+    assert (report.moved, report.chunks, report.left) == (5, 3, 0)
+    for record in old_records:
+        assert (await record_service.get(record.id)).is_failure
+    assert (await record_service.get(fresh_record.id)).is_success
+    assert (await record_service.get(take_record.id)).is_success
+    stats = (await record_service.get_archive_stats()).unwrap()
+    assert (stats.finished, stats.archived) == (1, 5)
+
+
+@pytest.mark.asyncio
+async def test_archive_finished_records_stops_after_max_chunks(record_service: RecordService) -> None:
+    return_date = datetime.datetime.now() - datetime.timedelta(days=101)
+    for _ in range(3):
+        await data_gen.added_finished_record(return_date=return_date)
+    report = (await record_service.archive_finished_records(100, chunk_size=1, max_chunks=2)).unwrap()
+    assert (report.moved, report.left) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_maintain_record_partitions_skips_plain_table(uow: UnitOfWork) -> None:
+    created, dropped = await DatabaseService(uow).maintain_record_partitions(2, datetime.datetime.now())
+    assert (created, dropped) == ([], [])
+
+
+MIGRATIONS = Path(__file__).parents[2] / "migrations" / "versions"
+
+
+def _load_migration(file_name: str) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(file_name, MIGRATIONS / f"{file_name}.py")
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _upgrade(connection: Connection, migrations: List[ModuleType]) -> None:
+    with Operations.context(MigrationContext.configure(connection)):
+        for migration in migrations:
+            migration.upgrade()
+
+
+@pytest.fixture
+async def partitioned_record() -> AsyncIterator[None]:
+    """
+    init() создает обычную record, поэтому секционируем ее той же migration10, что и на проде.
+    Функцию для ее триггера создает migration6
+    """
+    migrations = [_load_migration("5c2e9b7d41f3_migration6_catalog_notify"),
+                  _load_migration("c5e7a9b1d3f6_migration10_record_partitions")]
+    async with get_engine_async().begin() as connection:
+        await connection.run_sync(_upgrade, migrations)
+    yield
+    async with get_engine_async().begin() as connection:
+        await connection.execute(text("DROP FUNCTION zoo_catalog_notify() CASCADE"))
+
+
+async def _record_partition(resource_id: int) -> str:
+    async with get_engine_async().connect() as connection:
+        stmt = text("SELECT tableoid::regclass::text FROM record WHERE resource_id = :resource_id")
+        return str(await connection.scalar(stmt, {"resource_id": resource_id}))
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("partitioned_record")
+async def test_return_moves_record_to_month_partition(record_service: RecordService) -> None:
+    resource = await data_gen.added_resource()
+    visitor = await data_gen.added_visitor()
+    assert (await record_service.take_resource(resource.id, visitor.email)).is_success
+    assert await _record_partition(resource.id) == ACTIVE_PARTITION
+    assert (await record_service.return_resource(resource.id)).is_success
+    assert await _record_partition(resource.id) == partition_name(datetime.datetime.now())
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("partitioned_record")
+async def test_maintain_record_partitions_creates_and_drops(uow: UnitOfWork) -> None:
+    current = month_start(datetime.datetime.now())
+    filled_month, empty_month = add_months(current, -3), add_months(current, -2)
+    record = await data_gen.added_finished_record(return_date=filled_month + datetime.timedelta(days=3))
+    assert await _record_partition(record.resource_id) == DEFAULT_PARTITION
+    async with uow:
+        await uow.database.create_record_partition(filled_month)
+        await uow.database.create_record_partition(empty_month)
+    assert await _record_partition(record.resource_id) == partition_name(filled_month)
+
+    created, dropped = await DatabaseService(uow).maintain_record_partitions(4, current)
+    assert created == [partition_name(add_months(current, 3)), partition_name(add_months(current, 4))]
+    assert dropped == [partition_name(empty_month)]
+    async with uow:
+        partitions = await uow.database.list_record_partitions()
+    assert partition_name(filled_month) in partitions
+    assert partition_name(empty_month) not in partitions
+    assert set(created) <= set(partitions)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("partitioned_record")
+async def test_archive_finished_records_across_partitions(record_service: RecordService, uow: UnitOfWork) -> None:
+    current = month_start(datetime.datetime.now())
+    months = [add_months(current, -5), add_months(current, -4)]
+    async with uow:
+        for month in months:
+            await uow.database.create_record_partition(month)
+    old_records = [await data_gen.added_finished_record(return_date=i + datetime.timedelta(days=1)) for i in months]
+    fresh_record = await data_gen.added_finished_record()
+    assert [await _record_partition(i.resource_id) for i in old_records] == [partition_name(i) for i in months]
+
+    report = (await record_service.archive_finished_records(100)).unwrap()
+    assert (report.moved, report.left) == (2, 0)
+    for record in old_records:
+        assert (await record_service.get(record.id)).is_failure
+    assert (await record_service.get(fresh_record.id)).is_success
+    created, dropped = await DatabaseService(uow).maintain_record_partitions(2, add_months(current, -3))
+    assert (created, dropped) == ([], [partition_name(i) for i in months])
@@ -1,12 +1,17 @@
 import random
 from copy import copy
 from datetime import datetime, timedelta
+from typing import Callable, ContextManager
 
 import pytest
+from sqlalchemy import text
 
 import tests.integration.data_gen as data_gen
 from database.uow import UnitOfWork
+from domain.history_dto import HistoryFilter
 from domain.models import Category, Record
+from helpers.query_tracker import QueryTracker, track_queries
+from service.orm_uow import OrmUnitOfWork
 from service.services import ResourceService, CategoryService, RecordService
 
 
@@ -27,6 +32,23 @@ async def test_delete_404(resource_service: ResourceService) -> None:
     assert delete_result.error_code == 404
 
 
+@pytest.mark.asyncio
+async def test_delete_only_free_taken_409(resource_service: ResourceService) -> None:
+    take_record = await data_gen.added_take_record()
+    delete_result = await resource_service.delete(take_record.resource_id, only_free=True)
+    assert delete_result.error_code == 409
+    assert (await resource_service.get(take_record.resource_id)).is_success
+
+
+@pytest.mark.asyncio
+async def test_delete_only_free_ignores_state_columns(resource_service: ResourceService, uow: OrmUnitOfWork) -> None:
+    take_record = await data_gen.added_take_record()
+    async with uow:
+        await uow.session.execute(text("UPDATE resource SET holder_email = NULL"))
+    delete_result = await resource_service.delete(take_record.resource_id, only_free=True)
+    assert delete_result.error_code == 409
+
+
 @pytest.mark.asyncio
 async def test_get_success(resource_service: ResourceService) -> None:
     resource = await data_gen.added_resource()
@@ -73,6 +95,40 @@ async def test_get_all_empty_list(resource_service: ResourceService) -> None:
     assert result.unwrap() == []
 
 
+@pytest.mark.asyncio
+async def test_get_many_keeps_order(resource_service: ResourceService) -> None:
+    resource1 = await data_gen.added_resource()
+    resource2 = await data_gen.added_resource()
+    result = await resource_service.get_many([resource2.id, -1, resource1.id])
+    assert [i.id for i in result.unwrap()] == [resource2.id, resource1.id]
+
+
+@pytest.mark.asyncio
+async def test_get_many_query_count_does_not_grow(
+        resource_service: ResourceService,
+        assert_max_queries: Callable[..., ContextManager[QueryTracker]]
+) -> None:
+    resources = [await data_gen.added_resource() for _ in range(6)]
+    with track_queries() as one_resource:
+        await resource_service.get_many([resources[0].id])
+    with assert_max_queries(one_resource.total):
+        await resource_service.get_many([i.id for i in resources])
+
+
+@pytest.mark.asyncio
+async def test_get_all_query_count_does_not_grow(
+        resource_service: ResourceService,
+        assert_max_queries: Callable[..., ContextManager[QueryTracker]]
+) -> None:
+    await data_gen.added_resource()
+    with track_queries() as one_resource:
+        await resource_service.get_all()
+    for _ in range(5):
+        await data_gen.added_resource()
+    with assert_max_queries(one_resource.total):
+        await resource_service.get_all()
+
+
 @pytest.mark.asyncio
 async def test_search_success(resource_service: ResourceService) -> None:
     resource1 = await data_gen.added_resource()
@@ -146,26 +202,53 @@ async def test_get_categories_empty_list(resource_service: ResourceService, cate
 
 
 @pytest.mark.asyncio
-async def test_get_finished_records_success(resource_service: ResourceService) -> None:
+async def test_get_history_success(record_service: RecordService) -> None:
     original_finished_record = await data_gen.added_finished_record()
-    result = await resource_service.get_finished_records(original_finished_record.resource_id)
-    finished_record = result.unwrap()[0]
-    assert finished_record.return_date == original_finished_record.return_date
+    result = await record_service.get_history(HistoryFilter(resource_id=original_finished_record.resource_id))
+    history = result.unwrap()
+    assert history.total == 1
+    assert history.records[0].return_date == original_finished_record.return_date
 
 
 @pytest.mark.asyncio
-async def test_get_finished_records_404(resource_service: ResourceService) -> None:
-    result = await resource_service.get_finished_records(data_gen.random_number())
+async def test_get_history_404(record_service: RecordService) -> None:
+    result = await record_service.get_history(HistoryFilter(resource_id=data_gen.random_number()))
     assert result.is_failure
     assert result.error_code == 404
 
 
 @pytest.mark.asyncio
-async def test_get_finished_records_empty_list(resource_service: ResourceService) -> None:
+async def test_get_history_empty_list(record_service: RecordService) -> None:
     resource = await data_gen.added_resource()
-    result = await resource_service.get_finished_records(resource.id)
+    result = await record_service.get_history(HistoryFilter(resource_id=resource.id))
     assert result.is_success
-    assert result.unwrap() == []
+    assert result.unwrap().records == []
+
+
+@pytest.mark.asyncio
+async def test_get_history_pages_with_cursor(record_service: RecordService) -> None:
+    resource = await data_gen.added_resource()
+    now = datetime.now()
+    for days in range(1, 8):
+        await data_gen.added_finished_record(resource=resource, return_date=now - timedelta(days=days))
+    history_filter = HistoryFilter(resource_id=resource.id)
+    first_page = (await record_service.get_history(history_filter, 1, 3)).unwrap()
+    by_cursor = (await record_service.get_history(history_filter, 2, 3, first_page.records[-1].record_id)).unwrap()
+    by_offset = (await record_service.get_history(history_filter, 2, 3)).unwrap()
+    assert first_page.total == 7
+    assert [i.record_id for i in by_cursor.records] == [i.record_id for i in by_offset.records]
+    assert by_cursor.records[0].return_date < first_page.records[-1].return_date
+
+
+@pytest.mark.asyncio
+async def test_get_history_by_period(record_service: RecordService) -> None:
+    resource = await data_gen.added_resource()
+    now = datetime.now()
+    old = await data_gen.added_finished_record(resource=resource, return_date=now - timedelta(days=40))
+    await data_gen.added_finished_record(resource=resource, return_date=now - timedelta(days=2))
+    history_filter = HistoryFilter(resource_id=resource.id, date_to=now - timedelta(days=30))
+    history = (await record_service.get_history(history_filter)).unwrap()
+    assert [i.record_id for i in history.records] == [old.id]
 
 
 @pytest.mark.asyncio
@@ -241,6 +324,15 @@ async def test_delete_all_free_only_taken(resource_service: ResourceService) ->
     assert result.unwrap() == []
 
 
+@pytest.mark.asyncio
+async def test_delete_all_free_ignores_state_columns(resource_service: ResourceService, uow: OrmUnitOfWork) -> None:
+    await data_gen.added_take_record()
+    async with uow:
+        await uow.session.execute(text("UPDATE resource SET holder_email = NULL"))
+    result = await resource_service.delete_all_free()
+    assert result.unwrap() == []
+
+
 @pytest.mark.asyncio
 async def test_update_field_success(resource_service: ResourceService) -> None:
     resource = await data_gen.added_resource()
@@ -267,6 +359,45 @@ async def test_update_field_wrong_field_name_400(resource_service: ResourceServi
     assert result.error_code == 400
 
 
+@pytest.mark.asyncio
+async def test_update_field_state_column_400(resource_service: ResourceService) -> None:
+    resource = await data_gen.added_resource()
+    result = await resource_service.update_field(resource.id, "holder_email", data_gen.random_email())
+    assert result.is_failure
+    assert result.error_code == 400
+
+
+@pytest.mark.asyncio
+async def test_update_field_with_version_success(resource_service: ResourceService) -> None:
+    resource = await data_gen.added_resource()
+    versioned = (await resource_service.get_versioned(resource.id)).unwrap()
+    result = await resource_service.update_field(resource.id, "comment", "qwerty", versioned.updated_at)
+    updated = result.unwrap()
+    assert updated.resource.comment == "qwerty"
+    assert updated.updated_at != versioned.updated_at
+
+
+@pytest.mark.asyncio
+async def test_update_field_is_one_query(
+        resource_service: ResourceService,
+        assert_max_queries: Callable[..., ContextManager[QueryTracker]]
+) -> None:
+    resource = await data_gen.added_resource()
+    with assert_max_queries(1):
+        (await resource_service.update_field(resource.id, "firmware", "1.2")).unwrap()
+
+
+@pytest.mark.asyncio
+async def test_update_field_conflict_409(resource_service: ResourceService) -> None:
+    resource = await data_gen.added_resource()
+    versioned = (await resource_service.get_versioned(resource.id)).unwrap()
+    await resource_service.update_field(resource.id, "comment", "first", versioned.updated_at)
+    result = await resource_service.update_field(resource.id, "comment", "second", versioned.updated_at)
+    assert result.is_failure
+    assert result.error_code == 409
+    assert (await resource_service.get(resource.id)).unwrap().comment == "first"
+
+
 @pytest.mark.asyncio
 async def test_add_with_record_success(
         resource_service: ResourceService,
@@ -387,3 +518,33 @@ async def test_add_many_with_record_vendor_code_duplicates_400(
     assert add_result.is_failure
     assert add_result.error_code == 400
     assert resource.vendor_code in add_result.error
+
+
+@pytest.mark.asyncio
+async def test_state_follows_take_queue_and_return(resource_service: ResourceService,
+                                                    record_service: RecordService) -> None:
+    resource = await data_gen.added_resource()
+    holder, next_in_queue = await data_gen.added_visitor(), await data_gen.added_visitor()
+    due_date = datetime.now() + timedelta(days=5)
+    (await record_service.take_resource(resource.id, holder.email, "склад", due_date)).unwrap()
+    (await record_service.enqueue(resource.id, next_in_queue.email)).unwrap()
+    taken = (await resource_service.get(resource.id)).unwrap()
+    assert (taken.user_email, taken.address, taken.return_date) == (holder.email, "склад", due_date)
+    async with resource_service.unit_of_work as uow:
+        assert (await uow.resources.get(resource.id)).queue_length == 1
+
+    (await record_service.return_resource(resource.id)).unwrap()
+    returned = (await resource_service.get(resource.id)).unwrap()
+    assert returned.user_email == next_in_queue.email
+    async with resource_service.unit_of_work as uow:
+        assert (await uow.resources.get(resource.id)).queue_length == 0
+
+
+@pytest.mark.asyncio
+async def test_check_state_fixes_drift(resource_service: ResourceService, uow: OrmUnitOfWork) -> None:
+    take_record = await data_gen.added_take_record()
+    async with uow:
+        await uow.session.execute(text("UPDATE resource SET holder_email = NULL, queue_length = 3"))
+    assert (await resource_service.check_state()).unwrap() == [take_record.resource_id]
+    assert (await resource_service.check_state()).unwrap() == []
+    assert (await resource_service.get(take_record.resource_id)).unwrap().user_email == take_record.user_email
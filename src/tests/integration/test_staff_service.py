@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from typing import List
+
+import httpx
+import pytest
+
+import tests.integration.data_gen as data_gen
+from helpers.staffhelper import StaffClient
+from service.orm_uow import OrmUnitOfWork
+from service.services import StaffService, VisitorService
+
+
+class StaffStub:
+    """Заглушка АПИ Стаффа: отдает заданных уволенных и запоминает, с какой даты их запрашивали"""
+
+    def __init__(self, fired_emails: List[str]) -> None:
+        self.fired_emails = fired_emails
+        self.requested_since: List[str] = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/connect/token":
+            return httpx.Response(200, json={"access_token": "token", "expires_in": 3600})
+        self.requested_since.append(request.url.params["LastModifedDate"])
+        return httpx.Response(200, json={"firedUsers": [{"email": i} for i in self.fired_emails]})
+
+    def create_service(self, uow: OrmUnitOfWork) -> StaffService:
+        client = StaffClient("id", "secret", backoff=0, transport=httpx.MockTransport(self.handle))
+        return StaffService(uow, client)
+
+
+@pytest.mark.asyncio
+async def test_dismissed_visitors_are_found(uow: OrmUnitOfWork, visitor_service: VisitorService) -> None:
+    dismissed = await data_gen.added_visitor()
+    await data_gen.added_visitor()
+    stub = StaffStub([dismissed.email, "not_a_visitor@skbkontur.ru"])
+    result = await stub.create_service(uow).sync_dismissed()
+    assert result.unwrap() == 2
+    assert [i.email for i in (await visitor_service.get_dismissed()).unwrap()] == [dismissed.email]
+
+
+@pytest.mark.asyncio
+async def test_sync_continues_from_watermark(uow: OrmUnitOfWork) -> None:
+    stub = StaffStub([])
+    service = stub.create_service(uow)
+    started_at = datetime.now()
+    await service.sync_dismissed()
+    await service.sync_dismissed()
+    first_since, second_since = [datetime.fromisoformat(i) for i in stub.requested_since]
+    assert first_since < started_at - timedelta(days=5)
+    assert second_since >= started_at
+
+
+@pytest.mark.asyncio
+async def test_repeated_sync_keeps_dismissed(uow: OrmUnitOfWork, visitor_service: VisitorService) -> None:
+    dismissed = await data_gen.added_visitor()
+    stub = StaffStub([dismissed.email])
+    service = stub.create_service(uow)
+    await service.sync_dismissed()
+    stub.fired_emails = []
+    await service.sync_dismissed()
+    assert [i.email for i in (await visitor_service.get_dismissed()).unwrap()] == [dismissed.email]
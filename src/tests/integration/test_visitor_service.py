@@ -1,7 +1,8 @@
 import pytest
 
 import tests.integration.data_gen as data_gen
-from service.services import VisitorService
+from domain.history_dto import HistoryFilter
+from service.services import RecordService, VisitorService
 
 
 @pytest.mark.asyncio
@@ -12,6 +13,15 @@ async def test_get_success(visitor_service: VisitorService) -> None:
     assert result.unwrap().id == visitor.id
 
 
+@pytest.mark.asyncio
+async def test_get_loads_only_active_records(visitor_service: VisitorService) -> None:
+    visitor = await data_gen.added_visitor()
+    take_record = await data_gen.added_take_record(visitor)
+    await data_gen.added_finished_record(visitor)
+    result = await visitor_service.get(visitor.email)
+    assert [i.id for i in result.unwrap().records] == [take_record.id]
+
+
 @pytest.mark.asyncio
 async def test_get_404(visitor_service: VisitorService) -> None:
     result = await visitor_service.get(data_gen.random_str())
@@ -65,6 +75,14 @@ async def test_get_all_empty_list(visitor_service: VisitorService) -> None:
     assert result.unwrap() == []
 
 
+@pytest.mark.asyncio
+async def test_get_many_keeps_order(visitor_service: VisitorService) -> None:
+    visitor1 = await data_gen.added_visitor()
+    visitor2 = await data_gen.added_visitor()
+    result = await visitor_service.get_many([visitor2.id, -1, visitor1.id])
+    assert [i.id for i in result.unwrap()] == [visitor2.id, visitor1.id]
+
+
 @pytest.mark.asyncio
 async def test_delete_success(visitor_service: VisitorService) -> None:
     visitor = await data_gen.added_visitor()
@@ -117,21 +135,21 @@ async def test_add_409(visitor_service: VisitorService) -> None:
 
 
 @pytest.mark.asyncio
-async def test_finished_records_success(visitor_service: VisitorService) -> None:
+async def test_history_success(record_service: RecordService) -> None:
     visitor = await data_gen.added_visitor()
     finished_record1 = await data_gen.added_finished_record(visitor=visitor)
     finished_record2 = await data_gen.added_finished_record(visitor=visitor)
-    result = await visitor_service.get_finished_records(visitor.id)
+    result = await record_service.get_history(HistoryFilter(visitor_id=visitor.id))
     assert result.is_success
-    assert set([i.record_id for i in result.unwrap()]) == {finished_record1.id, finished_record2.id}
+    assert set([i.record_id for i in result.unwrap().records]) == {finished_record1.id, finished_record2.id}
 
 
 @pytest.mark.asyncio
-async def test_finished_records_empty_list(visitor_service: VisitorService) -> None:
+async def test_history_empty_list(record_service: RecordService) -> None:
     visitor = await data_gen.added_visitor()
-    result = await visitor_service.get_finished_records(visitor.id)
+    result = await record_service.get_history(HistoryFilter(visitor_id=visitor.id))
     assert result.is_success
-    assert result.unwrap() == []
+    assert result.unwrap().records == []
 
 
 @pytest.mark.asyncio
@@ -171,6 +189,40 @@ async def test_get_queue_success(visitor_service: VisitorService) -> None:
     assert result.unwrap()[0].name == queue_record.resource.name
 
 
+@pytest.mark.asyncio
+async def test_get_queue_shows_holder_in_enqueue_order(visitor_service: VisitorService) -> None:
+    visitor = await data_gen.added_visitor()
+    take_record = await data_gen.added_take_record()
+    later = await data_gen.added_queue_record(visitor=visitor, resource=take_record.resource)
+    earlier = await data_gen.added_queue_record(visitor=visitor)
+    result = await visitor_service.get_queue(visitor)
+    assert result.is_success
+    expected = sorted([later, earlier], key=lambda i: i.enqueue_date)
+    assert [i.id for i in result.unwrap()] == [i.resource_id for i in expected]
+    held = next(i for i in result.unwrap() if i.id == take_record.resource_id)
+    assert held.user_email == take_record.user_email
+    assert held.return_date == take_record.return_date
+
+
+@pytest.mark.asyncio
+async def test_get_dashboard_success(visitor_service: VisitorService) -> None:
+    visitor = await data_gen.added_visitor()
+    mine = await data_gen.added_take_record(visitor=visitor)
+    take_record = await data_gen.added_take_record()
+    first = await data_gen.added_queue_record(resource=take_record.resource)
+    my_place = await data_gen.added_queue_record(visitor=visitor, resource=take_record.resource)
+    result = await visitor_service.get_dashboard(visitor.email)
+    assert result.is_success
+    dashboard = result.unwrap()
+    assert [i.id for i in dashboard.taken] == [mine.resource_id]
+    assert dashboard.taken[0].return_date == mine.return_date
+    assert [i.resource.id for i in dashboard.queued] == [take_record.resource_id]
+    queued = dashboard.queued[0]
+    assert queued.resource.user_email == take_record.user_email
+    assert queued.queue_length == 2
+    assert queued.queue_position == (2 if first.enqueue_date <= my_place.enqueue_date else 1)
+
+
 @pytest.mark.asyncio
 async def test_get_queue_empty_list(visitor_service: VisitorService) -> None:
     visitor = await data_gen.added_visitor()
@@ -0,0 +1,145 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import DisabledEventIsolation, MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+
+from helpers.buffered_storage import BufferedIsolation, BufferedStorage
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=2)
+
+
+class AddFSM(StatesGroup):
+    name = State()
+    date = State()
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands: List[Tuple[Any, ...]] = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+    def get(self, key: str) -> "FakePipeline":
+        self.commands.append(("get", key))
+        return self
+
+    def set(self, key: str, value: str, ex: Optional[int] = None) -> "FakePipeline":
+        self.commands.append(("set", key, value))
+        return self
+
+    def delete(self, key: str) -> "FakePipeline":
+        self.commands.append(("delete", key))
+        return self
+
+    async def execute(self) -> List[Any]:
+        self.redis.round_trips += 1
+        result: List[Any] = []
+        for command in self.commands:
+            if command[0] == "get":
+                value = self.redis.values.get(command[1])
+                result.append(value.encode("utf-8") if value is not None else None)
+            elif command[0] == "set":
+                self.redis.values[command[1]] = command[2]
+                result.append(True)
+            else:
+                result.append(int(self.redis.values.pop(command[1], None) is not None))
+        return result
+
+
+class FakeRedis:
+    """Только то, что нужно BufferedStorage: пайплайн и счетчик походов в Redis"""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, str] = dict()
+        self.round_trips = 0
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+
+def create_storage() -> Tuple[BufferedStorage, BufferedIsolation, FakeRedis]:
+    redis = FakeRedis()
+    storage = BufferedStorage(RedisStorage(redis=redis))  # type: ignore
+    return storage, BufferedIsolation(DisabledEventIsolation(), storage), redis
+
+
+async def fsm_step(storage: BufferedStorage, isolation: BufferedIsolation, value: str, next_state: State) -> None:
+    """Как шаг FSM: aiogram читает состояние, хэндлер дописывает данные и переключает состояние"""
+    state = FSMContext(storage=storage, key=KEY)
+    async with isolation.lock(KEY):
+        await state.get_state()
+        await state.update_data(name=value)
+        await state.set_state(next_state)
+
+
+async def test_step_costs_one_read_and_one_write() -> None:
+    storage, isolation, redis = create_storage()
+    await fsm_step(storage, isolation, "Касса", AddFSM.name)
+    assert redis.round_trips == 2
+    await fsm_step(storage, isolation, "Сканер", AddFSM.date)
+    assert redis.round_trips == 4
+    state = FSMContext(storage=storage, key=KEY)
+    async with isolation.lock(KEY):
+        assert await state.get_state() == AddFSM.date.state
+        assert await state.get_data() == {"name": "Сканер"}
+    assert redis.round_trips == 5
+
+
+async def test_read_only_step_does_not_write() -> None:
+    storage, isolation, redis = create_storage()
+    async with isolation.lock(KEY):
+        await storage.get_state(KEY)
+        await storage.get_data(KEY)
+    assert redis.round_trips == 1
+
+
+async def test_clear_deletes_keys() -> None:
+    storage, isolation, redis = create_storage()
+    await fsm_step(storage, isolation, "Касса", AddFSM.name)
+    async with isolation.lock(KEY):
+        await FSMContext(storage=storage, key=KEY).clear()
+    assert redis.values == dict()
+
+
+async def test_changes_are_written_after_error() -> None:
+    storage, isolation, redis = create_storage()
+    with pytest.raises(RuntimeError):
+        async with isolation.lock(KEY):
+            await storage.set_state(KEY, AddFSM.name)
+            raise RuntimeError()
+    async with isolation.lock(KEY):
+        assert await storage.get_state(KEY) == AddFSM.name.state
+
+
+async def test_returned_data_is_a_copy() -> None:
+    storage, isolation, redis = create_storage()
+    async with isolation.lock(KEY):
+        data = await storage.get_data(KEY)
+        data["name"] = "Касса"
+        assert await storage.get_data(KEY) == dict()
+
+
+async def test_without_buffer_calls_pass_through() -> None:
+    memory = MemoryStorage()
+    storage = BufferedStorage(memory)
+    await storage.set_state(KEY, AddFSM.name)
+    await storage.set_data(KEY, {"name": "Касса"})
+    assert await memory.get_state(KEY) == AddFSM.name.state
+    assert await memory.get_data(KEY) == {"name": "Касса"}
+
+
+async def test_buffer_over_memory_storage() -> None:
+    memory = MemoryStorage()
+    storage = BufferedStorage(memory)
+    await fsm_step(storage, BufferedIsolation(DisabledEventIsolation(), storage), "Касса", AddFSM.date)
+    assert await memory.get_state(KEY) == AddFSM.date.state
+    assert await memory.get_data(KEY) == {"name": "Касса"}
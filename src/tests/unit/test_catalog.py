@@ -0,0 +1,53 @@
+from service.catalog import CatalogSnapshot, CatalogItem
+
+
+def create_snapshot() -> CatalogSnapshot:
+    snapshot = CatalogSnapshot()
+    snapshot.replace(
+        items=[
+            CatalogItem(2, "Атол 91Ф", "Онлайн-касса", "ZN-002", user_email="a@skbkontur.ru", queue_length=1),
+            CatalogItem(1, "Эвотор 7.2", "Онлайн-касса", "ZN-001"),
+            CatalogItem(3, "Штрих-М", "Весы", "SN-777"),
+        ],
+        categories=["Онлайн-касса", "Весы", "Сканер"]
+    )
+    return snapshot
+
+
+def test_search_ignores_case() -> None:
+    snapshot = create_snapshot()
+    assert [i.id for i in snapshot.search("ЭВОТОР", 200, 10000)] == [1]
+    assert [i.id for i in snapshot.search("касса", 200, 10000)] == [1, 2]
+    assert [i.id for i in snapshot.search("zn-00", 1, 10000)] == [1]
+
+
+def test_search_by_id() -> None:
+    snapshot = create_snapshot()
+    assert [i.id for i in snapshot.search("3", 200, 10000)] == [3]
+    assert snapshot.search("4", 200, 10000) == []
+
+
+def test_search_does_not_match_across_fields() -> None:
+    assert create_snapshot().search("7.2онлайн", 200, 10000) == []
+
+
+def test_apply_moves_resource_between_categories() -> None:
+    snapshot = create_snapshot()
+    snapshot.apply(3, CatalogItem(3, "Штрих-М", "Сканер", "SN-778"))
+    assert snapshot.list_by_category_name("Весы") == []
+    assert [i.id for i in snapshot.list_by_category_name("Сканер")] == [3]
+    assert snapshot.get_by_vendor_code("SN-777") is None
+    assert snapshot.get_by_vendor_code("SN-778").id == 3
+
+
+def test_apply_none_deletes_resource() -> None:
+    snapshot = create_snapshot()
+    snapshot.apply(2, None)
+    assert snapshot.get(2) is None
+    assert [i.id for i in snapshot.list()] == [1, 3]
+
+
+def test_item_to_dto() -> None:
+    dto = create_snapshot().get(2).to_dto()
+    assert dto.user_email == "a@skbkontur.ru"
+    assert dto.vendor_code == "ZN-002"
@@ -0,0 +1,45 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from benchmarks.dataset import DatasetSpec, RECORD_COLUMNS, generate
+from domain.models import CATEGORIES
+
+COLUMN = {name: i for i, name in enumerate(RECORD_COLUMNS)}
+
+
+def test_same_seed_gives_same_dataset() -> None:
+    def shape(seed: int) -> list:
+        dataset = generate(DatasetSpec(resources=50, visitors=20, seed=seed))
+        return [(i[1], i[2]) for i in dataset.records]
+
+    assert shape(3) == shape(3)
+    assert shape(3) != shape(4)
+
+
+def test_dataset_is_consistent() -> None:
+    spec = DatasetSpec(resources=2000, visitors=200, history=5, taken_share=0.3, overdue_share=0.2, queue_share=0.5)
+    dataset = generate(spec)
+    assert len(dataset.resources) == 2000
+    assert {i[2] for i in dataset.resources} <= set(CATEGORIES)
+    assert len({i[0] for i in dataset.records}) == len(dataset.records)
+    assert len({i[3] for i in dataset.resources}) == len(dataset.resources)
+    active = defaultdict(list)
+    for record in dataset.records:
+        if not record[COLUMN["finished"]]:
+            active[record[COLUMN["resource_id"]]].append(record)
+    holders = {resource_id: [i for i in records if i[COLUMN["take_date"]] is not None]
+               for resource_id, records in active.items()}
+    # У занятого устройства ровно один держатель, у свободного нет активных записей
+    assert all(len(i) == 1 for i in holders.values())
+    assert not set(active) & set(dataset.free_resource_ids)
+    assert 0.25 < len(active) / len(dataset.resources) < 0.35
+    overdue = [i[0] for i in holders.values() if i[0][COLUMN["return_date"]] < datetime.now()]
+    assert 0 < len(overdue) < len(holders)
+    assert any(len(records) > 1 for records in active.values())
+
+
+def test_few_visitors_take_most_devices() -> None:
+    dataset = generate(DatasetSpec(resources=2000, visitors=500, history=5))
+    takes = Counter(i[COLUMN["user_email"]] for i in dataset.records)
+    top = sum(count for _, count in takes.most_common(50))
+    assert top > len(dataset.records) * 0.3
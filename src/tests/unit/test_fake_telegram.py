@@ -0,0 +1,43 @@
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from benchmarks.fake_telegram import FakeTelegramServer, FakeSession, generate_updates
+
+
+async def test_bot_works_with_fake_server() -> None:
+    server = FakeTelegramServer(port=0)
+    await server.start()
+    bot = Bot(token="42:fake", session=AiohttpSession(api=TelegramAPIServer.from_base(server.base_url)))
+    try:
+        message = await bot.send_message(chat_id=100, text="Привет")
+        assert message.chat.id == 100
+        assert message.text == "Привет"
+        server.push_updates(generate_updates(3, [100, 200]))
+        updates = await bot.get_updates(timeout=1)
+        assert [i.update_id for i in updates] == [1, 2, 3]
+        assert server.calls["sendmessage"] == 1
+        assert server.calls["getupdates"] == 1
+    finally:
+        await bot.session.close()
+        await server.stop()
+
+
+def test_generated_updates_are_reproducible() -> None:
+    def chats_and_texts(seed: int) -> list:
+        return [(i["message"]["chat"]["id"], i["message"]["text"]) for i in generate_updates(10, [1, 2, 3], seed=seed)]
+
+    assert chats_and_texts(7) == chats_and_texts(7)
+
+
+async def test_fake_session_answers_without_network() -> None:
+    session = FakeSession()
+    bot = Bot(token="42:fake", session=session)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="2", callback_data="page|2")]])
+    message = await bot.send_message(chat_id=100, text="Привет", reply_markup=keyboard)
+    assert message.chat.id == 100
+    assert message.text == "Привет"
+    assert await bot.answer_callback_query("1")
+    assert session.inline_keyboards[100][0][0]["callback_data"] == "page|2"
+    assert session.fake_api.calls == {"sendmessage": 1, "answercallbackquery": 1}
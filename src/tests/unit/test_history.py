@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+import pytest
+
+from domain.history_dto import HistoryFilter
+from helpers.history import HISTORY_PAGE_HANDLE, cursor_for, decode_query, encode_query, parse_date_range
+from helpers.tghelper import Paginator
+
+
+def test_query_roundtrip_fits_callback_data() -> None:
+    history_filter = HistoryFilter(resource_id=123456, date_from=datetime(2024, 9, 1), date_to=datetime(2024, 10, 1))
+    query = encode_query(history_filter, 12345, 987654321)
+    keyboard = Paginator(12345, [0] * 5, 5, total=99999 * 5).create_keyboard(HISTORY_PAGE_HANDLE, query)
+    assert all(len(i.callback_data.encode()) <= 64 for row in keyboard.inline_keyboard for i in row)
+    assert decode_query(query) == (history_filter, 12345, 987654321)
+
+
+def test_query_roundtrip_without_period_and_cursor() -> None:
+    history_filter = HistoryFilter(visitor_id=7)
+    assert decode_query(encode_query(history_filter, 1, None)) == (history_filter, 1, None)
+
+
+@pytest.mark.parametrize("text, expected", [
+    (None, (None, None)),
+    ("01.09.2024", (datetime(2024, 9, 1), None)),
+    ("01.09.2024-30.09.2024", (datetime(2024, 9, 1), datetime(2024, 10, 1))),
+    ("-30.09.2024", (None, datetime(2024, 10, 1))),
+])
+def test_parse_date_range(text: Optional[str], expected: Tuple[Optional[datetime], Optional[datetime]]) -> None:
+    assert parse_date_range(text) == expected
+
+
+def test_parse_date_range_error() -> None:
+    with pytest.raises(ValueError):
+        parse_date_range("2024.09.01")
+
+
+def test_cursor_only_for_next_page() -> None:
+    assert cursor_for(3, 2, 100) == 100
+    assert cursor_for(1, 2, 100) is None
+    assert cursor_for(5, 2, 100) is None
+
+
+def test_paginator_with_total_keeps_page() -> None:
+    paginator = Paginator(3, [10, 11, 12, 13, 14], 5, total=23)
+    assert paginator.pages == 5
+    assert paginator.get_objects_on_page() == [10, 11, 12, 13, 14]
+    assert "23" in paginator.result_message()
@@ -0,0 +1,57 @@
+from typing import Any
+
+import pytest
+from aiogram.dispatcher.event.handler import HandlerObject
+from sqlalchemy import create_engine, text
+
+from helpers.metrics import Registry, current_stats, instrument_sqlalchemy, UpdateStats
+from middlewares.metrics_middleware import UpdateMetrics, HandlerMetrics, handler_label, UPDATE_ERRORS
+
+
+async def search_resource_handler(*args: Any) -> None:
+    pass
+
+
+def test_histogram_render() -> None:
+    registry = Registry()
+    histogram = registry.histogram("zoo_test_seconds", "Тест", ("handler",), buckets=(0.1, 1))
+    histogram.observe(0.05, "search")
+    histogram.observe(0.5, "search")
+    histogram.observe(5, "search")
+    lines = registry.render().splitlines()
+    assert 'zoo_test_seconds_bucket{handler="search",le="0.1"} 1' in lines
+    assert 'zoo_test_seconds_bucket{handler="search",le="1"} 2' in lines
+    assert 'zoo_test_seconds_bucket{handler="search",le="+Inf"} 3' in lines
+    assert 'zoo_test_seconds_count{handler="search"} 3' in lines
+
+
+def test_sql_statements_are_counted() -> None:
+    instrument_sqlalchemy()
+    instrument_sqlalchemy()
+    stats = UpdateStats()
+    token = current_stats.set(stats)
+    try:
+        with create_engine("sqlite://").connect() as connection:
+            connection.execute(text("select 1"))
+            connection.execute(text("select 2"))
+    finally:
+        current_stats.reset(token)
+    assert stats.sql_statements == 2
+    assert stats.sql_time > 0
+
+
+async def test_handler_errors_are_counted_once() -> None:
+    handler_object = HandlerObject(callback=search_resource_handler)
+    label = handler_label(handler_object)
+
+    async def failing_handler(event: Any, data: dict) -> None:
+        raise ValueError()
+
+    async def inner(event: Any, data: dict) -> None:
+        await HandlerMetrics()(failing_handler, event, data)
+
+    errors_before = UPDATE_ERRORS.values.get((label,), 0)
+    with pytest.raises(ValueError):
+        await UpdateMetrics()(inner, None, {"handler": handler_object})  # type: ignore
+    assert label.endswith("test_metrics.search_resource_handler")
+    assert UPDATE_ERRORS.values[(label,)] == errors_before + 1
@@ -0,0 +1,34 @@
+import asyncio
+
+from benchmarks.dataset import DatasetSpec, generate
+from benchmarks.micro import CASES, Fixture, find_regressions, measure
+
+
+async def test_measure_sync_and_async_operations() -> None:
+    calls = []
+
+    async def operation() -> None:
+        calls.append(1)
+        await asyncio.sleep(0)
+
+    timing = await measure(operation, min_rounds=3, max_rounds=3, budget=0)
+    assert timing.rounds == 3
+    assert len(calls) == 4
+    assert 0 <= timing.min_ms <= timing.median_ms
+    assert (await measure(lambda: sum(range(100)), min_rounds=2, max_rounds=2)).rounds == 2
+
+
+def test_find_regressions_uses_tolerance_and_noise_floor() -> None:
+    baseline = {"a[100]": {"median_ms": 10.0}, "b[100]": {"median_ms": 0.01}, "c[100]": {"median_ms": 10.0}}
+    results = {"a[100]": {"median_ms": 13.0}, "b[100]": {"median_ms": 0.02}, "c[100]": {"median_ms": 11.0},
+               "new[100]": {"median_ms": 1.0}}
+    regressions = find_regressions(results, baseline, tolerance=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("a[100]: 10.0 -> 13.0")
+
+
+async def test_cases_without_db_run() -> None:
+    fixture = Fixture(50, generate(DatasetSpec(resources=50, visitors=20)))
+    for case in [i for i in CASES if not i.db]:
+        timing = await measure(await case.setup(fixture), min_rounds=1, max_rounds=1)
+        assert timing.rounds == 1, case.name
@@ -0,0 +1,18 @@
+from domain.dashboard_dto import QueuedResourceDTO
+from domain.models import ActionType, Visitor
+from domain.resource_info import ResourceInfoDTO
+from helpers.presentation import format_note
+
+
+def test_queued_note_shows_position_and_leave_action() -> None:
+    resource = ResourceInfoDTO.trusted(5, "Касса", "Онлайн-касса", "f4194", user_email="holder@skbkontur.ru")
+    queued = QueuedResourceDTO(resource=resource, queue_position=2, queue_length=3)
+    note = format_note(queued.resource, Visitor(email="me@skbkontur.ru", is_admin=False), queued.available_action,
+                       queued.queue_position, queued.queue_length)
+    assert "Вы в очереди 2-й из 3\r\n" in note
+    assert note.index("Вы в очереди") < note.index(f"{ActionType.LEAVE.value}5")
+
+
+def test_queue_on_free_resource_allows_take() -> None:
+    resource = ResourceInfoDTO.trusted(5, "Касса", "Онлайн-касса", "f4194")
+    assert QueuedResourceDTO(resource=resource, queue_position=1, queue_length=1).available_action == ActionType.TAKE
@@ -0,0 +1,68 @@
+import asyncio
+import marshal
+from typing import Any, List, Optional, Tuple
+
+import pytest
+
+from helpers.profiling import CpuProfiler, MemoryProfiler, parse_profiling_limit
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.documents: List[Tuple[int, str, bytes]] = []
+
+    async def send_document(self, chat_id: int, document: Any, **kwargs: Any) -> None:
+        self.documents.append((chat_id, document.filename, document.data))
+
+
+def busy_work() -> int:
+    return sum(i * i for i in range(10000))
+
+
+@pytest.mark.parametrize("text, expected", [("200", (200, None)), ("30s", (None, 30)), (" 15С ", (None, 15))])
+def test_parse_profiling_limit(text: str, expected: Tuple[Optional[int], Optional[int]]) -> None:
+    assert parse_profiling_limit(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "abc", "0", "-5", "100000s"])
+def test_parse_profiling_limit_rejects_garbage(text: str) -> None:
+    with pytest.raises(ValueError):
+        parse_profiling_limit(text)
+
+
+async def test_cpu_profiler_stops_after_updates_and_sends_report() -> None:
+    bot = FakeBot()
+    profiler = CpuProfiler()
+    profiler.start(bot, 42, updates=2)  # type: ignore
+    busy_work()
+    await profiler.on_update_processed()
+    assert profiler.is_active
+    await profiler.on_update_processed()
+    assert not profiler.is_active
+    [(chat_id, txt_name, txt), (_, prof_name, prof)] = bot.documents
+    assert chat_id == 42
+    assert txt_name.endswith(".txt") and prof_name.endswith(".prof")
+    assert "busy_work" in txt.decode("utf-8")
+    assert any(key[2] == "busy_work" for key in marshal.loads(prof))
+
+
+async def test_cpu_profiler_stops_by_timer() -> None:
+    bot = FakeBot()
+    profiler = CpuProfiler()
+    profiler.start(bot, 42, seconds=0.01)  # type: ignore
+    await asyncio.sleep(0.05)
+    assert not profiler.is_active
+    assert len(bot.documents) == 2
+
+
+def test_memory_profiler_shows_growth() -> None:
+    profiler = MemoryProfiler()
+    profiler.start()
+    try:
+        leak = [bytearray(1024) for _ in range(1000)]
+        report = profiler.diff()
+    finally:
+        profiler.stop()
+    assert "test_profiling.py" in report
+    assert not profiler.is_active
+    assert len(leak) == 1000
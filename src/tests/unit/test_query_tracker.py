@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from helpers.query_tracker import normalize_statement, track_queries
+
+
+@pytest.mark.parametrize("statement, expected", [
+    ("SELECT * FROM resource WHERE resource.id = $1::INTEGER", "SELECT * FROM resource WHERE resource.id = ?::INTEGER"),
+    ("SELECT *\n  FROM record WHERE record.resource_id IN ($1::INTEGER, $2::INTEGER, $3::INTEGER)",
+     "SELECT * FROM record WHERE record.resource_id IN (...)"),
+    ("select * from visitor where email = 'a@skbkontur.ru' limit 10",
+     "select * from visitor where email = ? limit ?"),
+    ("select param_1 from t where a = %(param_1)s", "select param_1 from t where a = ?"),
+])
+def test_normalize_statement(statement: str, expected: str) -> None:
+    assert normalize_statement(statement) == expected
+
+
+def test_repeated_statements_are_reported_with_call_site() -> None:
+    with create_engine("sqlite://").connect() as connection:
+        with track_queries("Тест", threshold=2) as tracker:
+            connection.execute(text("select count(*) from sqlite_master"))
+            for i in range(3):
+                connection.execute(text("select :x"), {"x": i})
+    assert tracker.total == 4
+    repeated = tracker.repeated()
+    assert [(shape, stats.count) for shape, stats in repeated] == [("select ?", 3)]
+    assert "test_query_tracker.py" in tracker.report()
+
+
+def test_queries_outside_block_are_not_tracked() -> None:
+    with create_engine("sqlite://").connect() as connection:
+        with track_queries() as tracker:
+            pass
+        connection.execute(text("select 1"))
+    assert tracker.total == 0
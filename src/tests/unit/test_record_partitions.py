@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from database.record_partitions import add_months, months_to_create, months_to_drop, parse_partition_name, \
+    partition_name, DEFAULT_PARTITION
+
+
+def test_add_months_over_year() -> None:
+    assert add_months(datetime(2024, 11, 1), 3) == datetime(2025, 2, 1)
+    assert add_months(datetime(2024, 1, 1), -1) == datetime(2023, 12, 1)
+
+
+def test_partition_name_roundtrip() -> None:
+    name = partition_name(datetime(2024, 9, 1))
+    assert name == "record_finished_y2024m09"
+    assert parse_partition_name(name) == datetime(2024, 9, 1)
+    assert parse_partition_name(DEFAULT_PARTITION) is None
+
+
+def test_months_to_create_include_current() -> None:
+    assert months_to_create(datetime(2024, 12, 15, 10, 30), 2) == \
+           [datetime(2024, 12, 1), datetime(2025, 1, 1), datetime(2025, 2, 1)]
+
+
+def test_months_to_drop_only_whole_months_before() -> None:
+    partitions = [DEFAULT_PARTITION] + [partition_name(datetime(2024, i, 1)) for i in range(6, 10)]
+    assert months_to_drop(partitions, datetime(2024, 8, 20)) == ["record_finished_y2024m06", "record_finished_y2024m07"]
@@ -1,5 +1,6 @@
 import datetime
 
+from database.orm_repository import _resource_info_select
 from domain.resource_info import ResourceInfoDTO
 
 
@@ -121,3 +122,20 @@ def test_description() -> None:
 У пользователя test@skbkontur.ru
 Освободится: 12.12.2999
 Находится: адрес"""
+
+
+def test_trusted_matches_validated() -> None:
+    row = (1, "name", "Онлайн-касса", "f4194", datetime.datetime(2024, 8, 30), None, "коммент",
+           "test@skbkontur.ru", "адрес", datetime.datetime(2024, 9, 1), datetime.datetime(2999, 12, 12))
+    validated = ResourceInfoDTO(**dict(zip(ResourceInfoDTO.model_fields, row)))
+    trusted = ResourceInfoDTO.from_row(row)
+    assert trusted.model_dump() == validated.model_dump()
+    assert trusted.values() == validated.values()
+    assert trusted.description() == validated.description()
+    assert trusted.model_fields_set == validated.model_fields_set
+    trusted.address = "другой"
+    assert ResourceInfoDTO.from_row(row).address == "адрес"
+
+
+def test_projection_columns_follow_dto_fields() -> None:
+    assert list(_resource_info_select().selected_columns.keys()) == list(ResourceInfoDTO.model_fields)
@@ -0,0 +1,56 @@
+from typing import List
+
+import pytest
+from sqlalchemy.exc import DBAPIError
+
+from service.services import retry_on_conflict, CONFLICT_ATTEMPTS
+
+
+class FakeDriverError(Exception):
+    def __init__(self, pgcode: str):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def driver_error(pgcode: str) -> DBAPIError:
+    return DBAPIError("UPDATE resource ...", None, FakeDriverError(pgcode))
+
+
+async def test_retries_serialization_failure() -> None:
+    calls: List[int] = []
+
+    @retry_on_conflict
+    async def enqueue() -> str:
+        calls.append(1)
+        if len(calls) == 1:
+            raise driver_error("40001")
+        return "ok"
+
+    assert await enqueue() == "ok"
+    assert len(calls) == 2
+
+
+async def test_gives_up_after_attempts() -> None:
+    calls: List[int] = []
+
+    @retry_on_conflict
+    async def enqueue() -> None:
+        calls.append(1)
+        raise driver_error("40P01")
+
+    with pytest.raises(DBAPIError):
+        await enqueue()
+    assert len(calls) == CONFLICT_ATTEMPTS
+
+
+async def test_other_errors_are_not_retried() -> None:
+    calls: List[int] = []
+
+    @retry_on_conflict
+    async def enqueue() -> None:
+        calls.append(1)
+        raise driver_error("23505")
+
+    with pytest.raises(DBAPIError):
+        await enqueue()
+    assert len(calls) == 1
@@ -0,0 +1,21 @@
+from helpers.search_session import MemorySearchSessionStore
+
+
+async def test_saved_ids_are_returned_by_token() -> None:
+    store = MemorySearchSessionStore(ttl=60)
+    token = await store.save([3, 1, 2])
+    assert await store.get(token) == [3, 1, 2]
+    assert len(f"search_resource,10,{token}".encode()) <= 64
+
+
+async def test_unknown_token() -> None:
+    store = MemorySearchSessionStore(ttl=60)
+    assert await store.get("unknown") is None
+
+
+async def test_expired_session() -> None:
+    store = MemorySearchSessionStore(ttl=-1)
+    token = await store.save([1])
+    assert await store.get(token) is None
+    await store.save([2])
+    assert token not in store._sessions
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, List, Tuple
+
+from sqlalchemy import create_engine, text
+
+from helpers.slow_queries import SlowQueryLog, instrument_slow_queries, parameters_shape, SLOW_QUERIES
+
+
+def test_parameters_shape_hides_values() -> None:
+    assert parameters_shape((1, "secret@skbkontur.ru", None)) == "(int, str, NoneType)"
+    assert parameters_shape({"email": "secret@skbkontur.ru"}) == "{email: str}"
+    assert parameters_shape([(1,), (2,)], executemany=True) == "2 x (int)"
+
+
+def test_only_slow_queries_are_kept_in_bounded_buffer() -> None:
+    log = SlowQueryLog(threshold=0.1, size=2)
+    log.record("select 1", (), 0.05)
+    for i in range(3):
+        log.record(f"select {i}", (i,), 0.5)
+    assert [i.statement for i in log.queries] == ["select 1", "select 2"]
+    assert "test_slow_queries.py" in log.queries[0].call_site
+    assert log.render().index("select 2") < log.render().index("select 1")
+
+
+async def test_plan_is_captured_for_sampled_queries() -> None:
+    calls: List[Tuple[str, Any, bool]] = []
+
+    async def explainer(statement: str, parameters: Any, analyze: bool) -> str:
+        calls.append((statement, parameters, analyze))
+        return "Seq Scan on resource"
+
+    log = SlowQueryLog(threshold=0, explain_rate=1, explainer=explainer)
+    log.record("SELECT * FROM resource WHERE id = $1", (1,), 1)
+    await asyncio.sleep(0.01)
+    log.record("UPDATE resource SET name = $1", ("a",), 1)
+    await asyncio.sleep(0.01)
+    log.record("EXPLAIN SELECT 1", (), 1)
+    assert calls == [
+        ("SELECT * FROM resource WHERE id = $1", (1,), True),
+        ("UPDATE resource SET name = $1", ("a",), False)
+    ]
+    assert log.queries[0].plan == "Seq Scan on resource"
+    assert len(log.queries) == 2
+
+
+def test_engine_events_feed_global_log() -> None:
+    instrument_slow_queries(threshold=0, size=10, explain_rate=0)
+    try:
+        with create_engine("sqlite://").connect() as connection:
+            connection.execute(text("select :x"), {"x": 1})
+        assert any(i.statement == "select ?" for i in SLOW_QUERIES.queries)
+    finally:
+        instrument_slow_queries(threshold=float("inf"), size=10, explain_rate=0)
@@ -0,0 +1,67 @@
+import asyncio
+from typing import List, Optional
+
+from helpers.staff_cache import StaffLookup, MemoryStaffLookupCache
+
+
+class FakeStaff:
+    def __init__(self, emails: Optional[List[str]]) -> None:
+        self.emails = emails
+        self.calls = 0
+
+    async def search(self, username: str) -> Optional[List[str]]:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.emails
+
+
+def create_lookup(staff: FakeStaff) -> StaffLookup:
+    return StaffLookup(MemoryStaffLookupCache(), ttl=60, negative_ttl=60, cooldown=60, search=staff.search)
+
+
+async def test_found_emails_are_cached() -> None:
+    staff = FakeStaff(["a@skbkontur.ru"])
+    lookup = create_lookup(staff)
+    assert await lookup.search_emails("Nick") == ["a@skbkontur.ru"]
+    assert await lookup.search_emails("nick") == ["a@skbkontur.ru"]
+    assert staff.calls == 1
+
+
+async def test_not_found_is_cached() -> None:
+    staff = FakeStaff([])
+    lookup = create_lookup(staff)
+    for _ in range(3):
+        assert await lookup.search_emails("outsider") == []
+    assert staff.calls == 1
+
+
+async def test_staff_error_is_not_cached() -> None:
+    staff = FakeStaff(None)
+    lookup = create_lookup(staff)
+    assert await lookup.search_emails("nick") is None
+    assert await lookup.search_emails("nick") is None
+    assert staff.calls == 2
+
+
+async def test_concurrent_lookups_are_coalesced() -> None:
+    staff = FakeStaff(["a@skbkontur.ru"])
+    lookup = create_lookup(staff)
+    results = await asyncio.gather(*[lookup.search_emails("nick") for _ in range(10)])
+    assert results == [["a@skbkontur.ru"]] * 10
+    assert staff.calls == 1
+
+
+async def test_login_cooldown() -> None:
+    lookup = create_lookup(FakeStaff([]))
+    assert await lookup.try_login(1)
+    assert not await lookup.try_login(1)
+    assert await lookup.try_login(2)
+
+
+async def test_get_cached_does_not_call_staff() -> None:
+    staff = FakeStaff(["a@skbkontur.ru"])
+    lookup = create_lookup(staff)
+    assert await lookup.get_cached("nick") is None
+    await lookup.search_emails("nick")
+    assert await lookup.get_cached("Nick") == ["a@skbkontur.ru"]
+    assert staff.calls == 1
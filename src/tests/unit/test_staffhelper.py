@@ -0,0 +1,57 @@
+from collections import Counter
+
+import httpx
+import pytest
+
+from helpers.staffhelper import StaffClient, StaffApiError, CircuitBreaker
+
+
+def create_client(responses: dict, breaker: CircuitBreaker = None) -> tuple[StaffClient, Counter]:
+    calls: Counter = Counter()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls[request.url.path] += 1
+        statuses = responses[request.url.path]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if request.url.path == "/connect/token":
+            return httpx.Response(status, json={"access_token": f"token{calls[request.url.path]}", "expires_in": 3600})
+        return httpx.Response(status, json={"items": [
+            {"email": "a@skbkontur.ru", "status": "active"},
+            {"email": "b@skbkontur.ru", "status": "dismissed"}
+        ]})
+
+    client = StaffClient("id", "secret", backoff=0, breaker=breaker, transport=httpx.MockTransport(handler))
+    return client, calls
+
+
+async def test_token_is_cached() -> None:
+    client, calls = create_client({"/connect/token": [200], "/api/Suggest/bytype": [200]})
+    assert await client.search_emails("nick") == ["a@skbkontur.ru"]
+    assert await client.search_emails("nick") == ["a@skbkontur.ru"]
+    assert calls["/connect/token"] == 1
+
+
+async def test_server_errors_are_retried() -> None:
+    client, calls = create_client({"/connect/token": [200], "/api/Suggest/bytype": [503, 502, 200]})
+    assert await client.search_emails("nick") == ["a@skbkontur.ru"]
+    assert calls["/api/Suggest/bytype"] == 3
+
+
+async def test_revoked_token_is_refreshed() -> None:
+    client, calls = create_client({"/connect/token": [200], "/api/Suggest/bytype": [401, 200]})
+    assert await client.search_emails("nick") == ["a@skbkontur.ru"]
+    assert calls["/connect/token"] == 2
+
+
+async def test_breaker_stops_requests() -> None:
+    client, calls = create_client(
+        {"/connect/token": [200], "/api/Suggest/bytype": [500]},
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    )
+    for _ in range(2):
+        with pytest.raises(StaffApiError):
+            await client.search_emails("nick")
+    with pytest.raises(StaffApiError):
+        await client.search_emails("nick")
+    assert calls["/api/Suggest/bytype"] == 6
+    assert client.breaker.is_open
@@ -0,0 +1,36 @@
+import pytest
+
+from benchmarks.throughput import CommandStats, format_report, page_button, parse_mix, percentile
+
+
+def test_percentile_nearest_rank() -> None:
+    values = [i / 100 for i in range(1, 101)]
+    assert percentile(values, 0.5) == 0.5
+    assert percentile(values, 0.99) == 0.99
+    assert percentile([], 0.5) == 0
+
+
+def test_parse_mix() -> None:
+    assert parse_mix("search=3, mine=1") == {"search": 3, "mine": 1}
+    with pytest.raises(ValueError):
+        parse_mix("search=1,dance=1")
+
+
+def test_page_button_finds_page_in_paginator_keyboard() -> None:
+    keyboard = [[{"text": "1", "callback_data": "search_resource,1,abc"},
+                 {"text": "2", "callback_data": "search_resource,2,abc"}]]
+    assert page_button(2)(keyboard) == "search_resource,2,abc"
+    assert page_button(3)(keyboard) is None
+
+
+def test_report_compares_with_baseline() -> None:
+    stats = CommandStats(latencies=[0.01, 0.02, 0.03, 0.04], sql_statements=[3, 3, 4, 6])
+    summary = stats.summary()
+    assert summary["p50_ms"] == 20
+    assert summary["mean_sql"] == 4
+    result = {"updates": 4, "seconds": 1, "throughput": 4, "errors": 0, "peak_rss_mb": 100,
+              "commands": {"/all": summary}}
+    baseline = {"throughput": 2, "commands": {"/all": {"p50_ms": 40, "p95_ms": 40}}}
+    report = format_report(result, baseline)
+    assert "(+100%)" in report
+    assert "20.0 (-50%)" in report
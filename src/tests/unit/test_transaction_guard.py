@@ -0,0 +1,59 @@
+import logging
+from typing import Iterator
+
+import httpx
+import pytest
+
+from helpers.transaction_guard import NetworkInTransactionError, describe_request, install_transaction_guard, \
+    transaction_finished, transaction_started, uninstall_transaction_guard
+
+
+@pytest.fixture
+def guard() -> Iterator[None]:
+    yield
+    uninstall_transaction_guard()
+
+
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+
+
+def test_describe_request_hides_token() -> None:
+    result = describe_request("POST", "https://api.telegram.org/bot123:secret/sendMessage")
+    assert result == "POST api.telegram.org/.../sendMessage"
+
+
+async def test_request_in_transaction_raises(guard: None) -> None:
+    install_transaction_guard("raise")
+    token = transaction_started()
+    try:
+        with pytest.raises(NetworkInTransactionError):
+            await create_client().get("https://staff.test/api/users")
+    finally:
+        transaction_finished(token)
+    assert (await create_client().get("https://staff.test/api/users")).status_code == 200
+
+
+async def test_request_in_transaction_is_logged(guard: None, caplog: pytest.LogCaptureFixture) -> None:
+    install_transaction_guard("log")
+    token = transaction_started()
+    with caplog.at_level(logging.WARNING):
+        response = await create_client().get("https://staff.test/api/users")
+    transaction_finished(token)
+    assert response.status_code == 200
+    assert "GET staff.test/.../users" in caplog.text
+
+
+async def test_disabled_guard_does_nothing(guard: None) -> None:
+    install_transaction_guard("raise")
+    uninstall_transaction_guard()
+    token = transaction_started()
+    try:
+        assert (await create_client().get("https://staff.test/api/users")).status_code == 200
+    finally:
+        transaction_finished(token)
+
+
+def test_wrong_mode() -> None:
+    with pytest.raises(ValueError):
+        install_transaction_guard("warn")
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import random
+from typing import Optional
+
+import pytest
+from aiogram import Bot
+from aiogram.types import Update
+
+from benchmarks.fake_telegram import generate_updates
+from helpers.update_stream import partition_for, owned_partitions
+from workers.update_consumer import UpdateConsumer
+
+
+class FakeStream:
+    def __init__(self) -> None:
+        self.acked: list[str] = []
+
+    async def ack(self, partition: int, entry_id: str) -> None:
+        self.acked.append(entry_id)
+
+
+class PendingStream(FakeStream):
+    """Неподтвержденные записи воркера: читаются после start_id, не больше count за раз"""
+
+    def __init__(self, pending: list) -> None:
+        super().__init__()
+        self.pending = pending
+        self.reads = 0
+
+    async def read_pending(self, consumer: str, start_ids: dict, count: int) -> tuple:
+        self.reads += 1
+        result, next_ids = [], dict()
+        for partition, start_id in start_ids.items():
+            entries = [i for i in self.pending if i[0] == partition and i[1] > start_id][:count]
+            if entries:
+                result += entries
+                next_ids[partition] = entries[-1][1]
+        return result, next_ids
+
+
+class FakeDispatcher:
+    def __init__(self, failing_update_id: int = -1) -> None:
+        self.fed: list[Update] = []
+        self.failing_update_id = failing_update_id
+
+    async def feed_update(self, bot: Bot, update: Update) -> None:
+        await asyncio.sleep(random.random() / 1000)
+        self.fed.append(update)
+        if update.update_id == self.failing_update_id:
+            raise ValueError("Ошибка в хэндлере")
+
+
+def entries(count: int) -> list:
+    return [(0, f"{i['update_id']}-0", json.dumps(i)) for i in generate_updates(count, [1, 2, 3])]
+
+
+def create_consumer(dp: FakeDispatcher, stream: FakeStream) -> UpdateConsumer:
+    return UpdateConsumer(dp, Bot(token="42:fake"), stream, "worker-0", [0])  # type: ignore
+
+
+async def test_updates_of_one_chat_are_fed_in_order() -> None:
+    dp = FakeDispatcher()
+    stream = FakeStream()
+    await create_consumer(dp, stream).process(entries(30))
+    for chat_id in [1, 2, 3]:
+        update_ids = [i.update_id for i in dp.fed if i.message.chat.id == chat_id]
+        assert update_ids == sorted(update_ids)
+    assert len(stream.acked) == 30
+
+
+async def test_failed_update_is_acked() -> None:
+    dp = FakeDispatcher(failing_update_id=2)
+    stream = FakeStream()
+    consumer = create_consumer(dp, stream)
+    await consumer.process(entries(5))
+    assert sorted(stream.acked) == sorted([f"{i}-0" for i in range(1, 6)])
+    assert consumer.processed == 5
+
+
+async def test_recover_reads_all_pending() -> None:
+    dp = FakeDispatcher()
+    pending = [(0, f"{i:03}-0", entry[2]) for i, entry in enumerate(entries(25))]
+    stream = PendingStream(pending)
+    consumer = UpdateConsumer(dp, Bot(token="42:fake"), stream, "worker-0", [0], batch_size=10)  # type: ignore
+    await consumer.recover()
+    assert sorted(stream.acked) == [i[1] for i in pending]
+    assert stream.reads == 4
+
+
+@pytest.mark.parametrize("chat_id, partitions, expected", [
+    (10, 8, 2),
+    (-1001234, 8, 6),
+    (None, 8, 0),
+])
+def test_partition_for(chat_id: Optional[int], partitions: int, expected: int) -> None:
+    assert partition_for(chat_id, partitions) == expected
+
+
+def test_every_partition_has_one_owner() -> None:
+    owners = [owned_partitions(i, 3, 8) for i in range(3)]
+    assert sorted(sum(owners, [])) == list(range(8))
+    with pytest.raises(ValueError):
+        owned_partitions(3, 3, 8)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from middlewares.update_scheduler import UpdateScheduler, SchedulerOverflowError
+
+
+def key(chat_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)
+
+
+async def test_updates_of_one_chat_are_processed_in_order() -> None:
+    scheduler = UpdateScheduler(max_concurrency=10, max_backlog=100)
+    processed = []
+
+    async def handle(number: int) -> None:
+        async with scheduler.lock(key(1)):
+            await asyncio.sleep(0.01 if number == 0 else 0)
+            processed.append(number)
+
+    await asyncio.gather(*[handle(i) for i in range(5)])
+    assert processed == [0, 1, 2, 3, 4]
+
+
+async def test_concurrency_is_limited() -> None:
+    scheduler = UpdateScheduler(max_concurrency=2, max_backlog=100)
+    max_in_flight = 0
+
+    async def handle(chat_id: int) -> None:
+        nonlocal max_in_flight
+        async with scheduler.lock(key(chat_id)):
+            max_in_flight = max(max_in_flight, scheduler.stats.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[handle(i) for i in range(10)])
+    assert max_in_flight == 2
+    assert scheduler.stats.processed == 10
+    assert scheduler.stats.waiting == 0
+    assert scheduler._locks == {}
+
+
+async def test_overflowed_updates_are_dropped() -> None:
+    scheduler = UpdateScheduler(max_concurrency=1, max_backlog=1)
+    release = asyncio.Event()
+
+    async def handle(chat_id: int) -> None:
+        async with scheduler.lock(key(chat_id)):
+            await release.wait()
+
+    first = asyncio.create_task(handle(1))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(handle(2))
+    await asyncio.sleep(0)
+    with pytest.raises(SchedulerOverflowError):
+        await handle(3)
+    release.set()
+    await asyncio.gather(first, second)
+    assert scheduler.stats.dropped == 1
+    assert scheduler.stats.processed == 2
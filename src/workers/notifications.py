@@ -1,18 +1,22 @@
 import logging
+from datetime import datetime, timedelta
 from typing import Any
 
 import emoji
-from aiogram import Bot
 from arq import cron
 
 from configs.config import RedisConfig, Settings
 from helpers import texthelper, staffhelper, tghelper
+from helpers.metrics import instrument_job, instrument_sqlalchemy, start_metrics_server
+from helpers.slow_queries import instrument_slow_queries
+from helpers.transaction_guard import install_transaction_guard
 from helpers.presentation import format_note
 from service.database_service import DatabaseService
 from service.orm_uow import OrmUnitOfWork
-from service.services import RecordService, VisitorService, ResourceService
+from service.services import RecordService, VisitorService, ResourceService, StaffService
 
 
+@instrument_job
 async def notify_admins_about_dismissed_users(ctx: Any) -> None:
     logging.basicConfig(
         level=logging.INFO,
@@ -21,19 +25,20 @@ async def notify_admins_about_dismissed_users(ctx: Any) -> None:
     uow = OrmUnitOfWork()
     db_service = DatabaseService(uow)
     visitor_service = VisitorService(uow)
+    staff_service = StaffService(uow, staffhelper.get_staff_client())
     await db_service.init()
-    get_result = await visitor_service.get_all()
-    current_visitors = get_result.unwrap()
-    dismissed_visitors_emails = await staffhelper.get_dismissed_users_emails(6)
-    dismissed_current_visitors = [i for i in current_visitors if i.email in dismissed_visitors_emails]
+    sync_result = await staff_service.sync_dismissed()
+    if sync_result.is_failure:
+        logging.error(f"Не удалось синхронизироваться со Стаффом, проверяем по старым данным: {sync_result.error}")
+    dismissed_current_visitors = (await visitor_service.get_dismissed()).unwrap()
     if len(dismissed_current_visitors) == 0:
         return
     for visitor in dismissed_current_visitors:
         logging.warning(f"Среди пользователей бота есть уволенный сотрудник: {repr(visitor)}")
     header = "Внимание, среди пользователей бота есть уволенные сотрудники:"
     visitors_text = f"{header}\r\n\r\n{tghelper.render_visitors(dismissed_current_visitors)}"
-    bot = Bot(token=Settings().token)
-    admins = [i for i in current_visitors if i.is_admin and i.chat_id]
+    bot = tghelper.create_bot()
+    admins = [i for i in (await visitor_service.get_admins()).unwrap() if i.chat_id]
     for admin in admins:
         await bot.send_message(chat_id=admin.chat_id, text=visitors_text)
         logging.info(f"Админа {repr(admin)} уведомили об уволенных сотрудниках")
@@ -57,6 +62,7 @@ def get_reminder(will_be_expired_after: int) -> str:
     return reminder
 
 
+@instrument_job
 async def remind_about_return_time(ctx: Any) -> None:
     logging.basicConfig(
         level=logging.INFO,
@@ -72,7 +78,7 @@ async def remind_about_return_time(ctx: Any) -> None:
 
     get_result = await record_service.get_expiring(1)
     expiring_records_dto = get_result.unwrap()
-    bot = Bot(token=Settings().token)
+    bot = tghelper.create_bot()
     for dto in expiring_records_dto:
         reminder = get_reminder(dto.days_before_expire)
         get_visitor_result = await visitor_service.get(dto.record.user_email)
@@ -86,17 +92,64 @@ async def remind_about_return_time(ctx: Any) -> None:
         logging.info(f"{repr(visitor)} уведомили о возврате устройства {repr(resource)}")
 
 
-async def delete_old_records(ctx: Any) -> None:
+@instrument_job
+async def archive_old_records(ctx: Any) -> None:
+    """Переносит старые завершенные записи в архив пачками, статистика архива - в меню /info"""
+    settings = Settings()
     uow = OrmUnitOfWork()
     db_service = DatabaseService(uow)
     await db_service.init()
     record_service = RecordService(uow)
-    await record_service.delete_old_finished_records(100)
-    # TODO: Прикрутить уведомления для админа
+    report = (await record_service.archive_finished_records(settings.archive_after_days,
+                                                            settings.archive_chunk_size)).unwrap()
+    logging.info(f"Архивация записей до {report.before:%d.%m.%Y}: перенесено {report.moved} "
+                 f"за {report.chunks} пачек и {report.seconds} с, осталось {report.left}")
+
+
+@instrument_job
+async def maintain_record_partitions(ctx: Any) -> None:
+    """Создает секции record на следующие месяцы и удаляет пустые заархивированные"""
+    settings = Settings()
+    uow = OrmUnitOfWork()
+    db_service = DatabaseService(uow)
+    await db_service.init()
+    drop_before = datetime.now() - timedelta(days=settings.archive_after_days)
+    created, dropped = await db_service.maintain_record_partitions(settings.record_partitions_ahead, drop_before)
+    logging.info(f"Секции record: создано {len(created)}, удалено {len(dropped)}")
+
+
+@instrument_job
+async def check_resource_state(ctx: Any) -> None:
+    """Сверяет колонки состояния устройств с активными записями и чинит расхождения"""
+    uow = OrmUnitOfWork()
+    db_service = DatabaseService(uow)
+    await db_service.init()
+    resource_ids = (await ResourceService(uow).check_state()).unwrap()
+    if resource_ids:
+        logging.warning(f"Состояние устройств разошлось с записями и пересчитано: {resource_ids}")
+
+
+async def startup(ctx: Any) -> None:
+    instrument_sqlalchemy()
+    settings = Settings()
+    if settings.slow_query_ms is not None:
+        instrument_slow_queries(settings.slow_query_ms / 1000, settings.slow_query_log_size,
+                                settings.slow_query_explain_rate)
+    if settings.transaction_guard is not None:
+        install_transaction_guard(settings.transaction_guard)
+    if settings.metrics_port:
+        ctx["metrics_runner"] = await start_metrics_server(settings.metrics_host, settings.metrics_port)
+
+
+async def shutdown(ctx: Any) -> None:
+    if "metrics_runner" in ctx:
+        await ctx["metrics_runner"].cleanup()
 
 
 class WorkerSettings:
     redis_settings = RedisConfig().get_pool_settings()
+    on_startup = startup
+    on_shutdown = shutdown
     cron_jobs = [
         cron(
             name="remind_about_return_time",
@@ -119,14 +172,30 @@ class WorkerSettings:
             minute=0
         ),
         cron(
-            name="delete_old_records",
-            coroutine=delete_old_records,
+            name="archive_old_records",
+            coroutine=archive_old_records,
             run_at_startup=False,
             keep_result=True,
             keep_result_forever=False,
-            month={1, 4, 7, 10},
-            day=1,
-            hour=6,
+            hour=3,
+            minute=0
+        ),
+        cron(
+            name="check_resource_state",
+            coroutine=check_resource_state,
+            run_at_startup=False,
+            keep_result=True,
+            keep_result_forever=False,
+            hour=5,
+            minute=0
+        ),
+        cron(
+            name="maintain_record_partitions",
+            coroutine=maintain_record_partitions,
+            run_at_startup=True,
+            keep_result=True,
+            keep_result_forever=False,
+            hour=4,
             minute=0
         )
     ]
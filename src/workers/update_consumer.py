@@ -0,0 +1,140 @@
+"""
+Воркер, который обрабатывает апдейты из Redis Streams (режим USE_UPDATE_STREAM).
+
+Каждый воркер читает свои партиции (номер партиции % количество воркеров == номер воркера),
+поэтому апдейты одного чата обрабатывает всегда один процесс и по порядку.
+Апдейт подтверждается (XACK) только после обработки. Если воркер упал - после перезапуска
+он сначала дообрабатывает свои неподтвержденные записи, а зависшие у других имен воркеров перехватывает.
+FSM хранится в RedisStorage, поэтому неважно, какой процесс обработает следующий шаг сценария.
+
+Запуск (из папки src):
+    python -m workers.update_consumer --worker-index 0 --workers 4
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from configs.config import RedisConfig, Settings
+from helpers import tghelper
+from helpers.metrics import start_metrics_server
+from helpers.update_stream import UpdateStream, StreamEntry, owned_partitions
+from service.database_service import DatabaseService
+from service.orm_uow import OrmUnitOfWork
+
+
+class UpdateConsumer:
+    """Читает апдейты своих партиций и скармливает их диспетчеру"""
+
+    def __init__(
+            self,
+            dp: Dispatcher,
+            bot: Bot,
+            stream: UpdateStream,
+            consumer_name: str,
+            partitions: List[int],
+            batch_size: int = 100,
+            block_ms: int = 5000,
+            claim_idle_ms: int = 60000
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.stream = stream
+        self.consumer_name = consumer_name
+        self.partitions = partitions
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.processed = 0
+
+    async def run(self) -> None:
+        await self.stream.ensure_groups(self.partitions)
+        await self.recover()
+        last_claim = time.monotonic()
+        while True:
+            entries = await self.stream.read(self.consumer_name, self.partitions, self.batch_size, self.block_ms)
+            await self.process(entries)
+            if time.monotonic() - last_claim > self.claim_idle_ms / 1000:
+                await self.reclaim()
+                last_claim = time.monotonic()
+
+    async def recover(self) -> None:
+        """После перезапуска дообрабатывает все свои неподтвержденные записи, пачками по batch_size"""
+        start_ids = {i: "0" for i in self.partitions}
+        while start_ids:
+            entries, start_ids = await self.stream.read_pending(self.consumer_name, start_ids, self.batch_size)
+            await self.process(entries)
+
+    async def reclaim(self) -> None:
+        """Дообрабатывает записи своих партиций, зависшие у упавших воркеров"""
+        for partition in self.partitions:
+            entries = await self.stream.claim_stale(self.consumer_name, partition, self.claim_idle_ms, self.batch_size)
+            if entries:
+                logging.warning(f"Воркер {self.consumer_name} перехватил {len(entries)} зависших апдейтов")
+                await self.process(entries)
+
+    async def process(self, entries: List[StreamEntry]) -> None:
+        """Обрабатывает пачку: разные чаты - параллельно, апдейты одного чата - по порядку"""
+        by_chat: Dict[Optional[int], List[tuple[StreamEntry, Update]]] = defaultdict(list)
+        for entry in entries:
+            update = Update.model_validate_json(entry[2], context={"bot": self.bot})
+            context = UserContextMiddleware.resolve_event_context(update)
+            by_chat[context.chat_id or context.user_id].append((entry, update))
+        await asyncio.gather(*[self._process_chat(i) for i in by_chat.values()])
+
+    async def _process_chat(self, items: List[tuple[StreamEntry, Update]]) -> None:
+        for (partition, entry_id, _), update in items:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                # Апдейт все равно подтверждаем, иначе он будет бесконечно переобрабатываться
+                logging.error(f"Не удалось обработать апдейт {update.update_id}", exc_info=True)
+            await self.stream.ack(partition, entry_id)
+            self.processed += 1
+
+
+async def main(worker_index: int, workers: int) -> None:
+    # Импорт здесь, чтобы модуль можно было импортировать без сборки всех роутеров
+    from main import build_dispatcher
+
+    settings = Settings()
+    redis_connection_str = RedisConfig().get_connection_str()
+    await DatabaseService(OrmUnitOfWork()).init()
+    partitions = owned_partitions(worker_index, workers, settings.update_stream_partitions)
+    consumer = UpdateConsumer(
+        dp=build_dispatcher(settings, redis_connection_str),
+        bot=tghelper.create_bot(),
+        stream=UpdateStream.from_url(redis_connection_str, settings.update_stream_partitions),
+        consumer_name=f"worker-{worker_index}",
+        partitions=partitions
+    )
+    logging.info(f"Воркер {consumer.consumer_name} читает партиции {partitions}")
+    if settings.metrics_port:
+        # Воркеров на хосте может быть несколько - каждому свой порт
+        await start_metrics_server(settings.metrics_host, settings.metrics_port + worker_index)
+    await consumer.dp.emit_startup(bot=consumer.bot)
+    try:
+        await consumer.run()
+    finally:
+        await consumer.dp.emit_shutdown(bot=consumer.bot)
+        await consumer.stream.close()
+        await consumer.bot.session.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description="Обработчик апдейтов из Redis Streams")
+    parser.add_argument("--worker-index", type=int, required=True)
+    parser.add_argument("--workers", type=int, required=True)
+    args = parser.parse_args()
+    asyncio.run(main(args.worker_index, args.workers))